@@ -0,0 +1,5 @@
+from macronizer import app
+from macronizer_cores.food_item_api.asgi import FoodSearchASGI
+
+# ASGI entry point: /api/food/search on asyncio, every other route in the Flask app
+application = FoodSearchASGI(app)
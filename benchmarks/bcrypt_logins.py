@@ -0,0 +1,52 @@
+'''
+Benchmark of bcrypt password checks at each work factor
+----------------------------------------------------------------
+- Reports logins per second per core (one thread) and with the hashing
+  pool of PASSWORD_HASH_WORKERS threads, to pick BCRYPT_LOG_ROUNDS
+
+Usage
+--------------
+python benchmarks/bcrypt_logins.py [--costs 10 11 12 13] [--seconds 2] [--workers 2]
+'''
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+def checks_per_second(pw_hash, seconds, workers=1) -> float:
+  '''Number of bcrypt.checkpw calls completed per second'''
+
+  def run(deadline):
+    count = 0
+    while time.perf_counter() < deadline:
+      bcrypt.checkpw(b"correct horse battery staple", pw_hash)
+      count += 1
+    return count
+
+  started = time.perf_counter()
+  deadline = started + seconds
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    total = sum(pool.map(run, [deadline] * workers))
+  return total / (time.perf_counter() - started)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--costs", type=int, nargs="+", default=[10, 11, 12, 13])
+  parser.add_argument("--seconds", type=float, default=2.0)
+  parser.add_argument("--workers", type=int, default=2)
+  args = parser.parse_args()
+
+  print(f"{'cost':>4} {'ms/login':>9} {'logins/s/core':>14} {f'logins/s ({args.workers} threads)':>22}")
+  for cost in args.costs:
+    pw_hash = bcrypt.hashpw(b"correct horse battery staple", bcrypt.gensalt(cost))
+    single = checks_per_second(pw_hash, args.seconds)
+    pooled = checks_per_second(pw_hash, args.seconds, args.workers)
+    print(f"{cost:>4} {1000 / single:>9.1f} {single:>14.1f} {pooled:>22.1f}")
+
+
+if __name__ == '__main__':
+  main()
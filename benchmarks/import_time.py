@@ -0,0 +1,102 @@
+'''
+Cold start budget: import and create_app time of a production worker
+----------------------------------------------------------------
+- Runs `import macronizer` (FLASK_ENV=production, create_app included) in fresh
+  interpreters with `python -X importtime` and reports the median time and
+  the slowest imports
+- Exits with status 1 when the median time is over
+  --budget-ms, so it can run in CI next to the tests
+
+Usage
+--------------
+python benchmarks/import_time.py [--repeat 5] [--budget-ms 800] [--top 15] [--json]
+'''
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# wall time of `import macronizer` (create_app included), printed by the child interpreter
+CHILD = """
+import time
+started = time.perf_counter()
+import macronizer
+print("total_ms", (time.perf_counter() - started) * 1000)
+"""
+IMPORT_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( +)(\S+)$")
+
+
+def startup_modules() -> set:
+  '''Modules imported by the interpreter itself (site, encodings, .pth files)'''
+
+  result = subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"], capture_output=True, text=True)
+  return {match.group(4) for match in map(IMPORT_LINE.match, result.stderr.splitlines()) if match}
+
+
+def measure() -> dict:
+  '''Import a production app in a fresh interpreter'''
+
+  env = dict(os.environ, FLASK_ENV="production", PYTHONDONTWRITEBYTECODE="")
+  env.setdefault("SECRET_KEY", "import-time-budget")
+  env.setdefault("DATABASE_URL", "postgresql://localhost/macronizer")
+  result = subprocess.run(
+    [sys.executable, "-X", "importtime", "-c", CHILD],
+    cwd=ROOT, env=env, capture_output=True, text=True, check=True
+  )
+
+  imports = []
+  for line in result.stderr.splitlines():
+    match = IMPORT_LINE.match(line)
+    if match:
+      # depth 1 = imported by `import macronizer` or deeper
+      depth = (len(match.group(3)) - 1) // 2
+      imports.append((match.group(4), int(match.group(2)) / 1000, depth))
+  total = float(result.stdout.split("total_ms")[-1])
+  return {"total_ms": total, "imports": imports}
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--repeat", type=int, default=5)
+  parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", 800)))
+  parser.add_argument("--top", type=int, default=15)
+  parser.add_argument("--json", action="store_true", help="print the report as JSON")
+  args = parser.parse_args()
+
+  startup = startup_modules()
+  runs = [measure() for _ in range(args.repeat)]
+  total = statistics.median(run["total_ms"] for run in runs)
+
+  # slowest imports of the median run (cumulative ms, top two levels only)
+  median_run = sorted(runs, key=lambda run: run["total_ms"])[len(runs) // 2]
+  slowest = sorted(
+    ((name, ms) for name, ms, depth in median_run["imports"] if depth <= 2 and name not in startup),
+    key=lambda item: item[1],
+    reverse=True
+  )[:args.top]
+
+  report = {
+    "total_ms": round(total, 1),
+    "budget_ms": args.budget_ms,
+    "within_budget": total <= args.budget_ms,
+    "runs_ms": [round(run["total_ms"], 1) for run in runs],
+    "slowest_imports_ms": {name: round(ms, 1) for name, ms in slowest}
+  }
+  if args.json:
+    print(json.dumps(report, indent=2))
+  else:
+    print(f"import macronizer (production): {total:.1f} ms median of {args.repeat} (budget {args.budget_ms:.0f} ms)")
+    for name, ms in slowest:
+      print(f"  {ms:>8.1f} ms  {name}")
+
+  sys.exit(0 if report["within_budget"] else 1)
+
+
+if __name__ == '__main__':
+  main()
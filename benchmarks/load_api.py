@@ -0,0 +1,409 @@
+'''
+Load benchmark of the HTTP API with a stubbed nutrition upstream
+----------------------------------------------------------------
+- Boots create_app on a local threaded server against BENCH_DB_URL and a local
+  stand-in for the CalorieNinjas API (configurable latency and error rate)
+- Virtual users run a weighted mix of /api/log/search, /api/log/new,
+  /api/log/update, /api/food/search and login for a fixed time
+- Prints throughput and p50/p95/p99 latency per endpoint as JSON, so runs can
+  be compared over time (--output writes it to a file)
+- With --target the requests go to an already running server instead
+  (e.g. gunicorn with NUTRITION_API_URL pointed at `--stub-only`)
+
+Usage
+--------------
+BENCH_DB_URL=postgresql:///macronizer_bench python benchmarks/load_api.py \
+  [--duration 30] [--concurrency 16] [--users 20] [--mix search=45,new=15,update=10,food=25,login=5] \
+  [--upstream-latency-ms 150] [--upstream-error-rate 0.02] [--seed 1] [--output results.json]
+(a SQLite file in a temporary directory is used when BENCH_DB_URL is not set)
+'''
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = "benchmark-password"
+FOODS = [
+  "chicken breast", "white rice", "broccoli", "eggs", "oatmeal", "banana", "salmon",
+  "greek yogurt", "almonds", "apple", "sweet potato", "black beans", "avocado", "toast",
+  "milk", "cheddar cheese", "spinach", "pasta", "ground beef", "orange juice"
+]
+UNITS = ["", "1 cup ", "2 ", "100g ", "1 slice of ", "200g "]
+DEFAULT_MIX = "search=45,new=15,update=10,food=25,login=5"
+
+
+# SECTION - stub upstream
+class StubNutritionAPI(object):
+  '''
+  Local stand-in for the nutrition API
+  ----------------------------------------------------------------
+  - Answers after latency_ms (+/- jitter_ms) with one item per ingredient of the query
+  - error_rate of the calls get a 503 (retried by the clients)
+  '''
+
+  def __init__(self, latency_ms=150, jitter_ms=50, error_rate=0.0, seed=1, port=0):
+    self.latency = latency_ms / 1000
+    self.jitter = jitter_ms / 1000
+    self.error_rate = error_rate
+    self.random = random.Random(seed)
+    self.calls = 0
+    self.errors = 0
+    self._lock = Lock()
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def do_GET(self):
+        with stub._lock:
+          stub.calls += 1
+          delay = max(0.0, stub.latency + stub.random.uniform(-stub.jitter, stub.jitter))
+          failed = stub.random.random() < stub.error_rate
+          if failed:
+            stub.errors += 1
+        time.sleep(delay)
+
+        if failed:
+          status, body = 503, b'{"error": "injected"}'
+        else:
+          query = parse_qs(urlparse(self.path).query).get("query", [""])[0]
+          status, body = 200, json.dumps({"items": stub.items(query)}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    self.server.daemon_threads = True
+    self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/nutrition"
+
+  @staticmethod
+  def items(query) -> list:
+    '''Deterministic nutrients for every ingredient of a query'''
+
+    items = []
+    for part in query.replace(" and ", ",").split(","):
+      name = part.strip()
+      if not name:
+        continue
+      seed = sum(map(ord, name))
+      items.append({
+        "name": name, "calories": 50.0 + seed % 400, "serving_size_g": 100.0,
+        "fat_total_g": seed % 30 / 2, "fat_saturated_g": seed % 10 / 2, "protein_g": seed % 40 / 2,
+        "sodium_mg": seed % 500, "potassium_mg": seed % 600, "cholesterol_mg": seed % 200,
+        "carbohydrates_total_g": seed % 80 / 2, "fiber_g": seed % 12 / 2, "sugar_g": seed % 20 / 2
+      })
+    return items
+
+  def start(self):
+    Thread(target=self.server.serve_forever, daemon=True).start()
+    return self
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+# SECTION - app under test
+def boot_app(db_url, upstream_url, bcrypt_rounds, users):
+  '''
+  Create the app against db_url, seed the benchmark users and serve it on a
+  local threaded server
+
+  Returns
+  --------------
+  (base url, server)
+  '''
+
+  from werkzeug.serving import make_server, WSGIRequestHandler
+  from config import Config
+  from macronizer_cores import create_app, db
+  from macronizer_cores.models import User
+  from macronizer_cores.auth.hashing import password_hasher
+
+  config = type("BenchConfig", (Config,), {
+    "DEBUG": False,
+    "SQLALCHEMY_DATABASE_URI": db_url,
+    "SECRET_KEY": "benchmark-secret-key",
+    # the load generator posts the login form without a CSRF token
+    "WTF_CSRF_ENABLED": False,
+    "NUTRITION_API_URL": upstream_url,
+    "NUTRITION_API_KEY": "benchmark",
+    "BCRYPT_LOG_ROUNDS": bcrypt_rounds
+  })
+  app = create_app(config)
+
+  with app.app_context():
+    db.drop_all()
+    db.create_all()
+    # every user has the same password, hash it once
+    pw_hash = password_hasher.hash(PASSWORD)
+    db.session.add_all([
+      User(name=f"Bench {n}", email=f"bench{n}@example.com", username=f"bench{n}", password=pw_hash)
+      for n in range(users)
+    ])
+    db.session.commit()
+
+  class QuietHandler(WSGIRequestHandler):
+    # no access log line per request (skews the timings)
+    def log_request(self, *args):
+      pass
+
+  server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+  Thread(target=server.serve_forever, daemon=True).start()
+  return f"http://127.0.0.1:{server.server_port}", server
+
+
+# SECTION - load generator
+def parse_mix(mix) -> dict:
+  '''"search=45,new=15" -> {"search": 45, "new": 15}'''
+
+  weights = {}
+  for part in mix.split(","):
+    name, _, weight = part.partition("=")
+    if name.strip() not in VirtualUser.OPERATIONS:
+      raise SystemExit(f"Unknown operation in --mix: {name!r} (use {', '.join(VirtualUser.OPERATIONS)})")
+    weights[name.strip()] = float(weight or 1)
+  return weights
+
+
+def food_query(rng) -> str:
+  '''Search query of one to three ingredients'''
+
+  foods = rng.sample(FOODS, rng.randint(1, 3))
+  return " and ".join(rng.choice(UNITS) + food for food in foods)
+
+
+class VirtualUser(object):
+  '''One logged-in client issuing weighted random requests'''
+
+  OPERATIONS = ("search", "new", "update", "food", "login")
+
+  def __init__(self, base_url, username, rng, days):
+    self.base_url = base_url
+    self.username = username
+    self.rng = rng
+    self.days = days
+    self.item_ids = []
+    self.http = requests.Session()
+
+  def random_date(self) -> str:
+    return (date.today() - timedelta(days=self.rng.randrange(self.days))).isoformat()
+
+  def login(self, http=None):
+    http = http or self.http
+    res = http.post(
+      f"{self.base_url}/login",
+      data={"username": self.username, "password": PASSWORD},
+      allow_redirects=False
+    )
+    # a successful login redirects to the dashboard, a failed one renders the form again
+    if res.status_code == 302:
+      return 200
+    return 401 if res.status_code == 200 else res.status_code
+
+  def search(self):
+    return self.http.get(f"{self.base_url}/api/log/search", params={"date": self.random_date()}).status_code
+
+  def new(self):
+    item = StubNutritionAPI.items(self.rng.choice(FOODS))[0]
+    food_item = {
+      "name": item["name"], "calories": item["calories"], "servingSize": item["serving_size_g"],
+      "totalFat": item["fat_total_g"], "saturatedFat": item["fat_saturated_g"], "protein": item["protein_g"],
+      "sodium": item["sodium_mg"], "potassium": item["potassium_mg"], "cholesterol": item["cholesterol_mg"],
+      "carbohydrate": item["carbohydrates_total_g"], "fiber": item["fiber_g"], "sugar": item["sugar_g"]
+    }
+    res = self.http.post(f"{self.base_url}/api/log/new", json={
+      "meal_no": self.rng.randint(1, 5),
+      "food_items": [food_item],
+      "date_string": self.random_date()
+    })
+    if res.status_code == 201:
+      self.item_ids.append(res.json()["log"]["food_items"][-1]["id"])
+    return res.status_code
+
+  def update(self):
+    if not self.item_ids:
+      return None
+    res = self.http.patch(f"{self.base_url}/api/log/update", json={
+      "meal_no": self.rng.randint(1, 5),
+      "updated_item_id": self.rng.choice(self.item_ids),
+      "date_string": self.random_date()
+    })
+    return res.status_code
+
+  def food(self):
+    return self.http.get(f"{self.base_url}/api/food/search", params={"queryString": food_query(self.rng)}).status_code
+
+  def login_fresh(self):
+    # a new client (no session cookie), as a user signing in on another device
+    with requests.Session() as http:
+      return self.login(http)
+
+
+def run_load(base_url, usernames, weights, duration, concurrency, seed, days) -> dict:
+  '''
+  Run the mix with `concurrency` virtual users for `duration` seconds
+
+  Returns
+  --------------
+  {operation: [(latency seconds, status), ...]}
+  '''
+
+  names = list(weights)
+  weight_list = [weights[name] for name in names]
+  samples = {name: [] for name in names}
+  lock = Lock()
+  deadline = time.perf_counter() + duration
+
+  def worker(index):
+    rng = random.Random(seed * 1000 + index)
+    user = VirtualUser(base_url, usernames[index % len(usernames)], rng, days)
+    user.login()
+    local = {name: [] for name in names}
+    while time.perf_counter() < deadline:
+      name = rng.choices(names, weights=weight_list)[0]
+      operation = user.login_fresh if name == "login" else getattr(user, name)
+      started = time.perf_counter()
+      try:
+        status = operation()
+      except requests.RequestException:
+        status = "error"
+      if status is None:
+        continue
+      local[name].append((time.perf_counter() - started, status))
+    with lock:
+      for name in names:
+        samples[name].extend(local[name])
+
+  threads = [Thread(target=worker, args=(i,)) for i in range(concurrency)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return samples
+
+
+# SECTION - report
+def percentile(sorted_values, pct) -> float:
+  '''Nearest-rank percentile of a sorted list'''
+
+  if not sorted_values:
+    return 0.0
+  rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+  return sorted_values[rank - 1]
+
+
+def summarize(samples, duration) -> dict:
+  '''Throughput and latency (ms) of a list of (latency, status) samples'''
+
+  latencies = sorted(latency for latency, _ in samples)
+  errors = sum(1 for _, status in samples if status == "error" or status >= 400)
+  return {
+    "requests": len(samples),
+    "errors": errors,
+    "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+    "throughput_rps": round(len(samples) / duration, 2),
+    "latency_ms": {
+      "mean": round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+      "p50": round(1000 * percentile(latencies, 50), 2),
+      "p95": round(1000 * percentile(latencies, 95), 2),
+      "p99": round(1000 * percentile(latencies, 99), 2),
+      "max": round(1000 * latencies[-1], 2) if latencies else 0.0
+    }
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+  parser.add_argument("--warmup", type=float, default=3.0, help="seconds of load not measured")
+  parser.add_argument("--concurrency", type=int, default=16, help="virtual users")
+  parser.add_argument("--users", type=int, default=20, help="accounts created in the db")
+  parser.add_argument("--days", type=int, default=30, help="span of the logged dates")
+  parser.add_argument("--mix", default=DEFAULT_MIX, help="operation weights")
+  parser.add_argument("--upstream-latency-ms", type=float, default=150.0)
+  parser.add_argument("--upstream-jitter-ms", type=float, default=50.0)
+  parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+  parser.add_argument("--bcrypt-rounds", type=int, default=12)
+  parser.add_argument("--seed", type=int, default=1)
+  parser.add_argument("--target", help="base url of a running server (its db must have bench0..N users)")
+  parser.add_argument("--stub-only", type=int, metavar="PORT", help="only serve the stub upstream on PORT")
+  parser.add_argument("--output", help="write the JSON report to this file")
+  args = parser.parse_args()
+  weights = parse_mix(args.mix)
+
+  if args.stub_only is not None:
+    stub = StubNutritionAPI(args.upstream_latency_ms, args.upstream_jitter_ms, args.upstream_error_rate, args.seed, args.stub_only)
+    print(f"Stub nutrition API on {stub.url}", file=sys.stderr)
+    stub.server.serve_forever()
+    return
+
+  stub = StubNutritionAPI(args.upstream_latency_ms, args.upstream_jitter_ms, args.upstream_error_rate, args.seed).start()
+  db_url = os.getenv("BENCH_DB_URL") or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+  server = None
+  if args.target:
+    base_url = args.target.rstrip("/")
+  else:
+    base_url, server = boot_app(db_url, stub.url, args.bcrypt_rounds, args.users)
+  usernames = [f"bench{n}" for n in range(args.users)]
+
+  try:
+    if args.warmup > 0:
+      run_load(base_url, usernames, weights, args.warmup, args.concurrency, args.seed + 1, args.days)
+    upstream_calls, upstream_errors = stub.calls, stub.errors
+    started = time.perf_counter()
+    samples = run_load(base_url, usernames, weights, args.duration, args.concurrency, args.seed, args.days)
+    elapsed = time.perf_counter() - started
+  finally:
+    if server is not None:
+      server.shutdown()
+    stub.close()
+
+  report = {
+    "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    "environment": {"python": platform.python_version(), "platform": platform.platform()},
+    "config": {
+      "target": args.target or "in-process",
+      "database": urlparse(db_url).scheme if not args.target else None,
+      "duration_s": args.duration,
+      "concurrency": args.concurrency,
+      "users": args.users,
+      "mix": weights,
+      "upstream_latency_ms": args.upstream_latency_ms,
+      "upstream_error_rate": args.upstream_error_rate,
+      "bcrypt_rounds": args.bcrypt_rounds,
+      "seed": args.seed
+    },
+    "total": summarize([sample for values in samples.values() for sample in values], elapsed),
+    "endpoints": {name: summarize(values, elapsed) for name, values in samples.items()},
+    "upstream": {"calls": stub.calls - upstream_calls, "errors_injected": stub.errors - upstream_errors}
+  }
+
+  output = json.dumps(report, indent=2)
+  if args.output:
+    with open(args.output, "w") as f:
+      f.write(output + "\n")
+  print(output)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,95 @@
+'''
+Micro-benchmark of the log read serialization paths
+----------------------------------------------------------------
+- orm: Log.query + selectin food items + Log.serialize() + jsonify()
+- rows: Core column tuples + LogRecord.serialize() + json_response()
+
+Usage
+--------------
+BENCH_DB_URL=postgresql:///macronizer_bench python benchmarks/serialize_logs.py [--days 60] [--items 6] [--repeat 20]
+(an in-memory SQLite db is used when BENCH_DB_URL is not set)
+'''
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify
+from config import TestConfig
+from macronizer_cores import create_app, db
+from macronizer_cores.models import User, Log, FoodItem
+from macronizer_cores.log_api.utils import fetch_log_records
+from macronizer_cores.utils import json_response
+
+
+class BenchConfig(TestConfig):
+  SQLALCHEMY_DATABASE_URI = os.getenv('BENCH_DB_URL', 'sqlite://')
+  SQLALCHEMY_ECHO = False
+
+
+def seed(days, items_per_meal) -> User:
+  '''Create a user with 5 meals a day and items_per_meal items per meal'''
+
+  db.drop_all()
+  db.create_all()
+  user = User(name="Bench", email="bench@example.com", username="bench", password="hashed")
+  db.session.add(user)
+  db.session.commit()
+
+  first_day = date(2022, 1, 1)
+  for day in range(days):
+    for meal_no in range(1, 6):
+      log = Log(meal_no=meal_no, date=first_day + timedelta(days=day), user_id=user.id)
+      db.session.add(log)
+      db.session.flush()
+      db.session.add_all([
+        FoodItem(name=f"food {i}", sugar_gram=1, fiber_gram=2, serving_size_gram=100, sodium_mg=3,
+                 potassium_mg=4, fat_saturation_gram=5, fat_total_gram=6, calories=7, cholesterol_mg=8,
+                 protein_gram=9, carbohydrate_gram=10, log_id=log.id)
+        for i in range(items_per_meal)
+      ])
+  db.session.commit()
+  return user
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--days", type=int, default=60)
+  parser.add_argument("--items", type=int, default=6)
+  parser.add_argument("--repeat", type=int, default=20)
+  args = parser.parse_args()
+
+  app = create_app(BenchConfig)
+  with app.app_context():
+    user = seed(args.days, args.items)
+    user_id = user.id
+    start = date(2022, 1, 1)
+    end = start + timedelta(days=args.days - 1)
+
+    def orm_path():
+      meals = Log.query\
+                .filter(Log.user_id == user_id, Log.date.between(start, end))\
+                .order_by(Log.date, Log.meal_no)\
+                .all()
+      body = jsonify(meals_logged=[meal.serialize() for meal in meals]).get_data()
+      db.session.expunge_all()
+      return body
+
+    def rows_path():
+      meals = fetch_log_records(user_id, start, end)
+      return json_response({"meals_logged": [meal.serialize() for meal in meals]}).get_data()
+
+    with app.test_request_context():
+      assert len(orm_path()) > 0 and len(rows_path()) > 0
+      print(f"{args.days * 5} logs, {args.days * 5 * args.items} food items, best of {args.repeat} runs")
+      for name, path in (("orm", orm_path), ("rows", rows_path)):
+        best = min(timeit.repeat(path, number=1, repeat=args.repeat))
+        print(f"{name:>5}: {best * 1000:8.2f} ms")
+
+
+if __name__ == '__main__':
+  main()
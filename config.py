@@ -1,4 +1,3 @@
-from distutils.debug import DEBUG
 import os
 from dotenv import load_dotenv
 
@@ -13,6 +12,34 @@ CALORIES_NINJA_API_KEY = os.getenv('CALORIES_NINJA_API_KEY')
 FLASK_ENV = os.getenv('FLASK_ENV')
 
 
+def engine_options(uri) -> dict:
+  '''
+  SQLAlchemy engine options of a db url from env variables
+  (pool, timeouts; only PostgreSQL urls get them, SQLite keeps its defaults)
+  '''
+
+  if not uri or not uri.startswith("postgresql"):
+    return {}
+
+  return {
+    "pool_size": int(os.getenv('DB_POOL_SIZE', 5)),
+    "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', 5)),
+    # seconds to wait for a free connection before failing the request
+    "pool_timeout": float(os.getenv('DB_POOL_TIMEOUT', 5)),
+    # reconnect before the server/proxy drops idle connections
+    "pool_recycle": int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    # test connections on checkout (survives db restarts)
+    "pool_pre_ping": os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+    "connect_args": {
+      "connect_timeout": int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+      "options": "-c statement_timeout={} -c lock_timeout={}".format(
+        int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 10000)),
+        int(os.getenv('DB_LOCK_TIMEOUT_MS', 3000))
+      )
+    }
+  }
+
+
 # SECTION - config classes
 class Config(object):
   '''
@@ -22,6 +49,78 @@ class Config(object):
   SECRET_KEY = os.getenv('SECRET_KEY')
   SQLALCHEMY_TRACK_MODIFICATIONS = False
   SQLALCHEMY_ECHO = False
+  # nutrition lookup cache config (sizes in entries, ttl in seconds)
+  NUTRITION_CACHE_SIZE = int(os.getenv('NUTRITION_CACHE_SIZE', 4096))
+  NUTRITION_CACHE_TTL = int(os.getenv('NUTRITION_CACHE_TTL', 6 * 60 * 60))
+  NUTRITION_CACHE_DB_TTL = int(os.getenv('NUTRITION_CACHE_DB_TTL', 30 * 24 * 60 * 60))
+  # nutrition API client config (timeouts and backoff in seconds)
+  NUTRITION_API_URL = os.getenv('NUTRITION_API_URL', 'https://api.calorieninjas.com/v1/nutrition')
+  NUTRITION_API_KEY = CALORIES_NINJA_API_KEY
+  NUTRITION_API_CONNECT_TIMEOUT = float(os.getenv('NUTRITION_API_CONNECT_TIMEOUT', 3.05))
+  NUTRITION_API_READ_TIMEOUT = float(os.getenv('NUTRITION_API_READ_TIMEOUT', 5))
+  NUTRITION_API_RETRIES = int(os.getenv('NUTRITION_API_RETRIES', 2))
+  NUTRITION_API_BACKOFF = float(os.getenv('NUTRITION_API_BACKOFF', 0.3))
+  NUTRITION_API_POOL_SIZE = int(os.getenv('NUTRITION_API_POOL_SIZE', 10))
+  # max seconds a search waits for an identical in-flight API call
+  NUTRITION_API_COALESCE_TIMEOUT = float(os.getenv('NUTRITION_API_COALESCE_TIMEOUT', 15))
+  # asyncio food search (asgi.py): max open API connections per process,
+  # threads for the cache/catalog lookups and threads running the Flask app
+  NUTRITION_API_ASYNC_POOL_SIZE = int(os.getenv('NUTRITION_API_ASYNC_POOL_SIZE', 500))
+  ASYNC_SEARCH_THREADS = int(os.getenv('ASYNC_SEARCH_THREADS', 8))
+  ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 10))
+  # max request body (bytes); under asgi.py bodies are held in memory before Flask runs
+  MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
+  # local food catalog config (minimum trigram similarity to answer a search)
+  FOOD_CATALOG_MATCH_THRESHOLD = float(os.getenv('FOOD_CATALOG_MATCH_THRESHOLD', 0.5))
+  FOOD_CATALOG_MAX_CANDIDATES = int(os.getenv('FOOD_CATALOG_MAX_CANDIDATES', 20))
+  # max number of days returned by /api/log/range
+  LOG_RANGE_MAX_DAYS = int(os.getenv('LOG_RANGE_MAX_DAYS', 366))
+  # max number of days returned by /api/summary
+  SUMMARY_MAX_DAYS = int(os.getenv('SUMMARY_MAX_DAYS', 3660))
+  # food items written per transaction by /api/log/import
+  LOG_IMPORT_CHUNK_SIZE = int(os.getenv('LOG_IMPORT_CHUNK_SIZE', 5000))
+  # max number of operations accepted by /api/log/batch
+  LOG_BATCH_MAX_OPERATIONS = int(os.getenv('LOG_BATCH_MAX_OPERATIONS', 200))
+  # fingerprinted static assets (`flask assets build`)
+  ASSETS_OUTPUT_DIR = os.getenv('ASSETS_OUTPUT_DIR', os.path.join(basedir, 'macronizer_cores', 'static', 'dist'))
+  ASSETS_MAX_AGE = int(os.getenv('ASSETS_MAX_AGE', 31536000))
+  # bcrypt work factor and bounded hashing pool (per process)
+  BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+  PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+  PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 8))
+  PASSWORD_HASH_TIMEOUT = int(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+  # per-worker cache of logged-in users (flask_login user loader)
+  USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 1024))
+  USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 5 * 60))
+  USER_SESSION_SNAPSHOT = os.getenv('USER_SESSION_SNAPSHOT', 'false').lower() == 'true'
+  # response compression (gzip, brotli when installed)
+  COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true').lower() == 'true'
+  COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+  COMPRESS_BR_LEVEL = int(os.getenv('COMPRESS_BR_LEVEL', 4))
+  COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+  COMPRESS_MIMETYPES = [
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'application/javascript',
+    'text/javascript'
+  ]
+  # request / SQL / upstream metrics at /metrics (METRICS_DIR shares them across workers,
+  # gunicorn.conf.py creates one when unset; without METRICS_TOKEN only local scrapes are answered)
+  METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+  METRICS_DIR = os.getenv('METRICS_DIR')
+  METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+  METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+  # slow-query log, N+1 detector and per-request query budget
+  QUERY_DIAGNOSTICS = os.getenv('QUERY_DIAGNOSTICS', 'false').lower() == 'true'
+  SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+  SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+  N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+  QUERY_BUDGET = int(os.getenv('QUERY_BUDGET')) if os.getenv('QUERY_BUDGET') else None
+  QUERY_BUDGET_RAISE = False
 
 
 class ProductionConfig(Config):
@@ -35,6 +134,7 @@ class ProductionConfig(Config):
   if uri and uri.startswith("postgres://"):
       uri = uri.replace("postgres://", "postgresql://", 1)
   SQLALCHEMY_DATABASE_URI = uri
+  SQLALCHEMY_ENGINE_OPTIONS = engine_options(uri)
 
   
 
@@ -45,10 +145,12 @@ class DevelopmentConfig(Config):
   '''
 
   DEBUG = True
-  # Flask debugtoolbar config
+  # Flask debugtoolbar config (only loaded when enabled)
+  DEBUG_TB_ENABLED = os.getenv('DEBUG_TB_ENABLED', 'true').lower() == 'true'
   DEBUG_TB_INTERCEPT_REDIRECTS = False
   # db config
   SQLALCHEMY_DATABASE_URI = os.getenv("DEV_DB_URL")
+  SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
 
 
 class TestConfig(Config):
@@ -63,3 +165,11 @@ class TestConfig(Config):
   LOGIN_DISABLED = True
   SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DB_URL')
   WTF_CSRF_ENABLED = False
+  # sign test client sessions even without a .env
+  SECRET_KEY = os.getenv('SECRET_KEY', 'test-secret-key')
+  # cheap hashes for tests
+  BCRYPT_LOG_ROUNDS = 4
+  # fail a test when a request runs more statements than its budget
+  QUERY_DIAGNOSTICS = True
+  QUERY_BUDGET = 20
+  QUERY_BUDGET_RAISE = True
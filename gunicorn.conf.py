@@ -0,0 +1,90 @@
+'''
+gunicorn settings (read automatically from the working directory)
+----------------------------------------------------------------
+- GUNICORN_PRELOAD=true imports the app once in the master and forks the
+  workers from it: faster worker boots and recycles, shared memory pages
+- DB connections are never shared across the fork: the master drops its
+  pool before each fork and the pid check of db_pool discards any inherited one
+- /metrics adds up the files every worker writes to METRICS_DIR; without
+  one a temporary directory is created here (read by the app config, so it
+  has to be in the environment before the app is imported) and removed on exit
+- The per-worker metric files of a previous run are removed on start, those
+  of an exited worker are merged into one file so its counts are kept
+'''
+
+import os
+import shutil
+import tempfile
+
+
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+preload_app = os.getenv("GUNICORN_PRELOAD", "false").lower() == "true"
+# recycle workers now and then (memory growth), spread out so they don't all restart at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+
+# set once: the config file is read again on reload (HUP) and the workers inherit it
+if not os.getenv("METRICS_DIR"):
+    os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="macronizer-metrics-")
+    os.environ["MACRONIZER_METRICS_TMPDIR"] = os.environ["METRICS_DIR"]
+
+
+def on_starting(server):
+    '''Remove the metric files of the workers of the previous run'''
+
+    metrics_dir = os.getenv("METRICS_DIR")
+    if os.path.isdir(metrics_dir):
+        from macronizer_cores.metrics.utils import clear_metrics_dir
+        clear_metrics_dir(metrics_dir)
+
+
+def on_exit(server):
+    '''Remove the temporary metrics directory'''
+
+    tmpdir = os.getenv("MACRONIZER_METRICS_TMPDIR")
+    if tmpdir:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def pre_fork(server, worker):
+    '''
+    Preloaded app only: close the connections the master opened (create_app,
+    imports) so that no worker inherits a socket another process also uses
+    '''
+
+    if not server.cfg.preload_app:
+        return
+
+    from macronizer_cores import db
+    flask_app = server.app.wsgi().flask_app
+    with flask_app.app_context():
+        db.engine.dispose()
+    # modules imported on first use, loaded here so every worker inherits them
+    import macronizer_cores.auth.forms
+
+
+def post_fork(server, worker):
+    '''Start the worker with empty counters (not the master's)'''
+
+    from macronizer_cores.db_pool import pool_metrics
+    from macronizer_cores.metrics.utils import metrics
+    pool_metrics.reset()
+    metrics.reset()
+
+
+def worker_exit(server, worker):
+    '''Write the last samples of the worker before it exits'''
+
+    from macronizer_cores.metrics.utils import metrics
+    try:
+        metrics.flush()
+    except OSError:
+        pass
+
+
+def child_exit(server, worker):
+    '''Keep the counts of an exited worker and drop its file (master)'''
+
+    from macronizer_cores.metrics.utils import mark_process_dead
+    mark_process_dead(os.environ["METRICS_DIR"], worker.pid)
@@ -1,5 +1,4 @@
 from flask import Flask
-from flask_debugtoolbar import DebugToolbarExtension
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
@@ -7,7 +6,6 @@ from config import DevelopmentConfig
 
 
 # instantiate the extension
-debug = DebugToolbarExtension()
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 login = LoginManager()
@@ -33,7 +31,10 @@ def register_blueprint(app):
     from macronizer_cores.log_api.routes import log_api
     from macronizer_cores.food_item_api.routes import food_item_api
     from macronizer_cores.user_api.routes import user_api
+    from macronizer_cores.summary_api.routes import summary_api
     from macronizer_cores.main.routes import main
+    from macronizer_cores.assets.routes import assets
+    from macronizer_cores.metrics.routes import metrics_api
 
   # register blueprints to application object
     app.register_blueprint(main)
@@ -42,16 +43,52 @@ def register_blueprint(app):
     app.register_blueprint(log_api)
     app.register_blueprint(food_item_api)
     app.register_blueprint(user_api)
+    app.register_blueprint(summary_api)
+    app.register_blueprint(assets)
+    app.register_blueprint(metrics_api)
 
 
 def register_extension(app):
   '''Helper function to register extension'''
 
-  debug.init_app(app)
+  from macronizer_cores.food_item_api.cache import nutrition_cache, ingredient_cache
+  from macronizer_cores.food_item_api.client import nutrition_client
+  from macronizer_cores.food_item_api.singleflight import upstream_flight
+  from macronizer_cores.food_item_api.catalog import food_catalog
+  from macronizer_cores.compression import compress
+  from macronizer_cores.auth.cache import user_cache
+  from macronizer_cores.auth.hashing import password_hasher
+  from macronizer_cores import db_pool
+  from macronizer_cores.metrics.utils import metrics
+  from macronizer_cores.metrics.diagnostics import query_diagnostics
+
+  # NOTE - registered first so it runs after every other after_request hook
+  # (debug toolbar, cache headers) on the final body
+  compress.init_app(app)
+  # debug toolbar only when the config enables it (imported on demand, no
+  # middleware or import cost in production)
+  if app.config.get('DEBUG_TB_ENABLED', False) and app.debug:
+    from flask_debugtoolbar import DebugToolbarExtension
+    DebugToolbarExtension(app)
+  # request timing starts before every other before_request hook
+  metrics.init_app(app)
+  query_diagnostics.init_app(app)
+  # pool options and fork safety have to be set before the engine is created
+  db_pool.init_app(app)
   db.init_app(app)
   bcrypt.init_app(app)
+  password_hasher.init_app(app)
   # register flask_login
   login.init_app(app)
   login.login_view = 'auth.login'
   login.login_message_category = 'warning'
+  user_cache.init_app(app)
+  # nutrition lookup cache
+  nutrition_cache.init_app(app)
+  ingredient_cache.init_app(app)
+  # pooled nutrition API client
+  nutrition_client.init_app(app)
+  upstream_flight.init_app(app)
+  # local food catalog
+  food_catalog.init_app(app)
 
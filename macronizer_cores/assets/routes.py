@@ -0,0 +1,72 @@
+from flask import Blueprint, request, current_app, send_from_directory, abort
+from macronizer_cores.assets.utils import build_assets, asset_url, asset_urls, PRECOMPRESSED
+
+import click
+import mimetypes
+import os
+
+
+# create blueprint
+assets = Blueprint('assets', __name__, cli_group='assets')
+
+
+# SECTION - template helpers
+@assets.app_context_processor
+def inject_asset_helpers():
+    '''
+    Make asset_url() / asset_urls() available in every template
+    '''
+
+    return dict(asset_url=asset_url, asset_urls=asset_urls)
+
+
+# SECTION - routes
+@assets.route("/assets/<path:filename>")
+def serve_asset(filename):
+    '''
+    GET /assets/<path:filename>
+    ----------------------------------------------------------------
+    - Serve a fingerprinted asset built by `flask assets build`
+    - The name changes with the content, so the response is cached for a year
+      and marked immutable (no revalidation on reload)
+    - The precompressed .br / .gz variant is sent when the client accepts it
+
+    Returns
+    --------------
+    Asset file
+    '''
+
+    output_dir = current_app.config['ASSETS_OUTPUT_DIR']
+    if filename.endswith(tuple(PRECOMPRESSED.values())):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    path = filename
+    encoding = None
+    for name, suffix in PRECOMPRESSED.items():
+        if name in request.accept_encodings and os.path.isfile(os.path.join(output_dir, filename + suffix)):
+            path, encoding = filename + suffix, name
+            break
+
+    res = send_from_directory(output_dir, path, mimetype=mimetype, max_age=current_app.config['ASSETS_MAX_AGE'])
+    if encoding:
+        res.headers["Content-Encoding"] = encoding
+    res.vary.add("Accept-Encoding")
+    res.cache_control.immutable = True
+    return res
+
+
+# SECTION - cli commands
+@assets.cli.command("build")
+def build_static_assets():
+    '''
+    flask assets build
+    ----------------------------------------------------------------
+    - Bundle, minify, fingerprint and precompress the static files
+    '''
+
+    output_dir = current_app.config['ASSETS_OUTPUT_DIR']
+    manifest = build_assets(current_app.static_folder, output_dir)
+    for name, built in sorted(manifest.items()):
+        click.echo(f"{name} -> {built}")
+    click.echo(f"Built {len(manifest)} assets into {output_dir}")
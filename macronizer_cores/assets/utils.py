@@ -0,0 +1,163 @@
+from flask import current_app, url_for
+
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # pragma: no cover - rjsmin is optional
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:  # pragma: no cover - rcssmin is optional
+    rcssmin = None
+
+
+# bundles served instead of their source files (in load order)
+BUNDLES = {
+    "js/site.js": [
+        "js/template.js",
+        "js/components.js",
+        "js/helpers.js",
+        "js/models.js",
+        "js/app.js"
+    ]
+}
+
+MANIFEST_NAME = "manifest.json"
+
+# encodings written next to every built asset, in order of preference
+PRECOMPRESSED = {"br": ".br", "gzip": ".gz"}
+
+_manifest_cache = {}
+
+
+def minify(name, source) -> str:
+    '''Minify JS/CSS source with rjsmin/rcssmin when they are installed'''
+
+    if name.endswith(".js") and rjsmin is not None:
+        return rjsmin.jsmin(source)
+    if name.endswith(".css") and rcssmin is not None:
+        return rcssmin.cssmin(source)
+    return source
+
+
+def fingerprint(name, content: bytes) -> str:
+    '''File name with a content hash, e.g. js/site.js -> js/site.3f2a9c1b0d.js'''
+
+    root, ext = os.path.splitext(name)
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    return f"{root}.{digest}{ext}"
+
+
+def write_asset(output_dir, name, content: bytes):
+    '''Write an asset and its precompressed variants'''
+
+    path = os.path.join(output_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(content)
+    with open(path + PRECOMPRESSED["gzip"], "wb") as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(path + PRECOMPRESSED["br"], "wb") as f:
+            f.write(brotli.compress(content, quality=11))
+
+
+def iter_static_files(static_folder, output_dir):
+    '''Relative (posix) paths of the files of the static folder, build output excluded'''
+
+    output_dir = os.path.abspath(output_dir)
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.abspath(os.path.join(root, d)) != output_dir)
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            yield os.path.relpath(path, static_folder).replace(os.sep, "/")
+
+
+def build_assets(static_folder, output_dir) -> dict:
+    '''
+    Build the fingerprinted static assets
+    ----------------------------------------------------------------
+    - BUNDLES are concatenated from their sources, every other static file is
+      copied on its own; JS and CSS are minified (rjsmin/rcssmin if installed)
+    - Every asset gets a content hashed name and .gz (and .br with brotli) variants
+    - The manifest maps logical names to built names
+
+    Parameters
+    --------------
+    static_folder: str
+        Folder of the source files (app.static_folder)
+    output_dir: str
+        Folder the assets and the manifest are written to
+
+    Returns
+    --------------
+    Manifest dict {logical name: fingerprinted name}
+    '''
+
+    bundled = {source for sources in BUNDLES.values() for source in sources}
+    entries = {name: [name] for name in iter_static_files(static_folder, output_dir)
+               if name not in bundled and not name.endswith(".json")}
+    entries.update(BUNDLES)
+
+    manifest = {}
+    for name, sources in sorted(entries.items()):
+        if name.endswith((".js", ".css")):
+            parts = []
+            for source in sources:
+                with open(os.path.join(static_folder, source), encoding="utf-8") as f:
+                    parts.append(minify(name, f.read()))
+            # ; guards against a source without a trailing semicolon
+            content = ("\n;\n" if name.endswith(".js") else "\n").join(parts).encode("utf-8")
+        else:
+            with open(os.path.join(static_folder, sources[0]), "rb") as f:
+                content = f.read()
+
+        manifest[name] = fingerprint(name, content)
+        write_asset(output_dir, manifest[name], content)
+
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    _manifest_cache.pop(output_dir, None)
+    return manifest
+
+
+def load_manifest(output_dir) -> dict:
+    '''Manifest of a build (empty if the assets were not built), read once per process'''
+
+    if output_dir not in _manifest_cache:
+        try:
+            with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+                _manifest_cache[output_dir] = json.load(f)
+        except FileNotFoundError:
+            _manifest_cache[output_dir] = {}
+    return _manifest_cache[output_dir]
+
+
+def asset_urls(filename) -> list:
+    '''
+    URLs to load a static file or bundle
+    ----------------------------------------------------------------
+    - One fingerprinted URL when the assets are built
+    - Otherwise the plain static URL(s) (the sources of a bundle, in order)
+    '''
+
+    manifest = load_manifest(current_app.config['ASSETS_OUTPUT_DIR'])
+    if filename in manifest:
+        return [url_for('assets.serve_asset', filename=manifest[filename])]
+    return [url_for('static', filename=source) for source in BUNDLES.get(filename, [filename])]
+
+
+def asset_url(filename) -> str:
+    '''url_for('static', filename=...) replacement that returns the fingerprinted URL when built'''
+
+    return asset_urls(filename)[0]
@@ -0,0 +1,116 @@
+from flask import session, has_request_context
+from sqlalchemy.orm import make_transient_to_detached
+from macronizer_cores import db
+from macronizer_cores.lru import LRUCache
+
+import time
+
+
+# User columns kept in the cache (the password hash is loaded from the db on demand)
+CACHED_USER_FIELDS = ("id", "name", "email", "username")
+
+# session key of the signed user snapshot
+SNAPSHOT_KEY = "_user_snapshot"
+
+
+class UserCache(object):
+    '''
+    Per-worker cache of the logged-in users for the flask_login user loader
+    ----------------------------------------------------------------
+    - Tier 1: in-process LRU with TTL keyed by user id
+    - Tier 2 (USER_SESSION_SNAPSHOT): snapshot of the user in the signed session
+      cookie, used when the worker has not seen the user yet
+    - A hit is attached to the db session with merge(load=False), no SELECT
+    '''
+
+    def __init__(self, app=None):
+        self.memory = LRUCache()
+        self.snapshot_enabled = False
+        self.snapshot_hits = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Configure the cache from the app config'''
+
+        self.memory.configure(
+            maxsize=app.config['USER_CACHE_SIZE'],
+            ttl=app.config['USER_CACHE_TTL']
+        )
+        self.snapshot_enabled = app.config['USER_SESSION_SNAPSHOT']
+        self.snapshot_hits = 0
+
+    def load(self, model, user_id):
+        '''
+        Get a user by id from the cache, falling back to the db
+
+        Parameters
+        --------------
+        model: db.Model
+            User model
+        user_id: int
+            Id of the user
+
+        Returns
+        --------------
+        User attached to the current db session, or None if it doesn't exist
+        '''
+
+        values = self.memory.get(user_id)
+        if values is None:
+            values = self._load_snapshot(user_id)
+            if values is not None:
+                self.snapshot_hits += 1
+                self.memory.set(user_id, values)
+
+        if values is not None:
+            user = model(**values)
+            # mark it persistent-to-be: attributes not cached (password) are loaded lazily
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = model.query.get(user_id)
+        if user is not None:
+            self.remember(user)
+        return user
+
+    def remember(self, user):
+        '''Cache a user loaded from the db (and snapshot it in the session)'''
+
+        values = {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+        self.memory.set(user.id, values)
+        if self.snapshot_enabled and has_request_context():
+            session[SNAPSHOT_KEY] = dict(values, cached_at=time.time())
+
+    def invalidate(self, user_id):
+        '''Drop a user after it changed'''
+
+        self.memory.invalidate(user_id)
+        if has_request_context():
+            snapshot = session.get(SNAPSHOT_KEY)
+            if snapshot and snapshot.get("id") == user_id:
+                session.pop(SNAPSHOT_KEY)
+
+    def _load_snapshot(self, user_id):
+        '''Column values of the session snapshot if it is for user_id and not expired'''
+
+        if not self.snapshot_enabled or not has_request_context():
+            return None
+
+        snapshot = session.get(SNAPSHOT_KEY)
+        if not snapshot or snapshot.get("id") != user_id \
+                or snapshot.get("cached_at", 0) + self.memory.ttl <= time.time():
+            return None
+        return {field: snapshot.get(field) for field in CACHED_USER_FIELDS}
+
+    def stats(self) -> dict:
+        '''Snapshot of the cache counters'''
+
+        stats = self.memory.stats()
+        stats["snapshot_hits"] = self.snapshot_hits
+        return stats
+
+
+# instantiate the extension
+user_cache = UserCache()
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from threading import BoundedSemaphore, Lock
+from macronizer_cores import bcrypt
+
+
+class HashingBusyError(Exception):
+    '''
+    Raised when the password hashing pool is full (the request should be retried later)
+    '''
+
+
+def hash_cost(pw_hash: str):
+    '''
+    Work factor of a bcrypt hash ("$2b$12$..." -> 12), None if it can't be read
+    '''
+
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher(object):
+    '''
+    Bounded pool for bcrypt hashing and checking
+    ----------------------------------------------------------------
+    - At most PASSWORD_HASH_WORKERS hashes run at the same time per process
+      (bcrypt releases the GIL, so the threads use separate cores)
+    - At most PASSWORD_HASH_QUEUE_SIZE more wait for a thread; when the queue
+      is full HashingBusyError is raised right away instead of tying up the
+      request worker behind other logins
+    - The work factor comes from BCRYPT_LOG_ROUNDS
+    '''
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self._executor = None
+        self._slots = None
+        self.rounds = 12
+        self.timeout = 10
+        self.hashed = 0
+        self.checked = 0
+        self.rejected = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Size the pool from the app config'''
+
+        workers = app.config['PASSWORD_HASH_WORKERS']
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+            self._slots = BoundedSemaphore(workers + app.config['PASSWORD_HASH_QUEUE_SIZE'])
+            self.rounds = app.config['BCRYPT_LOG_ROUNDS']
+            self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+            self.hashed = 0
+            self.checked = 0
+            self.rejected = 0
+
+    def _run(self, fn, *args):
+        '''Run fn in the pool and wait for it, or reject if the pool is full'''
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusyError("Too many password hashing requests")
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except RuntimeError:
+            slots.release()
+            raise
+        # the slot is held until the hash is done, even if the caller stopped waiting
+        future.add_done_callback(lambda _: slots.release())
+
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HashingBusyError("Password hashing timed out")
+
+    def hash(self, password: str) -> str:
+        '''
+        Hash a password with the configured work factor
+
+        Returns
+        --------------
+        bcrypt hash as a UNICODE string
+        '''
+
+        pw_hash = self._run(bcrypt.generate_password_hash, password, self.rounds)
+        with self._lock:
+            self.hashed += 1
+        return pw_hash.decode('utf-8')
+
+    def check(self, pw_hash: str, password: str) -> bool:
+        '''Check a password against a stored bcrypt hash'''
+
+        result = self._run(bcrypt.check_password_hash, pw_hash, password)
+        with self._lock:
+            self.checked += 1
+        return result
+
+    def needs_rehash(self, pw_hash: str) -> bool:
+        '''Whether a stored hash was made with another work factor than the configured one'''
+
+        return hash_cost(pw_hash) != self.rounds
+
+    def stats(self) -> dict:
+        '''Snapshot of the pool counters'''
+
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "hashed": self.hashed,
+                "checked": self.checked,
+                "rejected": self.rejected
+            }
+
+
+# instantiate the extension
+password_hasher = PasswordHasher()
@@ -2,7 +2,8 @@ from flask import render_template, redirect, flash, Blueprint, g, url_for
 from flask_login import current_user, login_user, logout_user
 from macronizer_cores import db
 from macronizer_cores.models import User
-from macronizer_cores.auth.forms import RegisterForm, LoginForm
+from macronizer_cores.auth.cache import user_cache
+from macronizer_cores.auth.hashing import HashingBusyError
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
 
@@ -23,18 +24,17 @@ def add_current_date_to_g():
 
 
 # ----------------------------------------------------------------
-# Turn off all caching in Flask
-# @credit to https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
+# Default cache policy
+# NOTE - routes (log reads, static files) set their own Cache-Control,
+# every other response is not stored by the browser or any proxy
 # ----------------------------------------------------------------
 @auth.after_app_request
-def add_header(req):
-    """Add non-caching headers on every request."""
+def add_header(res):
+    """Add non-caching headers on responses without a cache policy."""
 
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
-    return req
+    if "Cache-Control" not in res.headers:
+        res.headers["Cache-Control"] = "no-store"
+    return res
 
 
 @auth.route("/login", methods=["GET", "POST"])
@@ -48,6 +48,9 @@ def login():
         flash("Please logout first before logging in another account.", "warning")
         return redirect(url_for('main.show_dashboard'))
 
+    # NOTE - imported on first use: wtforms pulls in email_validator (dnspython),
+    # the slowest import of the app, and only the two auth pages need it
+    from macronizer_cores.auth.forms import LoginForm
     form = LoginForm()
 
     # if POST request -> validate data
@@ -55,12 +58,18 @@ def login():
         # retrieve form data
         username = form.username.data
         password = form.password.data
-        user = User.authenticate(username, password)
+        try:
+            user = User.authenticate(username, password)
+        except HashingBusyError:
+            # fail fast under login peaks instead of queueing behind other logins
+            form.username.errors = ["Too many login attempts right now, please try again in a moment."]
+            return (render_template('auth/login.html', form=form), 503, {"Retry-After": "1"})
 
         # check if authentication succeeds
         if user:
             # store user id in session 
             login_user(user)
+            user_cache.remember(user)
             return redirect("/")
         else:
             form.username.errors = ["Invalid username/password."]
@@ -80,6 +89,7 @@ def register():
         flash("Please logout first before registering another account.", "warning")
         return redirect(url_for('main.show_dashboard'))
 
+    from macronizer_cores.auth.forms import RegisterForm
     form = RegisterForm()
 
     # if POST request -> validate data
@@ -91,7 +101,11 @@ def register():
         password = form.password.data
 
         # password hashing
-        (username, password) = User.register(username, password)
+        try:
+            (username, password) = User.register(username, password)
+        except HashingBusyError:
+            form.username.errors = ["Too many sign ups right now, please try again in a moment."]
+            return (render_template('auth/register.html', form=form), 503, {"Retry-After": "1"})
 
         # add user to db
         try:
@@ -108,6 +122,7 @@ def register():
             return redirect(url_for('auth.register'))
 
         login_user(new_user)
+        user_cache.remember(new_user)
         return redirect("/")
 
     # if GET request, render register form
@@ -0,0 +1,133 @@
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+
+class _GzipStream(object):
+    '''Incremental gzip encoder (each chunk is flushed so streaming keeps going)'''
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliStream(object):
+    '''Incremental brotli encoder (each chunk is flushed so streaming keeps going)'''
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk):
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class Compress(object):
+    '''
+    Compress text responses (JSON, NDJSON, CSV, HTML, ...) for clients that accept it
+    ----------------------------------------------------------------
+    - Negotiates brotli (if installed) or gzip from Accept-Encoding
+    - Skips small bodies (COMPRESS_MIN_SIZE), 204/304 responses, responses that
+      already have a Content-Encoding and files sent with send_file (the
+      fingerprinted assets are precompressed)
+    - Streamed responses (/api/log/range, /api/log/export) are compressed chunk by chunk
+    '''
+
+    def __init__(self, app=None):
+        self.level = 6
+        self.brotli_level = 4
+        self.min_size = 500
+        self.mimetypes = set()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read the compression settings and register the after_request hook'''
+
+        self.level = app.config['COMPRESS_LEVEL']
+        self.brotli_level = app.config['COMPRESS_BR_LEVEL']
+        self.min_size = app.config['COMPRESS_MIN_SIZE']
+        self.mimetypes = set(app.config['COMPRESS_MIMETYPES'])
+        if app.config['COMPRESS_ENABLED']:
+            app.after_request(self.after_request)
+
+    def choose_encoding(self, request):
+        '''Best content coding accepted by the client (None for identity)'''
+
+        accepted = request.accept_encodings
+        if brotli is not None and accepted["br"] and accepted["br"] >= accepted["gzip"]:
+            return "br"
+        if accepted["gzip"]:
+            return "gzip"
+        return None
+
+    def after_request(self, response):
+        '''Compress the response body when it is worth it'''
+
+        from flask import request
+
+        if response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add("Accept-Encoding")
+
+        if response.status_code in (204, 304) or response.status_code < 200 \
+                or "Content-Encoding" in response.headers \
+                or response.direct_passthrough:
+            return response
+        if not response.is_streamed and (response.content_length or 0) < self.min_size:
+            return response
+
+        encoding = self.choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+        else:
+            response.set_data(self.compress(response.get_data(), encoding))
+
+        response.headers["Content-Encoding"] = encoding
+        # the encoded body is a different representation of the resource
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def compress(self, data, encoding):
+        '''Compress a whole body'''
+
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_level)
+        return gzip.compress(data, compresslevel=self.level)
+
+    def compress_stream(self, chunks, encoding):
+        '''Compress a streamed body chunk by chunk'''
+
+        stream = _BrotliStream(self.brotli_level) if encoding == "br" else _GzipStream(self.level)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                if chunk:
+                    yield stream.compress(chunk)
+            yield stream.finish()
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+
+
+# instantiate the extension
+compress = Compress()
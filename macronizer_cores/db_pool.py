@@ -0,0 +1,154 @@
+from sqlalchemy import event, exc
+from sqlalchemy.pool import Pool, QueuePool
+from threading import Lock
+
+import os
+import time
+import weakref
+
+
+# upper bounds (seconds) of the checkout wait histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics(object):
+    '''
+    Connection pool counters of the current process
+    ----------------------------------------------------------------
+    - Checkout wait time (histogram, total, max) and timeouts of InstrumentedQueuePool
+    - Connections in use / idle / overflow of every live instrumented pool
+    - Connections invalidated because they were inherited from another process
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._pools = weakref.WeakSet()
+        self.reset()
+
+    def reset(self):
+        '''Zero every counter'''
+
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+            self.wait_buckets = [0] * len(WAIT_BUCKETS)
+            self.forked_connections = 0
+
+    def track(self, pool):
+        '''Include a pool in the in-use counts'''
+
+        with self._lock:
+            self._pools.add(pool)
+
+    def record_wait(self, seconds, timed_out=False):
+        '''Record the time a checkout waited for a connection'''
+
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_buckets[i] += 1
+
+    def record_fork(self):
+        '''Record a connection discarded after a fork'''
+
+        with self._lock:
+            self.forked_connections += 1
+
+    def stats(self) -> dict:
+        '''Snapshot of the counters'''
+
+        with self._lock:
+            pools = list(self._pools)
+            return {
+                "pools": len(pools),
+                "in_use": sum(pool.checkedout() for pool in pools),
+                "idle": sum(pool.checkedin() for pool in pools),
+                "overflow": sum(max(pool.overflow(), 0) for pool in pools),
+                "size": sum(pool.size() for pool in pools),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                "wait_buckets": dict(zip(WAIT_BUCKETS, self.wait_buckets)),
+                "forked_connections": self.forked_connections
+            }
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(QueuePool):
+    '''
+    QueuePool recording how long every checkout waits for a connection
+    (time spent blocked on a full pool plus time to open a new connection)
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        pool_metrics.track(self)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+# SECTION - fork safety
+# @credit to https://docs.sqlalchemy.org/en/14/core/pooling.html#using-connection-pools-with-multiprocessing-or-os-fork
+def _remember_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+
+def _check_pid(dbapi_connection, connection_record, connection_proxy):
+    '''
+    Discard a connection opened by the parent process (gunicorn preload/fork)
+    instead of sharing its socket with it
+    '''
+
+    pid = os.getpid()
+    owner = connection_record.info.get('pid', pid)
+    if owner != pid:
+        pool_metrics.record_fork()
+        connection_record.dbapi_connection = connection_proxy.dbapi_connection = None
+        raise exc.DisconnectionError(
+            "Connection record belongs to pid %s, attempting to check out in pid %s"
+            % (owner, pid)
+        )
+
+
+def install_fork_guard():
+    '''Register the pid check on every connection pool (once per process)'''
+
+    if not event.contains(Pool, "connect", _remember_pid):
+        event.listen(Pool, "connect", _remember_pid)
+        event.listen(Pool, "checkout", _check_pid)
+
+
+def init_app(app):
+    '''
+    Set up the connection pool of the app
+    ----------------------------------------------------------------
+    - Pool options (SQLALCHEMY_ENGINE_OPTIONS) get the instrumented QueuePool
+    - Connections are never shared between forked processes
+    '''
+
+    # copy, the config class dict is shared by every app
+    options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    if 'pool_size' in options:
+        options.setdefault('poolclass', InstrumentedQueuePool)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    install_fork_guard()
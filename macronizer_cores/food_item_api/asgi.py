@@ -0,0 +1,175 @@
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+from itsdangerous import BadSignature
+from macronizer_cores.food_item_api.async_search import AsyncFoodSearch
+from macronizer_cores.food_item_api.utils import NutritionAPIError
+from macronizer_cores.metrics.utils import metrics
+from macronizer_cores.models import load_user
+from macronizer_cores.utils import dumps_json
+
+import time
+
+
+# route answered on the event loop, everything else goes to the Flask app
+SEARCH_PATH = "/api/food/search"
+
+
+class FoodSearchASGI(object):
+    '''
+    ASGI app serving /api/food/search on asyncio beside the Flask (WSGI) app
+    ----------------------------------------------------------------
+    - A search waiting on the nutrition API holds no worker or thread, so one
+      process keeps hundreds of upstream searches in flight
+    - Every other request (and searches without the session of an existing user,
+      so the Flask login handling applies) runs in the Flask app in a thread pool
+    - The WSGI bridge reads a whole request body into memory before the Flask
+      app runs: bodies over MAX_CONTENT_LENGTH (e.g. /api/log/import uploads)
+      are refused with 413 before they are read, larger imports go through
+      `flask log import`
+    - Run with an ASGI server, e.g. `gunicorn asgi:application -k uvicorn.workers.UvicornWorker`
+    '''
+
+    def __init__(self, flask_app, wsgi_app=None):
+        self.flask_app = flask_app
+        self.food_search = AsyncFoodSearch(flask_app)
+        self.max_body = flask_app.config['MAX_CONTENT_LENGTH']
+
+        if wsgi_app is None:
+            from uvicorn.middleware.wsgi import WSGIMiddleware
+            wsgi_app = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_THREADS'])
+        self.wsgi_app = wsgi_app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http" and scope["path"] == SEARCH_PATH \
+                and scope["method"] == "GET" and await self.authenticated(scope):
+            started = time.perf_counter()
+            status = await self.search(scope, send)
+            metrics.observe_request(
+                "food_item_api", "food_item_api.search_food_item", "GET", status, time.perf_counter() - started
+            )
+        elif scope["type"] == "http" and self.body_too_large(scope):
+            await self.respond(send, {"message": "Request body too large"}, 413)
+        else:
+            await self.wsgi_app(scope, self.capped_receive(receive), send)
+
+    async def lifespan(self, receive, send):
+        '''Close the upstream connection pool on shutdown'''
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.food_search.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def authenticated(self, scope) -> bool:
+        '''
+        Whether the request carries a Flask session of a logged-in user that
+        still exists (resolved by the login manager's user loader)
+        '''
+
+        if self.flask_app.config.get('LOGIN_DISABLED'):
+            return True
+
+        user_id = self.session_user_id(scope)
+        if user_id is None:
+            return False
+        try:
+            # the user cache may query the db -> thread pool, not the event loop
+            user = await self.food_search.run_sync(load_user, user_id)
+        except ValueError:
+            return False
+        return user is not None and user.is_active
+
+    def session_user_id(self, scope):
+        '''User id of the signed Flask session cookie (None without a valid session)'''
+
+        app = self.flask_app
+        cookies = SimpleCookie()
+        for name, value in scope.get("headers", []):
+            if name == b"cookie":
+                cookies.load(value.decode("latin-1"))
+
+        morsel = cookies.get(app.session_cookie_name)
+        serializer = app.session_interface.get_signing_serializer(app)
+        if morsel is None or serializer is None:
+            return None
+        try:
+            session = serializer.loads(
+                morsel.value,
+                max_age=int(app.permanent_session_lifetime.total_seconds())
+            )
+        except BadSignature:
+            return None
+        return session.get("_user_id")
+
+    def body_too_large(self, scope) -> bool:
+        '''Whether the Content-Length of a request is over MAX_CONTENT_LENGTH'''
+
+        if self.max_body is None:
+            return False
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                return value.isdigit() and int(value) > self.max_body
+        return False
+
+    def capped_receive(self, receive):
+        '''
+        receive() ending the body after MAX_CONTENT_LENGTH bytes, so a chunked
+        upload (no Content-Length, ignored by the Flask app) isn't buffered whole
+        '''
+
+        if self.max_body is None:
+            return receive
+        received = 0
+
+        async def receive_capped():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body:
+                    return {"type": "http.request", "body": b"", "more_body": False}
+            return message
+        return receive_capped
+
+    async def search(self, scope, send):
+        '''
+        GET /api/food/search?queryString=...
+        ----------------------------------------------------------------
+        - Same responses as food_item_api.routes.search_food_item
+        '''
+
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        query_string = query.get("queryString", [""])[0]
+        if not query_string:
+            return await self.respond(send, {"message": "Missing query string"}, 400)
+
+        try:
+            payload = await self.food_search.search(query_string)
+        except NutritionAPIError as e:
+            self.flask_app.logger.warning("Nutrition API error: %s %s", e.status_code, e.message)
+            if e.status_code is None:
+                return await self.respond(send, {"message": "Nutrition service unavailable"}, 503)
+            return await self.respond(send, {"message": "Request failed"}, 502)
+        return await self.respond(send, payload)
+
+    async def respond(self, send, payload, status=200) -> int:
+        '''Send a JSON response (returns the status)'''
+
+        body = dumps_json(payload)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"cache-control", b"no-store")
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
+        return status
@@ -0,0 +1,184 @@
+from concurrent.futures import ThreadPoolExecutor
+from macronizer_cores.food_item_api.cache import normalize_query
+from macronizer_cores.food_item_api.client import NutritionClient
+from macronizer_cores.food_item_api.utils import prepare_search, complete_search, NutritionAPIError
+from macronizer_cores.metrics.utils import metrics
+
+import asyncio
+import functools
+import random
+import time
+
+import httpx
+
+
+class AsyncNutritionClient(object):
+    '''
+    asyncio HTTP client for the CalorieNinjas nutrition API
+    ----------------------------------------------------------------
+    - One httpx connection pool per event loop, up to NUTRITION_API_ASYNC_POOL_SIZE
+      connections, so hundreds of searches can wait on the API in one process
+    - Same timeouts, retried statuses and full jitter backoff as NutritionClient
+    - Identical searches in flight share one API call
+    '''
+
+    def __init__(self, app=None):
+        self.url = None
+        self.headers = {}
+        self.timeout = None
+        self.limits = None
+        self.retries = 0
+        self.backoff_factor = 0
+        self._client = None
+        self._loop = None
+        self._in_flight = {}
+        self.coalesced = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Read the API settings from the app config'''
+
+        self.url = app.config['NUTRITION_API_URL']
+        self.headers = {'X-Api-Key': app.config['NUTRITION_API_KEY'] or ''}
+        self.timeout = httpx.Timeout(
+            app.config['NUTRITION_API_READ_TIMEOUT'],
+            connect=app.config['NUTRITION_API_CONNECT_TIMEOUT']
+        )
+        pool_size = app.config['NUTRITION_API_ASYNC_POOL_SIZE']
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.retries = app.config['NUTRITION_API_RETRIES']
+        self.backoff_factor = app.config['NUTRITION_API_BACKOFF']
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        '''Connection pool of the running event loop (created on first use)'''
+
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(headers=self.headers, timeout=self.timeout, limits=self.limits)
+            self._loop = loop
+            self._in_flight = {}
+        return self._client
+
+    async def aclose(self):
+        '''Close the connection pool (ASGI lifespan shutdown)'''
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch(self, query_string: str) -> list:
+        '''
+        Search the nutrition API, retrying transient failures
+
+        Returns
+        --------------
+        List of API items (raises NutritionAPIError on failure)
+        '''
+
+        started = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = await self.client.get(self.url, params={'query': query_string})
+            except httpx.HTTPError as e:
+                if last_attempt:
+                    metrics.observe_upstream("calorieninjas", "error", time.perf_counter() - started)
+                    raise NutritionAPIError(repr(e)) from e
+            else:
+                if response.status_code == httpx.codes.OK:
+                    metrics.observe_upstream("calorieninjas", response.status_code, time.perf_counter() - started)
+                    return response.json().get("items", [])
+                if last_attempt or response.status_code not in NutritionClient.RETRY_STATUSES:
+                    metrics.observe_upstream("calorieninjas", response.status_code, time.perf_counter() - started)
+                    raise NutritionAPIError(response.text, response.status_code)
+
+            # full jitter exponential backoff (no sleep before the first retry, as urllib3)
+            if attempt > 0:
+                await asyncio.sleep(random.uniform(0, self.backoff_factor * (2 ** attempt)))
+
+    async def search(self, query_string: str) -> list:
+        '''
+        Search the nutrition API, sharing the call with identical searches in flight
+        '''
+
+        client = self.client
+        key = normalize_query(query_string)
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            items = await self.fetch(query_string)
+            future.set_result(items)
+            return items
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # retrieved here so an unawaited error isn't logged as "never retrieved"
+            future.exception()
+            raise
+        finally:
+            if self._client is client:
+                self._in_flight.pop(key, None)
+
+
+class AsyncFoodSearch(object):
+    '''
+    Food search for the asyncio path
+    ----------------------------------------------------------------
+    - Cache and catalog lookups (db access) run in a small thread pool with an app context
+    - The API call runs on the event loop, so waiting on it holds no thread
+    '''
+
+    def __init__(self, app=None):
+        self.app = None
+        self.client = AsyncNutritionClient()
+        self._executor = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Bind the search to an app and size its thread pool'''
+
+        self.app = app
+        self.client.init_app(app)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(
+            max_workers=app.config['ASYNC_SEARCH_THREADS'],
+            thread_name_prefix='food-search'
+        )
+
+    def _with_app_context(self, fn, *args):
+        with self.app.app_context():
+            return fn(*args)
+
+    async def run_sync(self, fn, *args):
+        '''Run a blocking function with an app context in the thread pool'''
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._with_app_context, fn, *args))
+
+    async def search(self, query_string: str) -> dict:
+        '''
+        Resolve a food search query (same steps as utils.search_food)
+
+        Returns
+        --------------
+        Search result in the nutrition API format ({"items": [...]})
+        '''
+
+        payload, plan = await self.run_sync(prepare_search, query_string)
+        if plan is None:
+            return payload
+
+        upstream_items = await self.client.search(plan.upstream_query)
+        return await self.run_sync(complete_search, query_string, plan, upstream_items)
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+from threading import Lock
+from sqlalchemy.exc import SQLAlchemyError
+from macronizer_cores import db
+from macronizer_cores.lru import LRUCache
+from macronizer_cores.models import NutritionCacheEntry
+from macronizer_cores.utils import dialect_insert
+
+import json
+
+
+def normalize_query(query_string: str) -> str:
+    '''
+    Normalize a food search query so equivalent searches share a cache key
+    ("  Chicken   BREAST " -> "chicken breast")
+    '''
+
+    return ' '.join(query_string.lower().split())
+
+
+class NutritionCache(object):
+    '''
+    Two-tier cache for nutrition API responses
+    ----------------------------------------------------------------
+    - Tier 1: in-process LRU with TTL (per gunicorn worker)
+    - Tier 2: `nutrition_cache` table shared by every worker and surviving restarts
+    - Caches sharing the table are kept apart by a key namespace
+    - get_many/set_many read and write several keys in one statement
+    '''
+
+    def __init__(self, app=None, namespace=None):
+        self.namespace = namespace
+        self.memory = LRUCache()
+        self._lock = Lock()
+        self.db_ttl = timedelta(days=30)
+        self.db_hits = 0
+        self.db_misses = 0
+        self.db_errors = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Configure both tiers from the app config'''
+
+        self.memory.configure(
+            maxsize=app.config['NUTRITION_CACHE_SIZE'],
+            ttl=app.config['NUTRITION_CACHE_TTL']
+        )
+        self.db_ttl = timedelta(seconds=app.config['NUTRITION_CACHE_DB_TTL'])
+        with self._lock:
+            self.db_hits = 0
+            self.db_misses = 0
+            self.db_errors = 0
+
+    def get(self, query_string: str):
+        '''
+        Look up a query in memory first, then in the db
+
+        Returns
+        --------------
+        Cached API payload (dict) or None on a miss
+        '''
+
+        return self.get_many([query_string]).get(query_string)
+
+    def get_many(self, query_strings: list) -> dict:
+        '''
+        Look up several queries: memory first, then the keys missing from
+        memory in one db read
+
+        Returns
+        --------------
+        Dict of query string -> cached API payload (misses are left out)
+        '''
+
+        found = {}
+        missing = {}
+        for query_string in query_strings:
+            key = self._key(query_string)
+            payload = self.memory.get(key)
+            if payload is not None:
+                found[query_string] = payload
+            else:
+                missing.setdefault(key, []).append(query_string)
+
+        if missing:
+            for key, payload in self._load(list(missing)).items():
+                # promote to tier 1 so the next lookup skips the db
+                self.memory.set(key, payload)
+                for query_string in missing[key]:
+                    found[query_string] = payload
+        return found
+
+    def set(self, query_string: str, payload: dict):
+        '''Store an API payload in both tiers'''
+
+        self.set_many({query_string: payload})
+
+    def set_many(self, payloads: dict):
+        '''Store several API payloads in both tiers (one db upsert)'''
+
+        rows = {}
+        for query_string, payload in payloads.items():
+            key = self._key(query_string)
+            self.memory.set(key, payload)
+            rows[key] = payload
+        if rows:
+            self._store(rows)
+
+    def stats(self) -> dict:
+        '''Counters for both tiers'''
+
+        with self._lock:
+            return {
+                "memory": self.memory.stats(),
+                "db": {
+                    "hits": self.db_hits,
+                    "misses": self.db_misses,
+                    "errors": self.db_errors
+                }
+            }
+
+    def _key(self, query_string):
+        key = normalize_query(query_string)
+        return f"{self.namespace}:{key}" if self.namespace else key
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _load(self, keys) -> dict:
+        table = NutritionCacheEntry.__table__
+        oldest = datetime.utcnow() - self.db_ttl
+        try:
+            with db.engine.connect() as conn:
+                rows = conn.execute(
+                    db.select(table.c.query_key, table.c.payload).where(
+                        table.c.query_key.in_(keys),
+                        table.c.created_at >= oldest
+                    )
+                ).all()
+        except SQLAlchemyError:
+            # a broken cache tier must never break the search itself
+            self._count('db_errors')
+            return {}
+
+        with self._lock:
+            self.db_hits += len(rows)
+            self.db_misses += len(keys) - len(rows)
+        return {row.query_key: json.loads(row.payload) for row in rows}
+
+    def _store(self, rows: dict):
+        table = NutritionCacheEntry.__table__
+        created_at = datetime.utcnow()
+        stmt = dialect_insert(table).values([
+            {"query_key": key, "payload": json.dumps(payload), "created_at": created_at}
+            for key, payload in rows.items()
+        ])
+        # a key stored concurrently by another worker is overwritten
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.query_key],
+            set_={"payload": stmt.excluded.payload, "created_at": stmt.excluded.created_at}
+        )
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(stmt)
+        except SQLAlchemyError:
+            self._count('db_errors')
+
+
+# shared cache instances (configured in create_app)
+# - whole query string -> API payload
+nutrition_cache = NutritionCache()
+# - single ingredient -> per 100g nutrient vector and grams per unit
+ingredient_cache = NutritionCache(namespace='ingredient')
@@ -0,0 +1,245 @@
+from threading import Lock
+from sqlalchemy import func, or_
+from macronizer_cores import db
+from macronizer_cores.models import FoodCatalogItem, FoodCatalogTrigram
+from macronizer_cores.food_item_api.cache import normalize_query
+
+import csv
+import json
+
+
+# FoodItem/FoodCatalogItem column -> nutrition API (CalorieNinjas) item key
+NUTRIENT_FIELDS = {
+    "name": "name",
+    "sugar_gram": "sugar_g",
+    "fiber_gram": "fiber_g",
+    "serving_size_gram": "serving_size_g",
+    "sodium_mg": "sodium_mg",
+    "potassium_mg": "potassium_mg",
+    "fat_saturation_gram": "fat_saturated_g",
+    "fat_total_gram": "fat_total_g",
+    "calories": "calories",
+    "cholesterol_mg": "cholesterol_mg",
+    "protein_gram": "protein_g",
+    "carbohydrate_gram": "carbohydrates_total_g"
+}
+
+
+def trigrams(text: str) -> set:
+    '''
+    Split a string into pg_trgm style trigrams (each word padded with 2 leading
+    and 1 trailing space): "egg" -> {"  e", " eg", "egg", "gg "}
+    '''
+
+    grams = set()
+    for word in normalize_query(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: set, b: set) -> float:
+    '''Jaccard similarity of two trigram sets'''
+
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def read_catalog_file(path: str):
+    '''
+    Stream catalog rows from a CSV, JSON (list) or NDJSON file
+
+    Each row has a "name" and the FoodItem nutrient columns per 100g
+    (e.g. calories, protein_gram, fat_total_gram ...)
+    '''
+
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(f)
+        elif path.endswith('.json'):
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class FoodCatalog(object):
+    '''
+    Local food catalog used as the first resolution path for food searches
+    ----------------------------------------------------------------
+    - Exact/prefix match on the normalized name (btree index)
+    - Fuzzy match through the trigram table, scored by trigram similarity
+    - lookup_many resolves every ingredient of a search in one query
+    '''
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self.threshold = 0.5
+        self.max_candidates = 20
+        self.hits = 0
+        self.misses = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Configure matching from the app config'''
+
+        self.threshold = app.config['FOOD_CATALOG_MATCH_THRESHOLD']
+        self.max_candidates = app.config['FOOD_CATALOG_MAX_CANDIDATES']
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def lookup(self, query_string: str):
+        '''
+        Resolve a single food name against the catalog
+
+        Returns
+        --------------
+        Nutrition API style item (per 100g) or None if nothing is similar enough
+        '''
+
+        return self.lookup_many([query_string]).get(query_string)
+
+    def lookup_many(self, query_strings: list) -> dict:
+        '''
+        Resolve several food names against the catalog with one query
+
+        Returns
+        --------------
+        Dict of food name -> nutrition API style item (per 100g); names
+        without a similar enough catalog row are left out
+        '''
+
+        keys = {query_string: normalize_query(query_string) for query_string in query_strings}
+        query_grams = {key: trigrams(key) for key in set(keys.values())}
+        if not query_grams:
+            return {}
+        catalog = FoodCatalogItem.__table__
+        trgm = FoodCatalogTrigram.__table__
+
+        # candidates of every name: names starting with it + names sharing the most trigrams
+        conditions = []
+        for key, grams in query_grams.items():
+            shared_trigrams = db.select(trgm.c.catalog_id)\
+                .where(trgm.c.trigram.in_(grams))\
+                .group_by(trgm.c.catalog_id)\
+                .order_by(func.count().desc())\
+                .limit(self.max_candidates)
+            conditions.append(catalog.c.name_key.startswith(key, autoescape=True))
+            conditions.append(catalog.c.id.in_(shared_trigrams))
+        rows = db.session.execute(
+            db.select(catalog)
+            .where(or_(*conditions))
+            .limit(self.max_candidates * 2 * len(query_grams))
+        ).all()
+        row_grams = [(row, trigrams(row.name_key)) for row in rows]
+
+        matches = {}
+        for key, grams in query_grams.items():
+            best, best_score = None, 0.0
+            for row, candidate_grams in row_grams:
+                score = 1.0 if row.name_key == key else similarity(grams, candidate_grams)
+                if score > best_score:
+                    best, best_score = row, score
+            if best is not None and best_score >= self.threshold:
+                matches[key] = {api_key: getattr(best, column) for column, api_key in NUTRIENT_FIELDS.items()}
+
+        with self._lock:
+            self.hits += len(matches)
+            self.misses += len(query_grams) - len(matches)
+        return {query_string: matches[key] for query_string, key in keys.items() if key in matches}
+
+    def import_rows(self, rows, replace=False, batch_size=1000, progress=None) -> int:
+        '''
+        Bulk load catalog rows (per 100g nutrients) with batched inserts
+
+        Parameters
+        --------------
+        rows: iterable of dict
+            Rows with "name" and FoodItem nutrient columns
+        replace: bool
+            Empty the catalog before loading
+        batch_size: int
+            Rows per executemany/transaction
+        progress: callable
+            Called with the number of rows loaded so far after every batch
+
+        Returns
+        --------------
+        Number of rows loaded
+        '''
+
+        catalog = FoodCatalogItem.__table__
+        trgm = FoodCatalogTrigram.__table__
+
+        if replace:
+            with db.engine.begin() as conn:
+                conn.execute(trgm.delete())
+                conn.execute(catalog.delete())
+
+        loaded = 0
+        batch = {}
+        for row in rows:
+            record = self._to_record(row)
+            batch[record["name_key"]] = record
+            if len(batch) >= batch_size:
+                loaded += self._load_batch(list(batch.values()))
+                batch = {}
+                if progress:
+                    progress(loaded)
+        if batch:
+            loaded += self._load_batch(list(batch.values()))
+            if progress:
+                progress(loaded)
+        return loaded
+
+    def stats(self) -> dict:
+        '''Hit/miss counters of the catalog'''
+
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _to_record(self, row: dict) -> dict:
+        name = (row.get("name") or "").strip()
+        if not name:
+            raise ValueError(f"Catalog row without a name: {row!r}")
+
+        record = {"name": name, "name_key": normalize_query(name)}
+        for column in NUTRIENT_FIELDS:
+            if column == "name":
+                continue
+            value = row.get(column)
+            if column == "serving_size_gram" and value in (None, ""):
+                value = 100.0
+            record[column] = float(value or 0)
+        return record
+
+    def _load_batch(self, records) -> int:
+        catalog = FoodCatalogItem.__table__
+        trgm = FoodCatalogTrigram.__table__
+        keys = [record["name_key"] for record in records]
+
+        with db.engine.begin() as conn:
+            # replace rows already in the catalog
+            existing = db.select(catalog.c.id).where(catalog.c.name_key.in_(keys))
+            conn.execute(trgm.delete().where(trgm.c.catalog_id.in_(existing)))
+            conn.execute(catalog.delete().where(catalog.c.name_key.in_(keys)))
+
+            conn.execute(catalog.insert(), records)
+            ids = conn.execute(
+                db.select(catalog.c.id, catalog.c.name_key).where(catalog.c.name_key.in_(keys))
+            ).all()
+            conn.execute(trgm.insert(), [
+                {"trigram": gram, "catalog_id": row.id}
+                for row in ids
+                for gram in trigrams(row.name_key)
+            ])
+        return len(records)
+
+
+# shared catalog instance (configured in create_app)
+food_catalog = FoodCatalog()
@@ -0,0 +1,100 @@
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from macronizer_cores.metrics.utils import metrics
+
+import random
+import requests
+import time
+
+
+class JitteredRetry(Retry):
+    '''
+    urllib3 Retry with "full jitter" backoff
+    ----------------------------------------------------------------
+    - Sleep a random time between 0 and the exponential backoff so that
+      workers retrying after the same upstream hiccup don't retry in lockstep
+    '''
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+
+
+class NutritionClient(object):
+    '''
+    Shared HTTP client for the CalorieNinjas nutrition API
+    ----------------------------------------------------------------
+    - Keep-alive connection pool reused across requests of the same worker
+    - Connect and read timeouts on every call
+    - Idempotent GETs retried with jittered exponential backoff
+    '''
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, app=None):
+        self.session = None
+        self.url = None
+        self.timeout = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Build the pooled session from the app config'''
+
+        self.url = app.config['NUTRITION_API_URL']
+        self.timeout = (
+            app.config['NUTRITION_API_CONNECT_TIMEOUT'],
+            app.config['NUTRITION_API_READ_TIMEOUT']
+        )
+
+        retry = JitteredRetry(
+            total=app.config['NUTRITION_API_RETRIES'],
+            backoff_factor=app.config['NUTRITION_API_BACKOFF'],
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=app.config['NUTRITION_API_POOL_SIZE'],
+            max_retries=retry
+        )
+
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({'X-Api-Key': app.config['NUTRITION_API_KEY'] or ''})
+
+        # drop the pool of a previous app (tests create several apps per process)
+        if self.session is not None:
+            self.session.close()
+        self.session = session
+
+    def search(self, query_string: str) -> requests.Response:
+        '''
+        Query the nutrition API with a natural language string
+
+        Parameters
+        --------------
+        query_string: str
+            Food search query, e.g. "2 eggs and a cup of rice"
+
+        Returns
+        --------------
+        requests.Response from the API (raises requests.RequestException on
+        timeouts or when retries are exhausted)
+        '''
+
+        started = time.perf_counter()
+        try:
+            response = self.session.get(self.url, params={'query': query_string}, timeout=self.timeout)
+        except requests.RequestException:
+            metrics.observe_upstream("calorieninjas", "error", time.perf_counter() - started)
+            raise
+        metrics.observe_upstream("calorieninjas", response.status_code, time.perf_counter() - started)
+        return response
+
+
+# shared client instance (configured in create_app)
+nutrition_client = NutritionClient()
@@ -0,0 +1,101 @@
+from collections import namedtuple
+from macronizer_cores.food_item_api.cache import normalize_query
+
+import re
+
+
+# one ingredient of a natural language query ("100g rice" -> 100.0, "g", "rice")
+Segment = namedtuple('Segment', ['text', 'quantity', 'unit', 'food'])
+
+
+# grams per mass unit -> these segments only need a per 100g vector to be resolved
+MASS_UNITS = {
+    'mg': 0.001,
+    'g': 1.0,
+    'kg': 1000.0,
+    'oz': 28.3495,
+    'lb': 453.592
+}
+
+# spelling -> canonical unit
+UNIT_ALIASES = {
+    'mg': 'mg', 'milligram': 'mg', 'milligrams': 'mg',
+    'g': 'g', 'gr': 'g', 'gram': 'g', 'grams': 'g',
+    'kg': 'kg', 'kilo': 'kg', 'kilos': 'kg', 'kilogram': 'kg', 'kilograms': 'kg',
+    'oz': 'oz', 'ounce': 'oz', 'ounces': 'oz',
+    'lb': 'lb', 'lbs': 'lb', 'pound': 'lb', 'pounds': 'lb',
+    'ml': 'ml', 'milliliter': 'ml', 'milliliters': 'ml',
+    'l': 'l', 'liter': 'l', 'liters': 'l',
+    'cup': 'cup', 'cups': 'cup',
+    'tbsp': 'tbsp', 'tablespoon': 'tbsp', 'tablespoons': 'tbsp',
+    'tsp': 'tsp', 'teaspoon': 'tsp', 'teaspoons': 'tsp',
+    'slice': 'slice', 'slices': 'slice',
+    'piece': 'piece', 'pieces': 'piece',
+    'serving': 'serving', 'servings': 'serving',
+    'bowl': 'bowl', 'bowls': 'bowl',
+    'glass': 'glass', 'glasses': 'glass'
+}
+
+NUMBER_WORDS = {
+    'a': 1.0, 'an': 1.0, 'one': 1.0, 'two': 2.0, 'three': 3.0, 'four': 4.0,
+    'five': 5.0, 'six': 6.0, 'seven': 7.0, 'eight': 8.0, 'nine': 9.0,
+    'ten': 10.0, 'half': 0.5, 'dozen': 12.0
+}
+
+SEPARATOR_RE = re.compile(r'\s*(?:,|;|&|\+|\band\b)\s*')
+SEGMENT_RE = re.compile(
+    r'^(?P<quantity>\d+(?:\.\d+)?(?:/\d+)?|(?:' + '|'.join(NUMBER_WORDS) + r')\b)?\s*'
+    r'(?:(?P<unit>' + '|'.join(sorted(UNIT_ALIASES, key=len, reverse=True)) + r')\b\.?)?\s*'
+    r'(?:of\s+)?(?P<food>.+)$'
+)
+
+
+def parse_quantity(token: str) -> float:
+    '''Convert "2", "1.5", "1/2" or "two" into a number (None for "1/0")'''
+
+    if token in NUMBER_WORDS:
+        return NUMBER_WORDS[token]
+    if '/' in token:
+        numerator, denominator = token.split('/')
+        if float(denominator) == 0:
+            return None
+        return float(numerator) / float(denominator)
+    return float(token)
+
+
+def parse_query(query_string: str) -> list:
+    '''
+    Split a natural language food query into ingredient segments
+    ----------------------------------------------------------------
+    "2 eggs and 100g rice, an apple" ->
+        Segment("2 eggs", 2.0, None, "eggs")
+        Segment("100g rice", 100.0, "g", "rice")
+        Segment("an apple", 1.0, None, "apple")
+
+    Returns
+    --------------
+    List of Segment (quantity and unit are None when not given)
+    '''
+
+    segments = []
+    for text in SEPARATOR_RE.split(normalize_query(query_string)):
+        if not text:
+            continue
+
+        match = SEGMENT_RE.match(text)
+        quantity = match.group('quantity')
+        unit = match.group('unit')
+        food = match.group('food').strip()
+        quantity = parse_quantity(quantity) if quantity else None
+        # a bare quantity/unit ("a", "2 cups") is not a food, and "1/0" is not a
+        # quantity: keep the raw text as the food
+        if not food or (match.group('quantity') and quantity is None):
+            food, quantity, unit = text, None, None
+
+        segments.append(Segment(
+            text=text,
+            quantity=quantity,
+            unit=UNIT_ALIASES[unit] if unit else None,
+            food=food
+        ))
+    return segments
@@ -1,46 +1,81 @@
-from flask import request, jsonify, Blueprint
-from flask_login import login_required
+from flask import request, jsonify, Blueprint, current_app
+from flask_login import login_required, current_user
 from macronizer_cores import db
-from macronizer_cores.models import FoodItem
-from config import CALORIES_NINJA_API_KEY
+from macronizer_cores.models import FoodItem, Log
+from macronizer_cores.food_item_api.cache import nutrition_cache, ingredient_cache
+from macronizer_cores.food_item_api.catalog import food_catalog, read_catalog_file
+from macronizer_cores.food_item_api.singleflight import upstream_flight
+from macronizer_cores.food_item_api.utils import search_food, NutritionAPIError
+from macronizer_cores.summary_api.utils import totals_of_items, apply_daily_totals
+from macronizer_cores.log_api.versions import bump_log_versions
+from macronizer_cores.metrics.diagnostics import query_budget
 
-import requests
+import click
 
 
 # create blueprint
-food_item_api = Blueprint('food_item_api', __name__)
+food_item_api = Blueprint('food_item_api', __name__, cli_group='food')
 
 
 # SECTION - routes
 @food_item_api.route("/api/food/search")
 @login_required
+@query_budget(6)
 def search_food_item():
     '''
     GET /api/food/search/<string:query_string>
     ----------------------------------------------------------------
     - Search for food in CaloriesNinja using query string from client
+    - Repeat searches are answered from the nutrition cache without calling the API
+    - Each ingredient of the query is resolved from the ingredient cache or the local
+      catalog; only the unresolved ingredients are sent to the API (in one request)
     
     Returns
     --------------
-    List of food items in JSON format
+    List of food items in JSON format, 502 when the API answers with an error
+    and 503 when it can't be reached
     '''
 
-    api_url = 'https://api.calorieninjas.com/v1/nutrition?query='
     query_string = request.args.get('queryString')
-    response = requests.get(api_url + query_string, headers={'X-Api-Key': CALORIES_NINJA_API_KEY})
-    
-    if response.status_code == requests.codes.ok:
-        # json() returns a JSON object of the result -> return payload data to JSON
-        return response.json()
-    else:
-        # TODO - add error handling
-        print("Error:", response.status_code, response.text)
-        res = jsonify({"message": "Request failed"})
-        return res 
+    if not query_string:
+        return ({"message": "Missing query string"}, 400)
+
+    try:
+        return search_food(query_string)
+    except NutritionAPIError as e:
+        current_app.logger.warning("Nutrition API error: %s %s", e.status_code, e.message)
+        if e.status_code is None:
+            # timed out or retries exhausted -> fail fast instead of holding the worker
+            return ({"message": "Nutrition service unavailable"}, 503)
+        # the API answered with an error
+        return ({"message": "Request failed"}, 502)
+
+
+@food_item_api.route("/api/food/cache/stats")
+@login_required
+def show_nutrition_cache_stats():
+    '''
+    GET /api/food/cache/stats
+    ----------------------------------------------------------------
+    - Hit/miss/eviction counters of the nutrition lookup cache
+    - Number of API calls coalesced with an identical call in flight
+
+    Returns
+    --------------
+    Cache counters in JSON format
+    '''
+
+    return jsonify(
+        cache=nutrition_cache.stats(),
+        ingredients=ingredient_cache.stats(),
+        catalog=food_catalog.stats(),
+        coalescing=upstream_flight.stats()
+    )
 
 
 @food_item_api.route("/api/food/delete/<int:food_id>", methods=["DELETE"])
 @login_required
+@query_budget(8)
 def delete_food_item_from_log(food_id):
     '''
     DELETE /api/food/delete/<int:food_id>
@@ -57,8 +92,19 @@ def delete_food_item_from_log(food_id):
     Food item deleted in JSON format and status code 204 
     '''
 
-    item_to_delete = FoodItem.query.get_or_404(food_id)
+    # only an item of the current user's logs (404 otherwise)
+    item_to_delete = FoodItem.query\
+                        .join(Log, FoodItem.log_id == Log.id)\
+                        .filter(
+                            FoodItem.id == food_id,
+                            Log.user_id == current_user.id)\
+                        .first_or_404()
     try:
+        # remove the item from the daily rollup in the same transaction
+        totals = totals_of_items(FoodItem.id == food_id)
+        apply_daily_totals(totals, sign=-1)
+        for user_id, logged_date in totals:
+            bump_log_versions(user_id, [logged_date])
         db.session.delete(item_to_delete)
         db.session.commit()
 
@@ -66,5 +112,27 @@ def delete_food_item_from_log(food_id):
         res = jsonify(log=item_to_delete.serialize())
         return (res, 204)
     except:
+        db.session.rollback()
         res = {"message": "Server Error"}
         return (res, 500)
+
+
+# SECTION - cli commands
+@food_item_api.cli.command("import-catalog")
+@click.argument("path")
+@click.option("--replace", is_flag=True, help="Empty the catalog before loading.")
+@click.option("--batch-size", default=1000, show_default=True)
+def import_food_catalog(path, replace, batch_size):
+    '''
+    flask food import-catalog <path>
+    ----------------------------------------------------------------
+    - Bulk load per 100g nutrient data (CSV, JSON or NDJSON) into the food catalog
+    '''
+
+    loaded = food_catalog.import_rows(
+        read_catalog_file(path),
+        replace=replace,
+        batch_size=batch_size,
+        progress=lambda count: click.echo(f"{count} rows loaded")
+    )
+    click.echo(f"Imported {loaded} catalog rows from {path}")
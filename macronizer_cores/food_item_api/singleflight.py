@@ -0,0 +1,97 @@
+from threading import Event, Lock
+
+
+class _Call(object):
+    '''In-flight call shared by the leader and its waiters'''
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''
+    Coalesce concurrent calls for the same key into a single execution
+    ----------------------------------------------------------------
+    - The first caller (leader) runs the function
+    - Callers arriving while it runs wait for the leader's result (or error)
+      instead of running the function again
+    - Waiters give up with TimeoutError after `timeout` seconds
+    '''
+
+    def __init__(self, app=None, timeout=15.0):
+        self._lock = Lock()
+        self._calls = {}
+        self.timeout = timeout
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Configure the waiter timeout from the app config'''
+
+        with self._lock:
+            self.timeout = app.config['NUTRITION_API_COALESCE_TIMEOUT']
+            self.leaders = 0
+            self.coalesced = 0
+            self.timeouts = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        '''
+        Run fn(*args, **kwargs) unless a call for key is already in flight
+
+        Returns
+        --------------
+        Result of fn (the leader's result for coalesced callers); exceptions
+        raised by the leader are raised in every waiter too
+        '''
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f"Timed out waiting for in-flight call {key!r}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        '''Counters of executed and coalesced calls'''
+
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "timeouts": self.timeouts
+            }
+
+
+# shared instance for nutrition API searches (configured in create_app)
+upstream_flight = SingleFlight()
@@ -0,0 +1,290 @@
+from macronizer_cores.food_item_api.cache import nutrition_cache, ingredient_cache, normalize_query
+from macronizer_cores.food_item_api.catalog import food_catalog
+from macronizer_cores.food_item_api.client import nutrition_client
+from macronizer_cores.food_item_api.parser import parse_query, MASS_UNITS
+from macronizer_cores.food_item_api.singleflight import upstream_flight
+
+import requests
+
+
+# nutrition API item keys that scale with the serving size
+NUTRIENT_KEYS = [
+    "calories",
+    "fat_total_g",
+    "fat_saturated_g",
+    "protein_g",
+    "sodium_mg",
+    "potassium_mg",
+    "cholesterol_mg",
+    "carbohydrates_total_g",
+    "fiber_g",
+    "sugar_g"
+]
+
+
+class NutritionAPIError(Exception):
+    '''
+    Raised when the nutrition API can't answer a search
+    (status_code is None when the API was unreachable or timed out)
+    '''
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def scale_item(name: str, per_100g: dict, grams: float) -> dict:
+    '''
+    Build a nutrition API style item for a serving of the given weight
+    '''
+
+    item = {"name": name, "serving_size_g": round(grams, 1)}
+    for key in NUTRIENT_KEYS:
+        item[key] = round(per_100g.get(key, 0.0) * grams / 100, 1)
+    return item
+
+
+def per_100g_vector(item: dict) -> dict:
+    '''Nutrients of an API style item brought back to 100g (None without serving size)'''
+
+    serving = item.get("serving_size_g")
+    if not serving:
+        return None
+    return {key: item.get(key, 0.0) * 100 / serving for key in NUTRIENT_KEYS}
+
+
+def segment_grams(segment, unit_grams: dict):
+    '''
+    Weight of a segment in grams, or None if the unit weight is unknown
+    ("2 eggs" needs the weight of one egg learned from a previous API answer)
+    '''
+
+    quantity = segment.quantity if segment.quantity is not None else 1.0
+    if segment.unit in MASS_UNITS:
+        return quantity * MASS_UNITS[segment.unit]
+
+    grams_per_unit = unit_grams.get(segment.unit or '')
+    return quantity * grams_per_unit if grams_per_unit else None
+
+
+def catalog_eligible(segment) -> bool:
+    '''
+    Whether the catalog can answer a segment: it only knows weights, so mass
+    units or a bare food name (100g)
+    '''
+
+    return segment.unit in MASS_UNITS or (segment.unit is None and segment.quantity is None)
+
+
+def resolve_segment(segment, entry=None, catalog_item=None):
+    '''
+    Resolve one ingredient locally from its ingredient cache entry, then its
+    catalog item (either may be None)
+
+    Returns
+    --------------
+    Nutrition API style item or None if the API has to be asked
+    '''
+
+    if entry is not None:
+        grams = segment_grams(segment, entry["unit_grams"])
+        if grams is not None:
+            return scale_item(entry["name"], entry["per_100g"], grams)
+
+    if catalog_item is not None and catalog_eligible(segment):
+        grams = segment_grams(segment, {'': catalog_item["serving_size_g"]})
+        return scale_item(catalog_item["name"], per_100g_vector(catalog_item), grams)
+
+    return None
+
+
+def learn_ingredient(segment, item: dict, entry=None):
+    '''
+    Build the ingredient cache entry of an API answer: the per 100g vector and
+    the weight of one unit for count/volume segments, merged into the
+    ingredient's previous entry
+
+    Returns
+    --------------
+    Ingredient cache entry, or None if the item has no serving size
+    '''
+
+    per_100g = per_100g_vector(item)
+    if per_100g is None:
+        return None
+
+    unit_grams = dict(entry["unit_grams"]) if entry else {}
+    if segment.unit not in MASS_UNITS:
+        quantity = segment.quantity if segment.quantity else 1.0
+        unit_grams[segment.unit or ''] = item["serving_size_g"] / quantity
+
+    return {
+        "name": item.get("name", segment.food),
+        "per_100g": per_100g,
+        "unit_grams": unit_grams
+    }
+
+
+class SearchPlan(object):
+    '''
+    Resolution state of a food search query split into ingredient segments
+    ----------------------------------------------------------------
+    - items[i] holds the answer for segments[i] (None until resolved)
+    - only the unresolved segments are sent to the API, in one combined query
+    - the ingredient cache and the catalog are read once for all segments, and
+      the learned ingredients written back in one upsert
+    '''
+
+    def __init__(self, query_string: str):
+        self.query_string = query_string
+        self.segments = parse_query(query_string)
+        self.items = [None] * len(self.segments)
+        self.unmatched_items = []
+        # ingredient cache entries of the segments' foods (read by resolve_locally)
+        self.entries = {}
+
+    @property
+    def missing(self) -> list:
+        '''Indexes of the segments without an answer'''
+
+        return [i for i, item in enumerate(self.items) if item is None]
+
+    @property
+    def upstream_query(self) -> str:
+        '''Combined API query for the unresolved segments'''
+
+        return ' and '.join(self.segments[i].text for i in self.missing)
+
+    def resolve_locally(self):
+        '''Answer every segment that the ingredient cache or the catalog know'''
+
+        self.entries = ingredient_cache.get_many([segment.food for segment in self.segments])
+        for i, segment in enumerate(self.segments):
+            self.items[i] = resolve_segment(segment, self.entries.get(segment.food))
+
+        catalog_foods = [self.segments[i].food for i in self.missing if catalog_eligible(self.segments[i])]
+        if not catalog_foods:
+            return
+        catalog_items = food_catalog.lookup_many(catalog_foods)
+        for i in self.missing:
+            segment = self.segments[i]
+            self.items[i] = resolve_segment(segment, catalog_item=catalog_items.get(segment.food))
+
+    def fill(self, upstream_items: list):
+        '''
+        Assign API items to the unresolved segments and learn them
+
+        The API answers segments in order; if the item count doesn't match we
+        can't tell which item belongs to which segment, so items are returned
+        as they are and nothing is learned
+        '''
+
+        missing = self.missing
+        if len(upstream_items) != len(missing):
+            self.unmatched_items = list(upstream_items)
+            return
+
+        learned = {}
+        for i, item in zip(missing, upstream_items):
+            self.items[i] = item
+            segment = self.segments[i]
+            # a food repeated in the query keeps the unit weights of every segment
+            previous = learned.get(segment.food) or self.entries.get(segment.food)
+            entry = learn_ingredient(segment, item, previous)
+            if entry is not None:
+                learned[segment.food] = entry
+        if learned:
+            ingredient_cache.set_many(learned)
+
+    def payload(self) -> dict:
+        '''Search result in the nutrition API format'''
+
+        items = [item for item in self.items if item is not None]
+        return {"items": items + self.unmatched_items}
+
+
+def fetch_from_api(query_string: str) -> list:
+    '''
+    Search the nutrition API
+
+    Returns
+    --------------
+    List of API items (raises NutritionAPIError on failure)
+    '''
+
+    try:
+        response = nutrition_client.search(query_string)
+    except requests.RequestException as e:
+        raise NutritionAPIError(repr(e)) from e
+
+    if response.status_code != requests.codes.ok:
+        raise NutritionAPIError(response.text, response.status_code)
+    return response.json().get("items", [])
+
+
+def fetch_from_api_coalesced(query_string: str) -> list:
+    '''
+    Search the nutrition API, sharing the call with concurrent identical searches
+    '''
+
+    try:
+        return upstream_flight.do(normalize_query(query_string), fetch_from_api, query_string)
+    except TimeoutError as e:
+        raise NutritionAPIError(str(e)) from e
+
+
+def prepare_search(query_string: str):
+    '''
+    Resolve a food search query without calling the nutrition API
+    ----------------------------------------------------------------
+    1. whole query in the nutrition cache
+    2. each ingredient from the ingredient cache or the food catalog
+
+    Returns
+    --------------
+    (payload, None) when the query is fully resolved, (None, plan) when the
+    plan's upstream_query still has to be sent to the API
+    '''
+
+    cached = nutrition_cache.get(query_string)
+    if cached is not None:
+        return cached, None
+
+    plan = SearchPlan(query_string)
+    plan.resolve_locally()
+    if not plan.missing:
+        return plan.payload(), None
+    return None, plan
+
+
+def complete_search(query_string: str, plan: SearchPlan, upstream_items: list) -> dict:
+    '''
+    Fill a search plan with the API items and cache the result
+    '''
+
+    plan.fill(upstream_items)
+    payload = plan.payload()
+    nutrition_cache.set(query_string, payload)
+    return payload
+
+
+def search_food(query_string: str) -> dict:
+    '''
+    Resolve a food search query
+    ----------------------------------------------------------------
+    1. whole query in the nutrition cache
+    2. each ingredient from the ingredient cache or the food catalog
+    3. remaining ingredients from the nutrition API in a single request
+       (coalesced with identical searches already in flight)
+
+    Returns
+    --------------
+    Search result in the nutrition API format ({"items": [...]})
+    '''
+
+    payload, plan = prepare_search(query_string)
+    if plan is None:
+        return payload
+
+    return complete_search(query_string, plan, fetch_from_api_coalesced(plan.upstream_query))
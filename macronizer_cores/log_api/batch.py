@@ -0,0 +1,191 @@
+from datetime import datetime
+import math
+from macronizer_cores import db
+from macronizer_cores.models import Log, FoodItem
+from macronizer_cores.log_api.utils import FOOD_ITEM_FIELDS, CLIENT_NUTRIENT_FIELDS, build_food_items, upsert_log
+from macronizer_cores.summary_api.utils import sum_items, totals_of_items, apply_daily_totals
+from macronizer_cores.log_api.versions import bump_log_versions
+
+
+# operations accepted by POST /api/log/batch
+BATCH_OPERATIONS = ["add", "move", "delete", "clear_meal", "clear_day"]
+
+
+class BatchError(ValueError):
+    '''
+    Invalid batch operation (reported to the client as a 400)
+    '''
+
+    def __init__(self, index, message):
+        super().__init__(f"operations[{index}]: {message}")
+        self.index = index
+
+
+def check_food_item(index, item_no, item):
+    '''
+    Validate a food item of an add operation (client format: a non-empty name
+    and a finite, non-negative number for every nutrient)
+    '''
+
+    if not isinstance(item, dict):
+        raise BatchError(index, f"food_items[{item_no}] must be an object")
+    name = item.get("name")
+    if not isinstance(name, str) or not name.strip():
+        raise BatchError(index, f"food_items[{item_no}].name can't be empty")
+    for key in CLIENT_NUTRIENT_FIELDS:
+        value = item.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                or not math.isfinite(value) or value < 0:
+            raise BatchError(index, f"food_items[{item_no}].{key} must be a non-negative number")
+
+
+def parse_operation(index, operation) -> dict:
+    '''
+    Validate a batch operation and convert its date/meal no/item ids
+    '''
+
+    if not isinstance(operation, dict) or operation.get("op") not in BATCH_OPERATIONS:
+        raise BatchError(index, f"op must be one of {', '.join(BATCH_OPERATIONS)}")
+
+    op = operation["op"]
+    parsed = {"op": op}
+
+    if op in ("add", "move", "clear_meal", "clear_day"):
+        try:
+            parsed["date"] = datetime.strptime(str(operation.get("date_string")), '%Y-%m-%d').date()
+        except ValueError:
+            raise BatchError(index, "date_string must be in YYYY-MM-DD format")
+
+    if op in ("add", "move", "clear_meal"):
+        try:
+            parsed["meal_no"] = int(operation.get("meal_no"))
+        except (TypeError, ValueError):
+            parsed["meal_no"] = None
+        if parsed["meal_no"] is None or not 1 <= parsed["meal_no"] <= 5:
+            raise BatchError(index, "meal_no must be an integer between 1 and 5")
+
+    if op == "add":
+        food_items = operation.get("food_items")
+        if not isinstance(food_items, list) or not food_items:
+            raise BatchError(index, "food_items must be a non-empty list")
+        for item_no, item in enumerate(food_items):
+            check_food_item(index, item_no, item)
+        parsed["food_items"] = food_items
+
+    if op in ("move", "delete"):
+        item_ids = operation.get("item_ids")
+        if not isinstance(item_ids, list) or not item_ids \
+                or not all(isinstance(item_id, int) for item_id in item_ids):
+            raise BatchError(index, "item_ids must be a non-empty list of ids")
+        parsed["item_ids"] = item_ids
+
+    return parsed
+
+
+def owned_items(user_id, *conditions):
+    '''
+    Condition on food items of the logs of a user (plus extra log conditions)
+    '''
+
+    return FoodItem.log_id.in_(
+        db.select(Log.id).where(Log.user_id == user_id, *conditions)
+    )
+
+
+def remove_items(user_id, *conditions) -> set:
+    '''
+    Take the matching food items out of the daily rollup
+
+    Returns
+    --------------
+    Dates the items were logged on
+    '''
+
+    totals = totals_of_items(Log.user_id == user_id, *conditions)
+    apply_daily_totals(totals, sign=-1)
+    return {logged_date for _, logged_date in totals}
+
+
+def apply_operation(user_id, operation) -> set:
+    '''
+    Apply one parsed batch operation with set based statements (no commit)
+
+    Returns
+    --------------
+    Dates touched by the operation
+    '''
+
+    op = operation["op"]
+    item = FoodItem.__table__
+
+    if op == "add":
+        log_id = upsert_log(user_id, operation["date"], operation["meal_no"])
+        new_items = build_food_items(operation["food_items"], log_id)
+        db.session.execute(
+            item.insert(),
+            [{field: getattr(new_item, field) for field in FOOD_ITEM_FIELDS[1:] + ["log_id"]} for new_item in new_items]
+        )
+        apply_daily_totals({(user_id, operation["date"]): sum_items(new_items)})
+        return {operation["date"]}
+
+    if op == "move":
+        condition = item.c.id.in_(operation["item_ids"])
+        dates = remove_items(user_id, condition)
+        log_id = upsert_log(user_id, operation["date"], operation["meal_no"])
+        db.session.execute(
+            item.update()
+                .where(condition, owned_items(user_id))
+                .values(log_id=log_id)
+        )
+        apply_daily_totals(totals_of_items(item.c.log_id == log_id, condition))
+        return dates | {operation["date"]}
+
+    if op == "delete":
+        condition = item.c.id.in_(operation["item_ids"])
+        dates = remove_items(user_id, condition)
+        db.session.execute(item.delete().where(condition, owned_items(user_id)))
+        return dates
+
+    # clear_meal / clear_day: drop the items and the logs themselves
+    log_conditions = [Log.date == operation["date"]]
+    if op == "clear_meal":
+        log_conditions.append(Log.meal_no == operation["meal_no"])
+
+    remove_items(user_id, *log_conditions)
+    db.session.execute(item.delete().where(owned_items(user_id, *log_conditions)))
+    db.session.execute(
+        Log.__table__.delete().where(Log.user_id == user_id, *log_conditions)
+    )
+    return {operation["date"]}
+
+
+def apply_batch(user_id, operations) -> set:
+    '''
+    Apply a list of batch operations in order, in the current session transaction
+    ----------------------------------------------------------------
+    - Every operation is validated before anything is written
+    - Moves and deletes are single UPDATE/DELETE statements over all their item ids;
+      clearing a meal or a day is one DELETE for the items and one for the logs
+    - Items not owned by the user are ignored
+    - The daily rollup and the log versions are adjusted in the same transaction;
+      the caller commits once
+
+    Parameters
+    --------------
+    user_id: int
+        Owner of the logs
+    operations: list
+        Operation dicts, e.g. {"op": "move", "item_ids": [1, 2], "date_string": "2022-02-01", "meal_no": 2}
+
+    Returns
+    --------------
+    Dates touched by the batch
+    '''
+
+    parsed = [parse_operation(index, operation) for index, operation in enumerate(operations)]
+
+    dates = set()
+    for operation in parsed:
+        dates |= apply_operation(user_id, operation)
+    bump_log_versions(user_id, dates)
+    return dates
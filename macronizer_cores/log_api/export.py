@@ -0,0 +1,99 @@
+from macronizer_cores import db
+from macronizer_cores.models import Log, FoodItem
+from macronizer_cores.log_api.utils import FOOD_ITEM_FIELDS
+
+import csv
+import io
+import json
+
+
+# columns of an exported row (one row per food item)
+EXPORT_FIELDS = ["date", "meal_no", "food_item_id"] + FOOD_ITEM_FIELDS[1:]
+
+EXPORT_MIMETYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+
+
+def export_rows_query(user_id):
+    '''
+    Query for the full meal history of a user, one row per food item in EXPORT_FIELDS order
+    '''
+
+    log = Log.__table__
+    item = FoodItem.__table__
+    return db.select(
+            log.c.date,
+            log.c.meal_no,
+            item.c.id.label("food_item_id"),
+            *[item.c[field] for field in FOOD_ITEM_FIELDS[1:]]
+        )\
+        .select_from(item.join(log, item.c.log_id == log.c.id))\
+        .where(log.c.user_id == user_id)\
+        .order_by(log.c.date, log.c.meal_no, item.c.id)
+
+
+def iter_export_batches(user_id, batch_size=1000):
+    '''
+    Stream the meal history of a user in batches of row tuples
+    ----------------------------------------------------------------
+    - Runs on its own connection with a server side cursor (stream_results),
+      so rows are fetched batch_size at a time and never all held in memory
+    '''
+
+    with db.engine.connect() as conn:
+        result = conn\
+            .execution_options(stream_results=True)\
+            .execute(export_rows_query(user_id))
+        for batch in result.partitions(batch_size):
+            yield batch
+
+
+def format_csv_batch(batch, header=False) -> str:
+    '''Encode a batch of rows as CSV text'''
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for row in batch:
+        writer.writerow([row[0].strftime("%Y-%m-%d"), *row[1:]])
+    return buffer.getvalue()
+
+
+def format_ndjson_batch(batch) -> str:
+    '''Encode a batch of rows as newline delimited JSON'''
+
+    lines = []
+    for row in batch:
+        record = dict(zip(EXPORT_FIELDS, row))
+        record["date"] = record["date"].strftime("%Y-%m-%d")
+        lines.append(json.dumps(record) + "\n")
+    return "".join(lines)
+
+
+def iter_export(user_id, export_format="csv", batch_size=1000):
+    '''
+    Stream the meal history of a user as CSV or NDJSON text chunks
+
+    Parameters
+    --------------
+    user_id: int
+        Owner of the history
+    export_format: str
+        "csv" or "ndjson"
+    batch_size: int
+        Rows fetched from the cursor (and encoded) per chunk
+    '''
+
+    if export_format == "csv":
+        # send the header right away so the download starts before the first fetch
+        yield format_csv_batch([], header=True)
+        for batch in iter_export_batches(user_id, batch_size):
+            yield format_csv_batch(batch)
+    elif export_format == "ndjson":
+        for batch in iter_export_batches(user_id, batch_size):
+            yield format_ndjson_batch(batch)
+    else:
+        raise ValueError(f"Unknown export format {export_format!r}")
@@ -0,0 +1,205 @@
+from collections import defaultdict
+from datetime import datetime
+from macronizer_cores import db
+from macronizer_cores.models import Log, FoodItem
+from macronizer_cores.utils import dialect_insert
+from macronizer_cores.log_api.utils import FOOD_ITEM_FIELDS
+from macronizer_cores.summary_api.utils import TOTAL_FIELDS, apply_daily_totals
+from macronizer_cores.log_api.versions import bump_log_versions
+
+import csv
+import json
+import math
+
+
+# nutrient columns of an imported row (same as the export format)
+NUTRIENT_FIELDS = FOOD_ITEM_FIELDS[2:]
+
+# max number of row errors reported back
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult(object):
+    '''
+    Running counters of a bulk import
+    '''
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, line_no, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "message": message})
+
+    def serialize(self):
+        '''Serialize into dictionary'''
+
+        return {
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "errors": self.errors
+        }
+
+
+def iter_import_rows(text_stream, import_format):
+    '''
+    Stream (line number, row dict) pairs from a CSV or NDJSON text stream
+    (same columns as the export: date, meal_no, name and the nutrient columns)
+    '''
+
+    if import_format == "csv":
+        reader = csv.DictReader(text_stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif import_format == "ndjson":
+        for line_no, line in enumerate(text_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError:
+                yield line_no, None
+    else:
+        raise ValueError(f"Unknown import format {import_format!r}")
+
+
+def validate_row(row) -> dict:
+    '''
+    Convert an imported row into food item values (raise ValueError if invalid)
+    '''
+
+    if not isinstance(row, dict):
+        raise ValueError("Row is not a JSON object")
+
+    try:
+        logged_date = datetime.strptime(str(row.get("date")), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("date must be in YYYY-MM-DD format")
+
+    try:
+        meal_no = int(row.get("meal_no"))
+    except (TypeError, ValueError):
+        meal_no = None
+    if meal_no is None or not 1 <= meal_no <= 5:
+        raise ValueError("meal_no must be an integer between 1 and 5")
+
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise ValueError("name can't be empty")
+
+    record = {"date": logged_date, "meal_no": meal_no, "name": name}
+    for field in NUTRIENT_FIELDS:
+        try:
+            record[field] = float(row.get(field))
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be a number")
+        if not math.isfinite(record[field]):
+            raise ValueError(f"{field} must be a finite number")
+        if record[field] < 0:
+            raise ValueError(f"{field} can't be negative")
+    return record
+
+
+def resolve_log_ids(user_id, keys) -> dict:
+    '''
+    Get (creating the missing ones) the logs of a user for a set of (date, meal_no)
+
+    Returns
+    --------------
+    Dict {(date, meal_no): log id}
+    '''
+
+    table = Log.__table__
+    stmt = dialect_insert(table).values([
+        {"user_id": user_id, "date": logged_date, "meal_no": meal_no}
+        for logged_date, meal_no in keys
+    ])
+    db.session.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "date", "meal_no"]))
+
+    dates = [logged_date for logged_date, _ in keys]
+    rows = db.session.execute(
+        db.select(table.c.id, table.c.date, table.c.meal_no).where(
+            table.c.user_id == user_id,
+            table.c.date.between(min(dates), max(dates))
+        )
+    )
+    return {(row.date, row.meal_no): row.id for row in rows if (row.date, row.meal_no) in keys}
+
+
+def import_chunk(user_id, records):
+    '''
+    Write a chunk of validated records in one transaction
+    ----------------------------------------------------------------
+    - One multi-row upsert for the logs of the chunk
+    - One executemany INSERT for the food items
+    - One upsert for the daily totals and one for the log versions of the chunk
+    '''
+
+    log_ids = resolve_log_ids(user_id, {(record["date"], record["meal_no"]) for record in records})
+
+    items = []
+    totals = defaultdict(lambda: dict.fromkeys(["item_count"] + TOTAL_FIELDS, 0))
+    for record in records:
+        item = {field: record[field] for field in FOOD_ITEM_FIELDS[1:]}
+        item["log_id"] = log_ids[(record["date"], record["meal_no"])]
+        items.append(item)
+
+        day = totals[(user_id, record["date"])]
+        day["item_count"] += 1
+        for field in TOTAL_FIELDS:
+            day[field] += record[field]
+
+    db.session.execute(FoodItem.__table__.insert(), items)
+    apply_daily_totals(dict(totals))
+    bump_log_versions(user_id, [logged_date for _, logged_date in totals])
+    db.session.commit()
+
+
+def import_history(user_id, rows, chunk_size=5000, progress=None) -> ImportResult:
+    '''
+    Bulk import meal history rows for a user
+    ----------------------------------------------------------------
+    - Rows are validated as they are read; invalid rows are skipped and reported
+    - Valid rows are written in chunks of chunk_size, each in its own transaction
+
+    Parameters
+    --------------
+    user_id: int
+        Owner of the imported history
+    rows: iterable
+        (line number, row dict) pairs, see iter_import_rows()
+    chunk_size: int
+        Rows written per transaction
+    progress: callable
+        Called with the ImportResult after every committed chunk
+
+    Returns
+    --------------
+    ImportResult with imported/rejected counts and the first row errors
+    '''
+
+    result = ImportResult()
+    chunk = []
+    for line_no, row in rows:
+        try:
+            chunk.append(validate_row(row))
+        except ValueError as e:
+            result.reject(line_no, str(e))
+            continue
+
+        if len(chunk) >= chunk_size:
+            import_chunk(user_id, chunk)
+            result.imported += len(chunk)
+            chunk = []
+            if progress:
+                progress(result)
+
+    if chunk:
+        import_chunk(user_id, chunk)
+        result.imported += len(chunk)
+        if progress:
+            progress(result)
+    return result
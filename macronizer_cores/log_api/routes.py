@@ -1,22 +1,35 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from macronizer_cores import db
+from macronizer_cores.utils import json_response
 from macronizer_cores.models import Log, FoodItem
-from macronizer_cores.log_api.utils import create_food_log 
+from macronizer_cores.log_api.utils import build_food_items, upsert_log, parse_meal, iter_log_range_json, fetch_log_records
+from macronizer_cores.log_api.export import iter_export, EXPORT_MIMETYPES
+from macronizer_cores.log_api.importer import import_history, iter_import_rows
+from macronizer_cores.log_api.batch import apply_batch, BatchError
+from macronizer_cores.log_api.versions import bump_log_versions, log_etag, conditional_response
+from macronizer_cores.metrics.diagnostics import query_budget
+from macronizer_cores.summary_api.utils import sum_items, totals_of_items, apply_daily_totals
 from datetime import datetime
 
+import click
+import io
+
 
 # create blueprint
-log_api = Blueprint('log_api', __name__)
+log_api = Blueprint('log_api', __name__, cli_group='log')
 
 # SECTION - routes
 @log_api.route("/api/log/search")
 @login_required
+@query_budget(3)
 def search_meals_logged_by_date():
     '''
     GET /api/log/search
     ----------------------------------------------------------------
     - Get all meals for current logged-in user by date
+    - Conditional GET: answered with 304 (no rows read) when If-None-Match
+      matches the version of the date
     
     Returns
     --------------
@@ -27,53 +40,172 @@ def search_meals_logged_by_date():
     date_string = request.args.get('date')
     search_date = datetime.strptime(date_string, '%Y-%m-%d').date()
 
-    # search for meals logged
-    meals = Log.query\
-                .filter(
-                    Log.date == search_date,
-                    Log.user_id == current_user.id)\
-                .all()
+    def build_response():
+        # read logs and food items as plain rows (single query, no ORM objects)
+        meals = fetch_log_records(current_user.id, search_date, search_date)
+
+        # serialize and encode with the fast JSON encoder
+        return json_response({"meals_logged": [meal.serialize() for meal in meals]})
+
+    etag = log_etag("search", current_user.id, search_date, search_date)
+    return conditional_response(etag, build_response)
+
+
+@log_api.route("/api/log/range")
+@login_required
+@query_budget(3)
+def search_meals_logged_by_range():
+    '''
+    GET /api/log/range?start=YYYY-MM-DD&end=YYYY-MM-DD
+    ----------------------------------------------------------------
+    - Get all meals for current logged-in user between two dates (inclusive)
+    - Logs and food items are read with a single query and streamed as they are read
+    - The span is limited to LOG_RANGE_MAX_DAYS days
+    - Conditional GET: answered with 304 (no rows read) when If-None-Match
+      matches the versions of the range
+
+    Returns
+    --------------
+    List of meals in JSON format (same shape as /api/log/search)
+    '''
+
+    # convert query strings to dates
+    try:
+        start_date = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return ({"message": "start and end must be dates in YYYY-MM-DD format"}, 400)
+
+    max_days = current_app.config['LOG_RANGE_MAX_DAYS']
+    if end_date < start_date or (end_date - start_date).days >= max_days:
+        return ({"message": f"Date range must be ordered and span at most {max_days} days"}, 400)
+
+    def build_response():
+        # stream the JSON document while rows are fetched
+        body = iter_log_range_json(current_user.id, start_date, end_date)
+        return Response(stream_with_context(body), mimetype='application/json')
+
+    etag = log_etag("range", current_user.id, start_date, end_date)
+    return conditional_response(etag, build_response)
+
+
+@log_api.route("/api/log/export")
+@login_required
+def export_meal_history():
+    '''
+    GET /api/log/export?format=csv|ndjson
+    ----------------------------------------------------------------
+    - Export the complete meal history of current logged-in user (one row per food item)
+    - Rows are read through a server side cursor and streamed as they arrive
+
+    Returns
+    --------------
+    CSV or NDJSON attachment
+    '''
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_MIMETYPES:
+        return ({"message": "format must be csv or ndjson"}, 400)
+
+    body = iter_export(current_user.id, export_format)
+    filename = f"macronizer-history-{datetime.now():%Y-%m-%d}.{export_format}"
+    return Response(
+        stream_with_context(body),
+        mimetype=EXPORT_MIMETYPES[export_format],
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+@log_api.route("/api/log/import", methods=["POST"])
+@login_required
+def import_meal_history():
+    '''
+    POST /api/log/import (multipart form with a "file" field, ?format=csv|ndjson)
+    ----------------------------------------------------------------
+    - Bulk import meal history in the export format (one row per food item)
+    - Rows are validated while the upload is read and written in chunked transactions
+    - Invalid rows are skipped and reported
 
-    # serialize data
-    meals = [meal.serialize() for meal in meals]
+    Returns
+    --------------
+    Number of imported/rejected rows and the first row errors in JSON format
+    '''
 
-    # return list of meals log in JSON
-    return jsonify(meals_logged=meals)
+    upload = request.files.get('file')
+    if upload is None:
+        return ({"message": "Missing file"}, 400)
+
+    import_format = request.args.get('format')
+    if not import_format:
+        # take the format from the file extension
+        if not upload.filename:
+            return ({"message": "Missing format (file has no name, use ?format=csv|ndjson)"}, 400)
+        import_format = upload.filename.rsplit('.', 1)[-1].lower()
+    if import_format not in EXPORT_MIMETYPES:
+        return ({"message": "format must be csv or ndjson"}, 400)
+
+    user_id = current_user.id
+    rows = iter_import_rows(io.TextIOWrapper(upload.stream, encoding='utf-8', newline=''), import_format)
+    try:
+        result = import_history(
+            user_id,
+            rows,
+            chunk_size=current_app.config['LOG_IMPORT_CHUNK_SIZE'],
+            progress=lambda result: current_app.logger.info(
+                "Import for user %s: %s rows imported, %s rejected", user_id, result.imported, result.rejected
+            )
+        )
+    except:
+        db.session.rollback()
+        res = {"message": "Server Error"}
+        return (res, 500)
+
+    return (jsonify(result.serialize()), 201)
 
 
 @log_api.route("/api/log/new", methods=["POST"])
 @login_required
+@query_budget(15)
 def log_a_meal():
     '''
     POST /api/log/new
     ----------------------------------------------------------------
     - Log a meal for a particular date and meal no
+    - Food items are added to the existing log of that meal if there is one
 
     Returns
     --------------
     List of food items logged for a particular date and meal in JSON format
     '''
     
-    # construct a food log object
+    # construct the food items of the log (date and meal no validated before any write)
     food_list = request.json.get("food_items")
-    meal_no = request.json.get("meal_no")
-    date_string = request.json.get("date_string")
-    new_log = create_food_log(current_user.id, date_string, meal_no, food_list)
-    
     try:
-        db.session.add(new_log)
+        logged_date, meal_no = parse_meal(request.json)
+    except ValueError as e:
+        return ({"message": str(e)}, 400)
+
+    try:
+        log_id = upsert_log(current_user.id, logged_date, meal_no)
+        new_items = build_food_items(food_list, log_id)
+        db.session.add_all(new_items)
+        # keep the daily rollup in the same transaction
+        apply_daily_totals({(current_user.id, logged_date): sum_items(new_items)})
+        bump_log_versions(current_user.id, [logged_date])
         db.session.commit()
 
         # jsonify() turn dict into json format
-        res = jsonify(log=new_log.serialize())
+        res = jsonify(log=Log.query.get(log_id).serialize())
         return (res, 201)
     except:
+        db.session.rollback()
         res = {"message": "Server Error"}
         return (res, 500)
 
 
 @log_api.route("/api/log/update", methods=["PATCH"])
 @login_required
+@query_budget(15)
 def update_meal_log():
     '''
     PATCH /api/log/update
@@ -85,43 +217,123 @@ def update_meal_log():
     List of food items logged for a particular date and meal in JSON format
     '''
 
-    # convert query parameter to date
-    date_string = request.json.get("date_string")
+    # validate the target date and meal no before anything is written
     updated_item_id = request.json.get('updated_item_id')
-    meal_no = request.json.get('meal_no')
-    logged_date = datetime.strptime(date_string, '%Y-%m-%d').date()
-
-    # get the log
-    updated_log = Log\
-        .query\
-        .filter_by(
-            meal_no=meal_no,
-            date=logged_date,
-            user_id=current_user.id)\
-        .first()
-    
-    # get the food item 
-    updated_item = FoodItem.query.get_or_404(updated_item_id)
+    try:
+        logged_date, meal_no = parse_meal(request.json)
+    except ValueError as e:
+        return ({"message": str(e)}, 400)
+
+    # get the food item (only one of the current user's logs, 404 otherwise)
+    updated_item = FoodItem.query\
+                    .join(Log, FoodItem.log_id == Log.id)\
+                    .filter(
+                        FoodItem.id == updated_item_id,
+                        Log.user_id == current_user.id)\
+                    .first_or_404()
 
     try:
-        # create the log if not existed
-        if updated_log is None:
-            updated_log = Log(
-                meal_no=meal_no,
-                date=logged_date,
-                user_id=current_user.id,
-                food_items=[updated_item]
-            )
-            db.session.add(updated_log)
+        # move the item out of the daily rollup of its current date
+        old_totals = totals_of_items(FoodItem.id == updated_item.id)
+        apply_daily_totals(old_totals, sign=-1)
 
-        # reassign food item to correct log
-        updated_item.log_id = updated_log.id
+        # get the log (created if not existed) and reassign food item to it
+        log_id = upsert_log(current_user.id, logged_date, meal_no)
+        updated_item.log_id = log_id
+        apply_daily_totals({(current_user.id, logged_date): sum_items([updated_item])})
+        bump_log_versions(current_user.id, [old_date for _, old_date in old_totals] + [logged_date])
         db.session.commit()
 
         # jsonify() turn dict into json format
-        res = jsonify(log=updated_log.serialize())
+        res = jsonify(log=Log.query.get(log_id).serialize())
         return (res, 201)
     except:
+        db.session.rollback()
         res = {"message": "Server Error"}
         return (res, 500)
 
+
+@log_api.route("/api/log/batch", methods=["POST"])
+@login_required
+def apply_log_batch():
+    '''
+    POST /api/log/batch
+    ----------------------------------------------------------------
+    - Apply a list of add/move/delete/clear_meal/clear_day operations in one transaction
+    - Either every operation is applied or none is
+
+    Returns
+    --------------
+    List of meals of every date touched by the batch in JSON format
+    '''
+
+    operations = (request.json or {}).get("operations")
+    max_operations = current_app.config['LOG_BATCH_MAX_OPERATIONS']
+    if not isinstance(operations, list) or not 0 < len(operations) <= max_operations:
+        return ({"message": f"operations must be a list of 1 to {max_operations} operations"}, 400)
+
+    user_id = current_user.id
+    try:
+        dates = apply_batch(user_id, operations)
+        db.session.commit()
+    except BatchError as e:
+        db.session.rollback()
+        return ({"message": str(e)}, 400)
+    except:
+        db.session.rollback()
+        res = {"message": "Server Error"}
+        return (res, 500)
+
+    # logs of the touched dates (food items are loaded in one extra query)
+    meals = Log.query\
+                .filter(
+                    Log.date.in_(dates),
+                    Log.user_id == user_id)\
+                .order_by(Log.date, Log.meal_no)\
+                .all()
+
+    return jsonify(meals_logged=[meal.serialize() for meal in meals])
+
+
+# SECTION - cli commands
+@log_api.cli.command("export")
+@click.option("--user-id", type=int, required=True)
+@click.option("--format", "export_format", type=click.Choice(list(EXPORT_MIMETYPES)), default="csv", show_default=True)
+@click.option("--output", type=click.File("w"), default="-", help="Output file (stdout by default).")
+@click.option("--batch-size", default=1000, show_default=True)
+def export_meal_history_command(user_id, export_format, output, batch_size):
+    '''
+    flask log export --user-id ID [--format csv|ndjson] [--output FILE]
+    ----------------------------------------------------------------
+    - Export the complete meal history of a user with a server side cursor
+    '''
+
+    for chunk in iter_export(user_id, export_format, batch_size):
+        output.write(chunk)
+    output.flush()
+
+
+@log_api.cli.command("import")
+@click.option("--user-id", type=int, required=True)
+@click.option("--format", "import_format", type=click.Choice(list(EXPORT_MIMETYPES)), default=None, help="Defaults to the file extension.")
+@click.option("--chunk-size", default=5000, show_default=True)
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+def import_meal_history_command(user_id, import_format, chunk_size, path):
+    '''
+    flask log import --user-id ID <path>
+    ----------------------------------------------------------------
+    - Bulk import meal history (CSV or NDJSON, export format) with batched inserts
+    '''
+
+    import_format = import_format or path.rsplit('.', 1)[-1].lower()
+    with open(path, newline='', encoding='utf-8') as f:
+        result = import_history(
+            user_id,
+            iter_import_rows(f, import_format),
+            chunk_size=chunk_size,
+            progress=lambda result: click.echo(f"{result.imported} rows imported, {result.rejected} rejected")
+        )
+
+    for error in result.errors:
+        click.echo(f"line {error['line']}: {error['message']}", err=True)
+    click.echo(f"Imported {result.imported} rows ({result.rejected} rejected) from {path}")
@@ -1,38 +1,215 @@
+from collections import namedtuple
 from datetime import datetime
+from macronizer_cores import db
 from macronizer_cores.models import Log, FoodItem
+from macronizer_cores.utils import dialect_insert, supports_returning, dumps_json
 
-def create_food_log(user_id, date_string, meal_no, item_list) -> Log:
+
+# FoodItem columns in the order of FoodItem.serialize()
+FOOD_ITEM_FIELDS = [
+    "id",
+    "name",
+    "sugar_gram",
+    "fiber_gram",
+    "serving_size_gram",
+    "sodium_mg",
+    "potassium_mg",
+    "fat_saturation_gram",
+    "fat_total_gram",
+    "calories",
+    "cholesterol_mg",
+    "protein_gram",
+    "carbohydrate_gram"
+]
+
+# plain record of a food item row (fields in FOOD_ITEM_FIELDS order)
+FoodItemRecord = namedtuple("FoodItemRecord", FOOD_ITEM_FIELDS)
+
+
+class LogRecord(object):
     '''
-    Helper method to construct a food log object from date string, meal number, and
-    food items list
+    Read-only log built from plain column tuples (no ORM instance, no identity map)
     '''
 
-    # convert query parameter to date
-    logged_date = datetime.strptime(date_string, '%Y-%m-%d').date()
+    __slots__ = ("id", "meal_no", "date", "user_id", "food_items")
+
+    def __init__(self, id, meal_no, date, user_id):
+        self.id = id
+        self.meal_no = meal_no
+        self.date = date
+        self.user_id = user_id
+        self.food_items = []
+
+    def serialize(self):
+        '''Serialize into a dictionary (same shape as Log.serialize())'''
+
+        return {
+            "id": self.id,
+            "meal_no": self.meal_no,
+            "date": self.date.strftime("%Y-%m-%d"),
+            "user_id": self.user_id,
+            "food_items": [item._asdict() for item in self.food_items]
+        }
+
+
+# food item key sent by the client (nutrition.js) -> FoodItem nutrient column
+CLIENT_NUTRIENT_FIELDS = {
+    "sugar": "sugar_gram",
+    "fiber": "fiber_gram",
+    "servingSize": "serving_size_gram",
+    "sodium": "sodium_mg",
+    "potassium": "potassium_mg",
+    "saturatedFat": "fat_saturation_gram",
+    "totalFat": "fat_total_gram",
+    "calories": "calories",
+    "cholesterol": "cholesterol_mg",
+    "protein": "protein_gram",
+    "carbohydrate": "carbohydrate_gram"
+}
+
+
+def build_food_items(item_list, log_id=None) -> list:
+    '''
+    Helper method to convert food item json (client format) into FoodItem objects
+    '''
 
-    # convert food item json into FoodItem object
     food_list = []
     for item in item_list:
         new_item = FoodItem(
             name=item.get("name"),
-            sugar_gram = item.get("sugar"),
-            fiber_gram = item.get("fiber"),
-            serving_size_gram = item.get("servingSize"),
-            sodium_mg = item.get("sodium"),
-            potassium_mg = item.get("potassium"),
-            fat_saturation_gram = item.get("saturatedFat"),
-            fat_total_gram = item.get("totalFat"),
-            calories = item.get("calories"),
-            cholesterol_mg = item.get("cholesterol"),
-            protein_gram = item.get("protein"),
-            carbohydrate_gram = item.get("carbohydrate")
+            log_id=log_id,
+            **{column: item.get(key) for key, column in CLIENT_NUTRIENT_FIELDS.items()}
         )
         food_list.append(new_item)
-    
-    # return new Log object
-    return Log(
-        meal_no=meal_no,
-        date=logged_date,
-        user_id=user_id,
-        food_items=food_list
-    )
\ No newline at end of file
+    return food_list
+
+
+def parse_meal(payload) -> tuple:
+    '''
+    Date and meal no of a log write request ("date_string" and "meal_no" keys)
+
+    Returns
+    --------------
+    (date, meal no), raises ValueError with a client message if either is invalid
+    '''
+
+    try:
+        logged_date = datetime.strptime(str(payload.get("date_string")), '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("date_string must be in YYYY-MM-DD format")
+
+    try:
+        meal_no = int(payload.get("meal_no"))
+    except (TypeError, ValueError):
+        meal_no = None
+    if meal_no is None or not 1 <= meal_no <= 5:
+        raise ValueError("meal_no must be an integer between 1 and 5")
+    return logged_date, meal_no
+
+
+def upsert_log(user_id, logged_date, meal_no) -> int:
+    '''
+    Get the id of the log for (user, date, meal no), creating it if needed
+    ----------------------------------------------------------------
+    - INSERT ... ON CONFLICT on the (user_id, date, meal_no) unique constraint,
+      so concurrent requests can't create duplicate logs
+    - Runs in the current session transaction
+
+    Returns
+    --------------
+    Id of the log
+    '''
+
+    table = Log.__table__
+    conflict_columns = ['user_id', 'date', 'meal_no']
+    stmt = dialect_insert(table).values(user_id=user_id, date=logged_date, meal_no=meal_no)
+
+    if supports_returning():
+        # no-op update so the existing row id is returned by the same statement
+        stmt = stmt\
+            .on_conflict_do_update(index_elements=conflict_columns, set_={'meal_no': stmt.excluded.meal_no})\
+            .returning(table.c.id)
+        return db.session.execute(stmt).scalar_one()
+
+    db.session.execute(stmt.on_conflict_do_nothing(index_elements=conflict_columns))
+    return db.session.execute(
+        db.select(table.c.id).where(
+            table.c.user_id == user_id,
+            table.c.date == logged_date,
+            table.c.meal_no == meal_no
+        )
+    ).scalar_one()
+
+
+def log_rows_query(user_id, start_date, end_date):
+    '''
+    Single query for the logs of a user in a date range joined with their food items
+    ----------------------------------------------------------------
+    - One row per food item (log columns repeated), one row with NULL items for an empty log
+    - Ordered by date, meal no and item id so rows of a log are contiguous
+    '''
+
+    log = Log.__table__
+    item = FoodItem.__table__
+    return db.select(
+            log.c.id.label("log_id"),
+            log.c.meal_no,
+            log.c.date,
+            log.c.user_id,
+            *[item.c[field].label(f"item_{field}") for field in FOOD_ITEM_FIELDS]
+        )\
+        .select_from(log.outerjoin(item, item.c.log_id == log.c.id))\
+        .where(
+            log.c.user_id == user_id,
+            log.c.date.between(start_date, end_date))\
+        .order_by(log.c.date, log.c.meal_no, item.c.id)
+
+
+def group_log_rows(rows):
+    '''
+    Fold joined log/item rows into LogRecord objects, one log at a time
+    '''
+
+    current = None
+    for row in rows:
+        if current is None or current.id != row[0]:
+            if current is not None:
+                yield current
+            current = LogRecord(*row[:4])
+        if row[4] is not None:
+            # item columns follow the 4 log columns (see log_rows_query)
+            current.food_items.append(FoodItemRecord._make(row[4:]))
+    if current is not None:
+        yield current
+
+
+def fetch_log_records(user_id, start_date, end_date) -> list:
+    '''
+    Logs of a user in a date range as LogRecord objects (one Core query, no ORM hydration)
+    '''
+
+    rows = db.session.execute(log_rows_query(user_id, start_date, end_date))
+    return list(group_log_rows(rows))
+
+
+def iter_log_range_json(user_id, start_date, end_date, batch_size=500):
+    '''
+    Stream {"meals_logged": [...]} for a date range as JSON chunks
+    ----------------------------------------------------------------
+    - Rows are fetched from a server side cursor in batches and each log is
+      encoded as soon as its last item is read, so memory stays flat
+    '''
+
+    result = db.session.execute(
+        log_rows_query(user_id, start_date, end_date),
+        execution_options={"stream_results": True}
+    )
+    try:
+        yield b'{"meals_logged":['
+        separator = b''
+        for log in group_log_rows(result.yield_per(batch_size)):
+            yield separator + dumps_json(log.serialize())
+            separator = b','
+        yield b']}'
+    finally:
+        result.close()
@@ -0,0 +1,105 @@
+from flask import request, current_app, make_response
+from sqlalchemy import func
+from macronizer_cores import db
+from macronizer_cores.models import LogVersion
+from macronizer_cores.utils import dialect_insert
+
+
+# cache policy of the log reads: stored by the browser only, revalidated with the ETag every time
+LOG_CACHE_POLICY = "private, no-cache"
+
+
+def bump_log_versions(user_id, dates):
+    '''
+    Increment the log version of a user for every date written
+    ----------------------------------------------------------------
+    - Single INSERT ... ON CONFLICT DO UPDATE SET version = version + 1
+    - Runs in the current session transaction (commits with the log write)
+
+    Parameters
+    --------------
+    user_id: int
+        Owner of the logs
+    dates: iterable
+        Dates whose logs or food items changed
+    '''
+
+    dates = set(dates)
+    if not dates:
+        return
+
+    table = LogVersion.__table__
+    stmt = dialect_insert(table).values([
+        {"user_id": user_id, "date": logged_date, "version": 1}
+        for logged_date in dates
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "date"],
+        set_={"version": table.c.version + 1}
+    )
+    db.session.execute(stmt)
+
+
+def bump_all_log_versions(user_id=None):
+    '''Increment every log version (of one user if user_id is given)'''
+
+    table = LogVersion.__table__
+    stmt = table.update().values(version=table.c.version + 1)
+    if user_id is not None:
+        stmt = stmt.where(table.c.user_id == user_id)
+    db.session.execute(stmt)
+
+
+def log_etag(kind, user_id, start_date, end_date) -> str:
+    '''
+    Strong ETag of a log read for a user and a date range
+    ----------------------------------------------------------------
+    - Versions only ever increase, so their sum changes with every write in the range
+    - Reads the (user_id, date) primary key of log_versions only, no log rows
+
+    Parameters
+    --------------
+    kind: str
+        Name of the representation (search, range, summary)
+    '''
+
+    table = LogVersion.__table__
+    total = db.session.execute(
+        db.select(func.coalesce(func.sum(table.c.version), 0)).where(
+            table.c.user_id == user_id,
+            table.c.date.between(start_date, end_date)
+        )
+    ).scalar_one()
+    return f"{kind}-{user_id}-{start_date:%Y%m%d}-{end_date:%Y%m%d}-{total}"
+
+
+def conditional_response(etag, build_response):
+    '''
+    Answer a conditional GET from its ETag
+    ----------------------------------------------------------------
+    - 304 without calling build_response when If-None-Match matches
+    - Otherwise the built response, tagged with the ETag
+    - Both get the private, revalidating log cache policy
+
+    Parameters
+    --------------
+    etag: str
+        ETag of the current representation (see log_etag())
+    build_response: callable
+        Builds the full response
+
+    Returns
+    --------------
+    Response
+    '''
+
+    # weak comparison: compressed responses carry the weak form of the ETag
+    if request.if_none_match.contains_weak(etag):
+        res = current_app.response_class(status=304)
+    else:
+        res = make_response(build_response())
+
+    res.set_etag(etag)
+    res.headers["Cache-Control"] = LOG_CACHE_POLICY
+    res.vary.add("Cookie")
+    return res
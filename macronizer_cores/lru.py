@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from threading import Lock
+import time
+
+
+class LRUCache(object):
+    '''
+    Thread-safe in-process LRU cache with a time-to-live on every entry
+    ----------------------------------------------------------------
+    - Least recently used entries are evicted once maxsize is reached
+    - Expired entries are dropped lazily when they are looked up
+    - Hit/miss/eviction/expiration counters are kept for tuning
+    '''
+
+    def __init__(self, maxsize=1024, ttl=3600):
+        self._lock = Lock()
+        self._data = OrderedDict()
+        self.configure(maxsize, ttl)
+
+    def configure(self, maxsize, ttl):
+        '''
+        Resize the cache and reset its content and counters
+
+        Parameters
+        --------------
+        maxsize: int
+            Maximum number of entries held in memory
+        ttl: float
+            Number of seconds an entry stays valid
+        '''
+
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+
+    def get(self, key):
+        '''
+        Return the cached value for key or None on a miss
+        '''
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        '''
+        Store value under key, evicting the least recently used entries if full
+        '''
+
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        '''
+        Drop a single entry from the cache
+        '''
+
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        '''
+        Drop every entry but keep the counters
+        '''
+
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        '''
+        Snapshot of the cache counters
+        '''
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -1,5 +1,6 @@
-from flask import render_template, Blueprint
+from flask import render_template, Blueprint, jsonify
 from flask_login import login_required
+from macronizer_cores.db_pool import pool_metrics
 
 
 # create blueprint
@@ -38,3 +39,19 @@ def show_user_profile():
     '''
 
     return render_template('content/profile.html')
+
+
+@main.route('/api/db/pool/stats')
+@login_required
+def show_db_pool_stats():
+    '''
+    GET /api/db/pool/stats
+    ----------------------------------------------------------------
+    - Connections in use and checkout wait times of the db pool (per worker)
+
+    Returns
+    --------------
+    Pool counters in JSON format
+    '''
+
+    return jsonify(pool=pool_metrics.stats())
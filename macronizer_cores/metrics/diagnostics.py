@@ -0,0 +1,182 @@
+from collections import Counter
+from flask import g, request, current_app, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from macronizer_cores.metrics.utils import metrics
+
+import re
+import time
+
+
+# literals and placeholder lists collapsed when comparing statements
+_SHAPE_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+"), "?"),
+    (re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)"), "(?)"),
+    (re.compile(r"\s+"), " ")
+)
+# statements EXPLAIN can be run on without side effects
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+class QueryBudgetExceeded(AssertionError):
+    '''
+    Raised (QUERY_BUDGET_RAISE) when a request runs more SQL statements than its budget
+    '''
+
+
+def statement_shape(statement: str) -> str:
+    '''
+    Statement with its literals and IN lists collapsed
+    ("... WHERE log_id IN (?, ?, ?)" and "... IN (?)" have the same shape)
+    '''
+
+    for pattern, replacement in _SHAPE_PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def query_budget(limit: int):
+    '''
+    Decorator setting the max number of SQL statements of a view
+    (overrides QUERY_BUDGET for that endpoint)
+    '''
+
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+def explain(cursor, dialect, statement, parameters) -> list:
+    '''
+    Query plan of a statement, run on a plain DBAPI cursor so it is not
+    itself recorded by the cursor events
+
+    Returns
+    --------------
+    List of plan lines, empty if the statement can't be explained
+    '''
+
+    if not _EXPLAINABLE.match(statement):
+        return []
+    prefix = "EXPLAIN QUERY PLAN " if dialect.name == "sqlite" else "EXPLAIN "
+
+    cursor = cursor.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+    except Exception as e:
+        return ["EXPLAIN failed: {!r}".format(e)]
+    finally:
+        cursor.close()
+
+
+class QueryDiagnostics(object):
+    '''
+    Slow-query log and N+1 detector on SQLAlchemy cursor events
+    ----------------------------------------------------------------
+    - Statements slower than SLOW_QUERY_THRESHOLD_MS are logged with their
+      parameters, the endpoint and the EXPLAIN plan
+    - A statement shape run N_PLUS_ONE_THRESHOLD times or more in one request
+      (lazy loads in a loop) is logged as a suspected N+1
+    - A request running more statements than its budget (QUERY_BUDGET or
+      @query_budget on the view) is logged, or fails with QueryBudgetExceeded
+      when QUERY_BUDGET_RAISE is set (tests)
+    - Statements run while a streamed body is sent (/api/log/range, /api/log/export)
+      come after the response hooks and are not counted in the request
+    - Off unless QUERY_DIAGNOSTICS is set
+    '''
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.slow_threshold = 0.2
+        self.explain = True
+        self.n_plus_one_threshold = 5
+        self.budget = None
+        self.budget_raise = False
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Register the request hooks and SQL events'''
+
+        self.enabled = app.config['QUERY_DIAGNOSTICS']
+        if not self.enabled:
+            return
+
+        self.slow_threshold = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000
+        self.explain = app.config['SLOW_QUERY_EXPLAIN']
+        self.n_plus_one_threshold = app.config['N_PLUS_ONE_THRESHOLD']
+        self.budget = app.config['QUERY_BUDGET']
+        self.budget_raise = app.config['QUERY_BUDGET_RAISE']
+
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    def _start_request(self):
+        g._query_shapes = Counter()
+
+    def _end_request(self, response):
+        shapes = g.pop('_query_shapes', None)
+        if shapes is None:
+            return response
+        endpoint = request.endpoint or "none"
+
+        for shape, count in shapes.items():
+            if count >= self.n_plus_one_threshold:
+                metrics.inc("sql_n_plus_one_total", {"endpoint": endpoint})
+                current_app.logger.warning(
+                    "Suspected N+1 in %s: statement run %d times: %s", endpoint, count, shape
+                )
+
+        view = current_app.view_functions.get(request.endpoint)
+        budget = getattr(view, "query_budget", self.budget)
+        statements = sum(shapes.values())
+        if budget is not None and statements > budget:
+            message = "{} {} ran {} SQL statements (budget {})".format(request.method, endpoint, statements, budget)
+            if self.budget_raise:
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
+
+    def record(self, conn, cursor, statement, parameters, executemany, seconds):
+        '''Check a finished statement'''
+
+        if has_request_context() and '_query_shapes' in g:
+            g._query_shapes[statement_shape(statement)] += 1
+
+        if seconds < self.slow_threshold or not has_app_context():
+            return
+        plan = []
+        if self.explain and not executemany:
+            plan = explain(cursor, conn.dialect, statement, parameters)
+        current_app.logger.warning(
+            "Slow query (%.1f ms) in %s: %s\nParameters: %.500r\nPlan:\n%s",
+            seconds * 1000,
+            request.endpoint if has_request_context() else "none",
+            statement,
+            parameters,
+            "\n".join(plan) or "-"
+        )
+
+
+# SECTION - SQL events
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['_diagnostics_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('_diagnostics_started', None)
+    if started is None or not query_diagnostics.enabled:
+        return
+    query_diagnostics.record(conn, cursor, statement, parameters, executemany, time.perf_counter() - started)
+
+
+# instantiate the extension
+query_diagnostics = QueryDiagnostics()
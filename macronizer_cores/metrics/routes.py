@@ -0,0 +1,41 @@
+from flask import Blueprint, Response, request, current_app, abort
+from macronizer_cores.metrics.utils import metrics
+
+import hmac
+
+
+# clients allowed to scrape without METRICS_TOKEN
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+
+# create blueprint
+metrics_api = Blueprint('metrics_api', __name__)
+
+
+# SECTION - routes
+@metrics_api.route("/metrics")
+def show_metrics():
+    '''
+    GET /metrics
+    ----------------------------------------------------------------
+    - Request latency, SQL and upstream metrics of every worker for Prometheus
+    - When METRICS_TOKEN is set the scraper must send "Authorization: Bearer <token>",
+      without it only local clients are answered (403 otherwise)
+
+    Returns
+    --------------
+    Metrics in the Prometheus text format
+    '''
+
+    token = current_app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), "Bearer " + token):
+        abort(401)
+    if not token and request.remote_addr not in LOCAL_ADDRESSES:
+        abort(403)
+    if not metrics.enabled:
+        abort(404)
+
+    response = Response(metrics.render(), mimetype="text/plain")
+    response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+    response.headers["Cache-Control"] = "no-store"
+    return response
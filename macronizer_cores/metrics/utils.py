@@ -0,0 +1,413 @@
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Lock
+
+import glob
+import json
+import os
+import time
+
+
+# histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+METRIC_PREFIX = "macronizer_"
+# help text of every metric (also fixes the exposition order)
+HELP = {
+    "http_requests_total": "HTTP requests by endpoint and status",
+    "http_request_duration_seconds": "HTTP request latency",
+    "sql_statements_per_request": "SQL statements executed by one HTTP request",
+    "sql_statement_duration_seconds": "SQL statement execution time",
+    "sql_n_plus_one_total": "Requests with a statement repeated N_PLUS_ONE_THRESHOLD times or more",
+    "upstream_requests_total": "Calls to upstream APIs by status",
+    "upstream_request_duration_seconds": "Upstream API call latency (retries included)",
+    "db_pool_checkouts_total": "Connections checked out of the pool",
+    "db_pool_checkout_timeouts_total": "Checkouts that timed out waiting for a connection",
+    "db_pool_checkout_wait_seconds_total": "Time spent waiting for a pool connection",
+    "db_pool_forked_connections_total": "Connections inherited across a fork and discarded",
+    "user_cache_hits_total": "User loader cache hits",
+    "user_cache_misses_total": "User loader cache misses",
+    "nutrition_cache_memory_hits_total": "Nutrition cache hits in memory",
+    "nutrition_cache_memory_misses_total": "Nutrition cache misses in memory",
+    "nutrition_cache_db_hits_total": "Nutrition cache hits in the db",
+    "nutrition_cache_db_misses_total": "Nutrition cache misses in the db",
+    "upstream_calls_coalesced_total": "Nutrition API calls shared with an identical call in flight",
+    "password_hashes_rejected_total": "Password hashes rejected because the hashing pool was full"
+}
+HISTOGRAMS = (
+    "http_request_duration_seconds",
+    "sql_statements_per_request",
+    "sql_statement_duration_seconds",
+    "upstream_request_duration_seconds"
+)
+# file of the samples of exited workers (merged by mark_process_dead)
+EXITED_WORKERS_FILE = "worker_exited.json"
+
+
+def process_counters() -> dict:
+    '''
+    Counters of the process-wide extensions (connection pool, caches,
+    password hashing pool), as {metric name: value}
+    '''
+
+    from macronizer_cores.db_pool import pool_metrics
+    from macronizer_cores.auth.cache import user_cache
+    from macronizer_cores.auth.hashing import password_hasher
+    from macronizer_cores.food_item_api.cache import nutrition_cache
+    from macronizer_cores.food_item_api.singleflight import upstream_flight
+
+    pool = pool_metrics.stats()
+    users = user_cache.stats()
+    nutrition = nutrition_cache.stats()
+    return {
+        "db_pool_checkouts_total": pool["checkouts"],
+        "db_pool_checkout_timeouts_total": pool["timeouts"],
+        "db_pool_checkout_wait_seconds_total": pool["wait_seconds_total"],
+        "db_pool_forked_connections_total": pool["forked_connections"],
+        "user_cache_hits_total": users["hits"],
+        "user_cache_misses_total": users["misses"],
+        "nutrition_cache_memory_hits_total": nutrition["memory"]["hits"],
+        "nutrition_cache_memory_misses_total": nutrition["memory"]["misses"],
+        "nutrition_cache_db_hits_total": nutrition["db"]["hits"],
+        "nutrition_cache_db_misses_total": nutrition["db"]["misses"],
+        "upstream_calls_coalesced_total": upstream_flight.stats()["coalesced"],
+        "password_hashes_rejected_total": password_hasher.stats()["rejected"]
+    }
+
+
+def process_gauges() -> dict:
+    '''Current state of the connection pool, as {metric name: value}'''
+
+    from macronizer_cores.db_pool import pool_metrics
+
+    pool = pool_metrics.stats()
+    return {
+        "db_pool_connections_in_use": pool["in_use"],
+        "db_pool_connections_idle": pool["idle"]
+    }
+
+
+def merge_snapshot(counters: dict, histograms: dict, snapshot: dict):
+    '''Add the counters and histograms of a worker snapshot to the totals'''
+
+    for name, labels, value in snapshot["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, h in snapshot["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        merged = histograms.setdefault(key, {"buckets": h["buckets"], "counts": [0] * len(h["buckets"]), "sum": 0, "count": 0})
+        merged["counts"] = [a + b for a, b in zip(merged["counts"], h["counts"])]
+        merged["sum"] += h["sum"]
+        merged["count"] += h["count"]
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics(object):
+    '''
+    Request, SQL and upstream instrumentation with a Prometheus endpoint
+    ----------------------------------------------------------------
+    - before/after_request hooks time every request by blueprint and endpoint
+        and count the SQL statements it ran (SQLAlchemy cursor events)
+    - The nutrition API clients report the latency and status of their calls
+    - Samples live in the worker; with METRICS_DIR set every worker writes them
+        to its own file (every METRICS_FLUSH_INTERVAL seconds) and /metrics adds
+        up the files of all workers, so a scrape served by any worker sees them all
+    - The directory must be emptied when the server starts (gunicorn on_starting)
+        and the file of an exited worker merged with mark_process_dead (child_exit)
+    '''
+
+    def __init__(self, app=None):
+        self._lock = Lock()
+        self.enabled = False
+        self.directory = None
+        self.flush_interval = 5
+        self._last_flush = 0.0
+        self.reset()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        '''Register the request hooks and SQL events'''
+
+        self.enabled = app.config['METRICS_ENABLED']
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        if not self.enabled:
+            return
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    def reset(self):
+        '''Drop every sample of the process'''
+
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    # SECTION - recording
+    def inc(self, name, labels, value=1):
+        '''Increase a counter'''
+
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        '''Add a value to a histogram'''
+
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0, "count": 0}
+            for i, bound in enumerate(histogram["buckets"]):
+                if value <= bound:
+                    histogram["counts"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def observe_request(self, blueprint, endpoint, method, status, seconds, statements=None):
+        '''Record a finished HTTP request'''
+
+        if not self.enabled:
+            return
+        labels = {"blueprint": blueprint or "", "endpoint": endpoint or "none", "method": method}
+        self.inc("http_requests_total", dict(labels, status=status))
+        self.observe("http_request_duration_seconds", labels, seconds)
+        if statements is not None:
+            self.observe(
+                "sql_statements_per_request",
+                {"blueprint": labels["blueprint"], "endpoint": labels["endpoint"]},
+                statements,
+                QUERY_COUNT_BUCKETS
+            )
+        self.maybe_flush()
+
+    def observe_upstream(self, upstream, status, seconds):
+        '''Record a call to an upstream API (status is the HTTP status or "error")'''
+
+        if not self.enabled:
+            return
+        self.inc("upstream_requests_total", {"upstream": upstream, "status": status})
+        self.observe("upstream_request_duration_seconds", {"upstream": upstream}, seconds)
+
+    def _start_request(self):
+        g._metrics_started = time.perf_counter()
+        g._metrics_statements = 0
+
+    def _end_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            self.observe_request(
+                request.blueprint,
+                request.endpoint,
+                request.method,
+                response.status_code,
+                time.perf_counter() - started,
+                g.pop('_metrics_statements', 0)
+            )
+        return response
+
+    # SECTION - multi-process aggregation
+    def snapshot(self) -> dict:
+        '''Samples of the process in a JSON-friendly format'''
+
+        with self._lock:
+            counters = [[name, labels, value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, labels, dict(h, counts=list(h["counts"]))] for (name, labels), h in self._histograms.items()]
+        counters.extend([name, [], value] for name, value in process_counters().items())
+        return {"pid": os.getpid(), "counters": counters, "histograms": histograms, "gauges": process_gauges()}
+
+    def flush(self):
+        '''Write the samples of the process to its file in METRICS_DIR'''
+
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, "worker_{}.json".format(os.getpid()))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        # atomic, a concurrent scrape never reads a partial file
+        os.replace(tmp_path, path)
+        self._last_flush = time.monotonic()
+
+    def maybe_flush(self):
+        '''Flush when the last flush is older than METRICS_FLUSH_INTERVAL'''
+
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def collect(self) -> list:
+        '''Snapshots of every worker (only this process without METRICS_DIR)'''
+
+        if not self.directory:
+            return [self.snapshot()]
+
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "worker_*.json")):
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        # a worker merged into the exited workers file but not removed yet
+        exited = {pid for snapshot in snapshots for pid in snapshot.get("exited_pids", [])}
+        return [snapshot for snapshot in snapshots if snapshot["pid"] not in exited]
+
+    def render(self) -> str:
+        '''
+        All samples in the Prometheus text format
+        ----------------------------------------------------------------
+        - Counters and histograms are summed over every worker that ever wrote
+            (samples of exited workers are kept, so counters never go back)
+        - Gauges are summed over the workers still running
+        '''
+
+        counters = {}
+        histograms = {}
+        gauges = {}
+        for snapshot in self.collect():
+            merge_snapshot(counters, histograms, snapshot)
+            if snapshot["gauges"] and _process_alive(snapshot["pid"]):
+                for name, value in snapshot["gauges"].items():
+                    gauges[name] = gauges.get(name, 0) + value
+
+        lines = []
+        for name, help_text in HELP.items():
+            kind = "histogram" if name in HISTOGRAMS else "counter"
+            lines.append("# HELP {}{} {}".format(METRIC_PREFIX, name, help_text))
+            lines.append("# TYPE {}{} {}".format(METRIC_PREFIX, name, kind))
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append("{}{}{} {}".format(METRIC_PREFIX, name, _format_labels(labels), _format_value(value)))
+                continue
+            for (metric, labels), h in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(h["buckets"], h["counts"]):
+                    lines.append("{}{}_bucket{} {}".format(METRIC_PREFIX, name, _format_labels(labels, [("le", _format_value(bound))]), count))
+                lines.append("{}{}_bucket{} {}".format(METRIC_PREFIX, name, _format_labels(labels, [("le", "+Inf")]), h["count"]))
+                lines.append("{}{}_sum{} {}".format(METRIC_PREFIX, name, _format_labels(labels), _format_value(h["sum"])))
+                lines.append("{}{}_count{} {}".format(METRIC_PREFIX, name, _format_labels(labels), h["count"]))
+
+        for name, value in sorted(gauges.items()):
+            lines.append("# TYPE {}{} gauge".format(METRIC_PREFIX, name))
+            lines.append("{}{} {}".format(METRIC_PREFIX, name, _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+def _process_alive(pid) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def clear_metrics_dir(directory):
+    '''Remove the worker files of a previous server run'''
+
+    for path in glob.glob(os.path.join(directory, "worker_*.json*")):
+        os.remove(path)
+
+
+def mark_process_dead(directory, pid):
+    '''
+    Merge the counters and histograms of an exited worker into the exited
+    workers file and remove its own file (its gauges are dropped)
+
+    Called in the gunicorn master only (child_exit), one worker at a time
+    '''
+
+    path = os.path.join(directory, "worker_{}.json".format(pid))
+    exited_path = os.path.join(directory, EXITED_WORKERS_FILE)
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+
+    counters = {}
+    histograms = {}
+    pids = []
+    try:
+        with open(exited_path) as f:
+            exited = json.load(f)
+        merge_snapshot(counters, histograms, exited)
+        # pids of files already removed are no longer needed
+        pids = [old for old in exited["exited_pids"] if os.path.exists(os.path.join(directory, "worker_{}.json".format(old)))]
+    except (OSError, ValueError):
+        pass
+    merge_snapshot(counters, histograms, snapshot)
+
+    tmp_path = exited_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "pid": None,
+            "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+            "histograms": [[name, labels, h] for (name, labels), h in histograms.items()],
+            "gauges": {},
+            # collect() skips these worker files until they are removed
+            "exited_pids": pids + [pid]
+        }, f)
+    os.replace(tmp_path, exited_path)
+    os.remove(path)
+
+
+# SECTION - SQL events
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['_metrics_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop('_metrics_started', None)
+    if started is None or not metrics.enabled:
+        return
+    seconds = time.perf_counter() - started
+
+    if has_request_context():
+        g._metrics_statements = g.get('_metrics_statements', 0) + 1
+        labels = {"blueprint": request.blueprint or "", "endpoint": request.endpoint or "none"}
+    else:
+        labels = {"blueprint": "", "endpoint": "none"}
+    metrics.observe("sql_statement_duration_seconds", labels, seconds)
+
+
+# instantiate the extension
+metrics = Metrics()
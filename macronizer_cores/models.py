@@ -1,6 +1,8 @@
+from datetime import datetime
 from sqlalchemy import CheckConstraint
 from flask_login import UserMixin
-from macronizer_cores import db,bcrypt, login
+from macronizer_cores import db, login
+from macronizer_cores.auth.hashing import password_hasher, HashingBusyError
 
 
 # SECTION models
@@ -53,8 +55,8 @@ class User(UserMixin, db.Model):
         Tuple containing username and password
         '''
 
-        # hash password and convert into UNICODE string
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('utf-8')
+        # hash password (in the bounded hashing pool) as UNICODE string
+        hashed_pwd = password_hasher.hash(password)
 
         # return tuple contaning username and password
         return (username, hashed_pwd)
@@ -76,11 +78,21 @@ class User(UserMixin, db.Model):
         --------------
         If authentication succeeds, return User object
         Else, return false
+        - The stored hash is upgraded when it was made with another work factor
+          than BCRYPT_LOG_ROUNDS
+        - Raise HashingBusyError when the hashing pool is full
         '''
 
         user = User.query.filter(User.username == username).first()
 
-        if user and bcrypt.check_password_hash(user.password, password):
+        if user and password_hasher.check(user.password, password):
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(password)
+                    db.session.commit()
+                except HashingBusyError:
+                    # keep the old hash, it's upgraded on a later login
+                    db.session.rollback()
             return user
         else:
             return False
@@ -98,7 +110,11 @@ class User(UserMixin, db.Model):
 
 @login.user_loader
 def load_user(user_id) -> User:
-    return User.query.get(int(user_id))
+    # NOTE - served from the per-worker user cache, the users table is only
+    # queried on a miss
+    from macronizer_cores.auth.cache import user_cache
+
+    return user_cache.load(User, int(user_id))
 
 class Log(db.Model):
     '''
@@ -122,11 +138,26 @@ class Log(db.Model):
         nullable=False
     )
 
+    # NOTE - the unique constraint is backed by a (user_id, date, meal_no) index that
+    # serves every "logs of a user for a date" lookup and the upsert in log_api
+    __table_args__ = (
+        db.UniqueConstraint(
+            'user_id',
+            'date',
+            'meal_no',
+            name='uq_meal_logs_user_date_meal'
+        ),
+    )
+
     # relationship
+    # NOTE - selectin loads the items of every log in a query with one extra
+    # SELECT ... WHERE log_id IN (...) instead of one lazy SELECT per log (N+1)
     food_items = db.relationship(
         "FoodItem",
         backref="meal",
-        passive_deletes=True
+        passive_deletes=True,
+        lazy="selectin",
+        order_by="FoodItem.id"
     )
 
     # method
@@ -173,7 +204,8 @@ class FoodItem(db.Model):
     log_id = db.Column(
         db.Integer,
         db.ForeignKey("meal_logs.id", ondelete="cascade"),
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     # method
@@ -196,3 +228,142 @@ class FoodItem(db.Model):
             "carbohydrate_gram": self.carbohydrate_gram
         }
     
+
+
+class NutritionCacheEntry(db.Model):
+    '''
+    Model for persisted nutrition API responses (second tier of the lookup cache)
+    '''
+
+    __tablename__ = 'nutrition_cache'
+
+    query_key = db.Column(db.Text, primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow
+    )
+
+    def __repr__(self):
+        return f"<NutritionCacheEntry {self.query_key!r}>"
+
+
+class FoodCatalogItem(db.Model):
+    '''
+    Model for the local food catalog (nutrients per 100g, same fields as FoodItem)
+    '''
+
+    __tablename__ = 'food_catalog'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True
+    )
+    name = db.Column(db.Text, nullable=False)
+    # normalized name used for exact and prefix lookups
+    name_key = db.Column(db.Text, nullable=False, unique=True)
+    sugar_gram = db.Column(db.Float, nullable=False)
+    fiber_gram = db.Column(db.Float, nullable=False)
+    serving_size_gram = db.Column(db.Float, nullable=False, default=100.0)
+    sodium_mg = db.Column(db.Float, nullable=False)
+    potassium_mg = db.Column(db.Float, nullable=False)
+    fat_saturation_gram = db.Column(db.Float, nullable=False)
+    fat_total_gram = db.Column(db.Float, nullable=False)
+    calories = db.Column(db.Float, nullable=False)
+    cholesterol_mg = db.Column(db.Float, nullable=False)
+    protein_gram = db.Column(db.Float, nullable=False)
+    carbohydrate_gram = db.Column(db.Float, nullable=False)
+
+    # NOTE - text_pattern_ops lets Postgres use the index for LIKE 'prefix%' under any collation
+    __table_args__ = (
+        db.Index(
+            'ix_food_catalog_name_key_prefix',
+            'name_key',
+            postgresql_ops={'name_key': 'text_pattern_ops'}
+        ),
+    )
+
+    def __repr__(self):
+        return f"<FoodCatalogItem #{self.id}: {self.name}>"
+
+
+class FoodCatalogTrigram(db.Model):
+    '''
+    Model for the trigram index of the food catalog (fuzzy name lookup)
+    '''
+
+    __tablename__ = 'food_catalog_trigrams'
+
+    trigram = db.Column(db.String(3), primary_key=True)
+    catalog_id = db.Column(
+        db.Integer,
+        db.ForeignKey("food_catalog.id", ondelete="cascade"),
+        primary_key=True,
+        index=True
+    )
+
+
+class DailyTotal(db.Model):
+    '''
+    Model for the daily nutrient totals of a user (rollup of food_items kept up to date by log writes)
+    '''
+
+    __tablename__ = 'daily_totals'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.id", ondelete="cascade"),
+        primary_key=True
+    )
+    date = db.Column(db.Date, primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    sugar_gram = db.Column(db.Float, nullable=False, default=0)
+    fiber_gram = db.Column(db.Float, nullable=False, default=0)
+    serving_size_gram = db.Column(db.Float, nullable=False, default=0)
+    sodium_mg = db.Column(db.Float, nullable=False, default=0)
+    potassium_mg = db.Column(db.Float, nullable=False, default=0)
+    fat_saturation_gram = db.Column(db.Float, nullable=False, default=0)
+    fat_total_gram = db.Column(db.Float, nullable=False, default=0)
+    calories = db.Column(db.Float, nullable=False, default=0)
+    cholesterol_mg = db.Column(db.Float, nullable=False, default=0)
+    protein_gram = db.Column(db.Float, nullable=False, default=0)
+    carbohydrate_gram = db.Column(db.Float, nullable=False, default=0)
+
+    # method
+    def serialize(self):
+        '''Serialize into dictionary'''
+
+        return {
+            "date": self.date.strftime("%Y-%m-%d"),
+            "item_count": self.item_count,
+            "sugar_gram": round(self.sugar_gram, 2),
+            "fiber_gram": round(self.fiber_gram, 2),
+            "serving_size_gram": round(self.serving_size_gram, 2),
+            "sodium_mg": round(self.sodium_mg, 2),
+            "potassium_mg": round(self.potassium_mg, 2),
+            "fat_saturation_gram": round(self.fat_saturation_gram, 2),
+            "fat_total_gram": round(self.fat_total_gram, 2),
+            "calories": round(self.calories, 2),
+            "cholesterol_mg": round(self.cholesterol_mg, 2),
+            "protein_gram": round(self.protein_gram, 2),
+            "carbohydrate_gram": round(self.carbohydrate_gram, 2)
+        }
+
+
+class LogVersion(db.Model):
+    '''
+    Model for the version counter of the logs of a user for a date
+    (bumped by every log write, used to build ETags of the log reads)
+    '''
+
+    __tablename__ = 'log_versions'
+
+    user_id = db.Column(
+        db.Integer,
+        db.ForeignKey("users.id", ondelete="cascade"),
+        primary_key=True
+    )
+    date = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
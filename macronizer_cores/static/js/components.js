@@ -39,12 +39,20 @@ async function handleDeleteFoodItem(e) {
   // get food id
   const foodId = e.target.parentNode.parentNode.id;
 
-  // make API call to DELETE food item
-  await FoodItem.deleteFoodItem(foodId);
+  // make API call to delete food item, the response holds the meals of its date
+  const meals = await Log.applyBatch([
+    { op: "delete", item_ids: [Number(foodId)] },
+  ]);
+
+  // nothing came back (request failed or item already gone) -> reload page
+  if (!meals || !meals.length) {
+    handleLoadLog();
+    return;
+  }
 
-  // reload page to reflect changes
-  // TODO - refactor to make individual changes
-  handleLoadLog();
+  // redraw the meals of the day
+  clearMealList();
+  addMealsToPage(meals);
 }
 
 // Show the delete icon on hover
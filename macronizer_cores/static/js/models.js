@@ -161,6 +161,29 @@ class Log {
       console.debug(e);
     }
   }
+
+  /*******************************************************************************
+   * - POST request to apply several log changes in one request/transaction      *
+   * @param {Object[]} operations - e.g. { op: "move", item_ids: [1, 2],          *
+   *   date_string: "2022-02-01", meal_no: 2 }; op is one of add, move, delete,  *
+   *   clear_meal, clear_day                                                     *
+   * @return {Log[]} - meals of every date touched by the operations             *
+   *******************************************************************************/
+  static async applyBatch(operations) {
+    try {
+      const endpoint = `${API_LOG_URL}/batch`;
+      const res = await axios.post(endpoint, { operations: operations });
+
+      // convert list of json data list of object
+      const mealsLoggedList = res.data.meals_logged.map(
+        (log) =>
+          new Log(log.id, log.meal_no, log.date, log.user_id, log.food_items)
+      );
+      return mealsLoggedList;
+    } catch (e) {
+      console.debug(e);
+    }
+  }
 }
 
 /********************
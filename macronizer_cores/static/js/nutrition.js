@@ -168,7 +168,14 @@ async function handleDropOnEmptyMeal(e) {
   const mealNo = e.target.nextElementSibling.dataset.mealNo;
 
   // make API call
-  await Log.updateLoggedMeal(mealNo, dateString, foodItemId);
+  await Log.applyBatch([
+    {
+      op: "move",
+      item_ids: [Number(foodItemId)],
+      date_string: dateString,
+      meal_no: Number(mealNo),
+    },
+  ]);
 
   // display the draggable element
   draggable.classList.remove("hide");
@@ -0,0 +1,73 @@
+from flask import Blueprint, jsonify, request, current_app
+from flask_login import login_required, current_user
+from macronizer_cores.models import DailyTotal
+from macronizer_cores.summary_api.utils import rebuild_daily_totals, TOTAL_FIELDS
+from macronizer_cores.log_api.versions import log_etag, conditional_response
+from datetime import datetime
+
+import click
+
+
+# create blueprint
+summary_api = Blueprint('summary_api', __name__, cli_group='summary')
+
+
+# SECTION - routes
+@summary_api.route("/api/summary")
+@login_required
+def show_summary():
+    '''
+    GET /api/summary?start=YYYY-MM-DD&end=YYYY-MM-DD
+    ----------------------------------------------------------------
+    - Get nutrient totals per day for current logged-in user between two dates (inclusive)
+    - Reads only the daily_totals rollup (one indexed range scan)
+    - Conditional GET: answered with 304 when If-None-Match matches the log versions of the range
+
+    Returns
+    --------------
+    Daily totals and totals of the whole range in JSON format
+    '''
+
+    # convert query strings to dates
+    try:
+        start_date = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return ({"message": "start and end must be dates in YYYY-MM-DD format"}, 400)
+
+    max_days = current_app.config['SUMMARY_MAX_DAYS']
+    if end_date < start_date or (end_date - start_date).days >= max_days:
+        return ({"message": f"Date range must be ordered and span at most {max_days} days"}, 400)
+
+    def build_response():
+        days = DailyTotal.query\
+                    .filter(
+                        DailyTotal.user_id == current_user.id,
+                        DailyTotal.date.between(start_date, end_date),
+                        DailyTotal.item_count > 0)\
+                    .order_by(DailyTotal.date)\
+                    .all()
+        days = [day.serialize() for day in days]
+
+        # totals of the whole range
+        totals = {field: round(sum(day[field] for day in days), 2) for field in TOTAL_FIELDS}
+        totals["item_count"] = sum(day["item_count"] for day in days)
+
+        return jsonify(daily_totals=days, totals=totals)
+
+    etag = log_etag("summary", current_user.id, start_date, end_date)
+    return conditional_response(etag, build_response)
+
+
+# SECTION - cli commands
+@summary_api.cli.command("rebuild")
+@click.option("--user-id", type=int, default=None, help="Only rebuild this user.")
+def rebuild_summary(user_id):
+    '''
+    flask summary rebuild [--user-id ID]
+    ----------------------------------------------------------------
+    - Recompute the daily_totals rollup from food_items (backfill)
+    '''
+
+    count = rebuild_daily_totals(user_id)
+    click.echo(f"Rebuilt {count} daily totals")
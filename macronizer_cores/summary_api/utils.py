@@ -0,0 +1,140 @@
+from sqlalchemy import func
+from macronizer_cores import db
+from macronizer_cores.models import Log, FoodItem, DailyTotal
+from macronizer_cores.utils import dialect_insert
+from macronizer_cores.log_api.versions import bump_all_log_versions
+
+
+# FoodItem columns summed into daily_totals
+TOTAL_FIELDS = [
+    "sugar_gram",
+    "fiber_gram",
+    "serving_size_gram",
+    "sodium_mg",
+    "potassium_mg",
+    "fat_saturation_gram",
+    "fat_total_gram",
+    "calories",
+    "cholesterol_mg",
+    "protein_gram",
+    "carbohydrate_gram"
+]
+
+
+def sum_items(items) -> dict:
+    '''
+    Totals of a list of FoodItem objects (not yet flushed items included)
+    '''
+
+    totals = dict.fromkeys(TOTAL_FIELDS, 0.0)
+    totals["item_count"] = 0
+    for item in items:
+        totals["item_count"] += 1
+        for field in TOTAL_FIELDS:
+            totals[field] += getattr(item, field) or 0.0
+    return totals
+
+
+def totals_of_items(*conditions) -> dict:
+    '''
+    Totals of the stored food items matching conditions, grouped by log owner and date
+
+    Returns
+    --------------
+    Dict {(user_id, date): totals}
+    '''
+
+    log = Log.__table__
+    item = FoodItem.__table__
+    rows = db.session.execute(
+        db.select(
+            log.c.user_id,
+            log.c.date,
+            func.count(item.c.id).label("item_count"),
+            *[func.sum(item.c[field]).label(field) for field in TOTAL_FIELDS]
+        )
+        .select_from(item.join(log, item.c.log_id == log.c.id))
+        .where(*conditions)
+        .group_by(log.c.user_id, log.c.date)
+    ).all()
+
+    return {
+        (row.user_id, row.date): {key: value for key, value in row._mapping.items() if key not in ("user_id", "date")}
+        for row in rows
+    }
+
+
+def apply_daily_totals(totals: dict, sign=1):
+    '''
+    Add (sign=1) or subtract (sign=-1) totals to the daily_totals rows
+    ----------------------------------------------------------------
+    - Single INSERT ... ON CONFLICT DO UPDATE SET col = col + excluded.col
+    - Runs in the current session transaction, so the rollup commits (or rolls
+      back) together with the food item changes; the row lock taken by the
+      upsert serializes concurrent writers of the same day
+
+    Parameters
+    --------------
+    totals: dict
+        {(user_id, date): totals} as returned by totals_of_items()
+    sign: int
+        1 when items are added to the days, -1 when they are removed
+    '''
+
+    if not totals:
+        return
+
+    table = DailyTotal.__table__
+    columns = ["item_count"] + TOTAL_FIELDS
+    rows = [
+        dict(user_id=user_id, date=logged_date, **{column: sign * (values[column] or 0) for column in columns})
+        for (user_id, logged_date), values in totals.items()
+    ]
+
+    stmt = dialect_insert(table).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["user_id", "date"],
+        set_={column: table.c[column] + stmt.excluded[column] for column in columns}
+    )
+    db.session.execute(stmt)
+
+
+def rebuild_daily_totals(user_id=None) -> int:
+    '''
+    Recompute daily_totals from food_items (backfill / drift repair)
+
+    Parameters
+    --------------
+    user_id: int
+        Only rebuild this user (every user if None)
+
+    Returns
+    --------------
+    Number of daily_totals rows written
+    '''
+
+    table = DailyTotal.__table__
+    log = Log.__table__
+    item = FoodItem.__table__
+
+    delete = table.delete()
+    aggregate = db.select(
+            log.c.user_id,
+            log.c.date,
+            func.count(item.c.id),
+            *[func.coalesce(func.sum(item.c[field]), 0) for field in TOTAL_FIELDS]
+        )\
+        .select_from(item.join(log, item.c.log_id == log.c.id))\
+        .group_by(log.c.user_id, log.c.date)
+    if user_id is not None:
+        delete = delete.where(table.c.user_id == user_id)
+        aggregate = aggregate.where(log.c.user_id == user_id)
+
+    db.session.execute(delete)
+    result = db.session.execute(
+        table.insert().from_select(["user_id", "date", "item_count"] + TOTAL_FIELDS, aggregate)
+    )
+    # totals may have changed without a log write, invalidate cached summaries
+    bump_all_log_versions(user_id)
+    db.session.commit()
+    return result.rowcount
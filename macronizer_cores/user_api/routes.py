@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, flash
 from flask_login import login_required, current_user
 from macronizer_cores import db
 from macronizer_cores.models import User
+from macronizer_cores.auth.cache import user_cache
 user_api = Blueprint('user_api', __name__)
 
 # SECTION - routes
@@ -25,6 +26,8 @@ def update_user():
         user_to_edit.username = request.json.get('username')
 
         db.session.commit()
+        # drop the cached copy so the next request sees the changes
+        user_cache.invalidate(user_to_edit.id)
 
         res = jsonify(user=user_to_edit.serialize())
         flash('Your changes have been saved', 'success')
@@ -33,4 +36,20 @@ def update_user():
         res = {"message": "Can't update user"}
         return (res, 500)
 
+
+@user_api.route('/api/user/cache/stats')
+@login_required
+def show_user_cache_stats():
+    '''
+    GET /api/user/cache/stats
+    ----------------------------------------------------------------
+    Hit/miss counters of the logged-in user cache (per worker)
+
+    Returns
+    ----------------
+    Cache counters in JSON format
+    '''
+
+    return jsonify(cache=user_cache.stats())
+
     
\ No newline at end of file
@@ -0,0 +1,77 @@
+from flask import current_app
+from macronizer_cores import db
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def dialect_insert(table):
+    '''
+    Build an INSERT for the dialect of the current db
+    ----------------------------------------------------------------
+    - The PostgreSQL and SQLite inserts support ON CONFLICT
+      (on_conflict_do_update / on_conflict_do_nothing)
+
+    Parameters
+    --------------
+    table: Table
+        Table to insert into
+
+    Returns
+    --------------
+    Dialect specific Insert construct
+    '''
+
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"ON CONFLICT upserts are not supported on {dialect}")
+
+    return insert(table)
+
+
+def supports_returning() -> bool:
+    '''Whether INSERT ... RETURNING can be used on the current db'''
+
+    return db.engine.dialect.name == 'postgresql'
+
+
+def dumps_json(obj) -> bytes:
+    '''
+    Encode obj as compact UTF-8 JSON
+    ----------------------------------------------------------------
+    - Uses orjson when it is installed, the stdlib encoder otherwise
+    '''
+
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(obj, status=200):
+    '''
+    Build a JSON response encoded with dumps_json()
+    ----------------------------------------------------------------
+    - Fast alternative to jsonify() for large read responses
+      (Flask 2.0 has no pluggable JSON provider)
+
+    Parameters
+    --------------
+    obj: dict | list
+        JSON serializable data (plain dicts, lists, str, numbers)
+    status: int
+        Response status code
+
+    Returns
+    --------------
+    Response with an application/json body
+    '''
+
+    return current_app.response_class(dumps_json(obj), status=status, mimetype="application/json")
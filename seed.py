@@ -1,8 +1,332 @@
-from macronizer_cores import create_app
-from macronizer_cores import db
+'''
+Create the tables and optionally fill them with synthetic data
+----------------------------------------------------------------
+- N users with M days of meal logs and food items, generated from a seed
+  (same seed and options -> same rows; the logs end on --end-date, 2022-12-31
+  by default, not on the current day)
+- Rows are written in chunks with COPY on PostgreSQL and executemany on
+  other databases, then daily_totals is rebuilt from the food items
+- Every generated user has the password PASSWORD ("password123")
 
-app = create_app()
+Usage
+--------------
+python seed.py                                      # drop and recreate the tables
+python seed.py --users 10000 --days 365 [--seed 42] [--end-date 2022-12-31] [--append]
+'''
 
-with app.app_context():
-    db.drop_all()
-    db.create_all()
\ No newline at end of file
+from datetime import date, timedelta
+from sqlalchemy import func
+from macronizer_cores import create_app, db
+from macronizer_cores.models import User, Log
+from macronizer_cores.auth.hashing import password_hasher
+from macronizer_cores.summary_api.utils import rebuild_daily_totals
+
+import click
+import csv
+import io
+import random
+import time
+
+
+PASSWORD = "password123"
+# last logged day unless --end-date is given (fixed, so a seed gives the same rows on any day)
+DEFAULT_END_DATE = date(2022, 12, 31)
+
+# name, serving sizes (g) and nutrients per 100 g: sugar, fiber, sodium, potassium,
+# saturated fat, total fat, calories, cholesterol, protein, carbohydrate
+FOODS = [
+    ("oatmeal", (40, 80), (1.0, 10.1, 6, 362, 1.2, 6.9, 379, 0, 13.2, 67.7)),
+    ("eggs", (50, 100, 150), (0.4, 0, 124, 138, 3.1, 9.5, 143, 372, 12.6, 0.7)),
+    ("whole wheat toast", (30, 60), (4.4, 6.0, 455, 248, 0.6, 3.5, 252, 0, 12.5, 43.1)),
+    ("banana", (120,), (12.2, 2.6, 1, 358, 0.1, 0.3, 89, 0, 1.1, 22.8)),
+    ("greek yogurt", (150, 200), (3.2, 0, 36, 141, 0.1, 0.4, 59, 5, 10.3, 3.6)),
+    ("blueberries", (75, 150), (10.0, 2.4, 1, 77, 0, 0.3, 57, 0, 0.7, 14.5)),
+    ("coffee with milk", (240,), (1.1, 0, 10, 90, 0.4, 0.7, 11, 2, 0.6, 1.1)),
+    ("orange juice", (250,), (8.4, 0.2, 1, 200, 0, 0.2, 45, 0, 0.7, 10.4)),
+    ("chicken breast", (100, 150, 200), (0, 0, 74, 256, 1.0, 3.6, 165, 85, 31.0, 0)),
+    ("white rice", (150, 200, 300), (0.1, 0.4, 1, 35, 0.1, 0.3, 130, 0, 2.7, 28.2)),
+    ("brown rice", (150, 200), (0.4, 1.8, 5, 43, 0.2, 0.9, 112, 0, 2.3, 23.5)),
+    ("broccoli", (90, 150), (1.7, 2.6, 33, 316, 0.1, 0.4, 34, 0, 2.8, 6.6)),
+    ("salmon", (120, 170), (0, 0, 59, 363, 3.1, 13.4, 208, 55, 20.4, 0)),
+    ("sweet potato", (130, 200), (4.2, 3.0, 55, 337, 0, 0.1, 86, 0, 1.6, 20.1)),
+    ("black beans", (130, 170), (0.3, 8.7, 1, 355, 0.1, 0.5, 132, 0, 8.9, 23.7)),
+    ("ground beef", (113, 150), (0, 0, 72, 318, 5.9, 15.0, 250, 90, 26.0, 0)),
+    ("pasta", (140, 200), (0.6, 1.8, 1, 44, 0.2, 0.9, 158, 0, 5.8, 30.9)),
+    ("tomato sauce", (60, 125), (4.8, 1.5, 474, 297, 0, 0.3, 29, 0, 1.2, 6.0)),
+    ("mixed salad", (85, 150), (1.2, 1.3, 28, 194, 0, 0.2, 15, 0, 1.2, 2.9)),
+    ("olive oil", (5, 14), (0, 0, 2, 1, 13.8, 100.0, 884, 0, 0, 0)),
+    ("cheddar cheese", (20, 30), (0.5, 0, 621, 98, 19.0, 33.3, 403, 105, 24.9, 1.3)),
+    ("turkey sandwich", (180, 250), (3.1, 2.0, 480, 200, 1.5, 5.2, 210, 25, 13.5, 24.0)),
+    ("tofu", (100, 150), (0.6, 0.3, 7, 121, 0.7, 4.8, 76, 0, 8.1, 1.9)),
+    ("pizza", (107, 214), (3.6, 2.3, 598, 172, 4.5, 10.4, 266, 17, 11.4, 33.3)),
+    ("apple", (150, 180), (10.4, 2.4, 1, 107, 0, 0.2, 52, 0, 0.3, 13.8)),
+    ("almonds", (28, 40), (4.4, 12.5, 1, 733, 3.8, 49.9, 579, 0, 21.2, 21.6)),
+    ("protein bar", (60,), (20.0, 8.0, 300, 300, 5.0, 12.0, 380, 10, 33.0, 35.0)),
+    ("dark chocolate", (20, 40), (24.0, 10.9, 20, 715, 24.5, 42.6, 598, 3, 7.8, 45.9)),
+    ("potato chips", (28,), (0.3, 4.4, 525, 1275, 3.1, 34.6, 536, 0, 7.0, 52.9)),
+    ("milk", (240,), (5.1, 0, 43, 150, 1.9, 3.3, 61, 10, 3.2, 4.8))
+]
+# foods picked for each meal (1 breakfast, 2 lunch, 3 dinner, 4-5 snacks)
+MEAL_FOODS = {
+    1: [0, 1, 2, 3, 4, 5, 6, 7, 29],
+    2: [8, 9, 10, 11, 14, 18, 19, 20, 21, 22, 23],
+    3: [8, 9, 11, 12, 13, 15, 16, 17, 18, 19, 22, 23],
+    4: [3, 4, 24, 25, 26, 27, 28],
+    5: [4, 24, 25, 26, 27, 29]
+}
+# probability that a user logs a meal on a given day
+MEAL_PROBABILITY = {1: 0.85, 2: 0.9, 3: 0.95, 4: 0.5, 5: 0.3}
+
+USER_COLUMNS = ["id", "name", "email", "username", "password"]
+LOG_COLUMNS = ["id", "meal_no", "date", "user_id"]
+ITEM_COLUMNS = [
+    "name",
+    "sugar_gram",
+    "fiber_gram",
+    "serving_size_gram",
+    "sodium_mg",
+    "potassium_mg",
+    "fat_saturation_gram",
+    "fat_total_gram",
+    "calories",
+    "cholesterol_mg",
+    "protein_gram",
+    "carbohydrate_gram",
+    "log_id"
+]
+
+
+# SECTION - bulk writers
+class CopyWriter(object):
+    '''Write rows with COPY ... FROM STDIN (PostgreSQL, psycopg2)'''
+
+    def __init__(self, dbapi_connection):
+        self.cursor = dbapi_connection.cursor()
+
+    def write(self, table, columns, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        self.cursor.copy_expert(
+            "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(table, ", ".join(columns)),
+            buffer
+        )
+
+
+class ExecutemanyWriter(object):
+    '''Write rows with one executemany per chunk (SQLite and the rest)'''
+
+    PLACEHOLDERS = {"qmark": "?", "format": "%s", "pyformat": "%s"}
+
+    def __init__(self, dbapi_connection, paramstyle):
+        self.cursor = dbapi_connection.cursor()
+        self.placeholder = self.PLACEHOLDERS[paramstyle]
+
+    def write(self, table, columns, rows):
+        self.cursor.executemany(
+            "INSERT INTO {} ({}) VALUES ({})".format(
+                table, ", ".join(columns), ", ".join([self.placeholder] * len(columns))
+            ),
+            rows
+        )
+
+
+def make_writer(dbapi_connection, dialect):
+    '''Fastest bulk writer of the database'''
+
+    if dialect.name == "postgresql":
+        return CopyWriter(dbapi_connection)
+    if dialect.name == "sqlite":
+        # seed data can be regenerated, skip the fsync of every commit
+        dbapi_connection.cursor().execute("PRAGMA synchronous = OFF")
+    return ExecutemanyWriter(dbapi_connection, dialect.paramstyle)
+
+
+# SECTION - generator
+def food_portions(food) -> list:
+    '''
+    Every portion of a food as a food item row without log_id (ITEM_COLUMNS order:
+    name, sugar, fiber, serving size, then the other nutrients)
+    '''
+
+    name, servings, per_100g = food
+    portions = []
+    for serving in servings:
+        # half, usual (more likely), one and a half and double servings
+        for size in (serving * 0.5, serving, serving, serving, serving * 1.5, serving * 2):
+            nutrients = [round(value * size / 100, 2) for value in per_100g]
+            portions.append((name, nutrients[0], nutrients[1], size, *nutrients[2:]))
+    return portions
+
+
+# portions of the foods of every meal, computed once (the generator only picks)
+MEAL_PORTIONS = {
+    meal_no: [portion for index in foods for portion in food_portions(FOODS[index])]
+    for meal_no, foods in MEAL_FOODS.items()
+}
+
+
+def generate_food_item(rng, meal_no, log_id) -> tuple:
+    '''Food item row (ITEM_COLUMNS) of a random food of the meal'''
+
+    return rng.choice(MEAL_PORTIONS[meal_no]) + (log_id,)
+
+
+def generate_logs(rng, user_id, days, end_date, first_log_id):
+    '''
+    Meal logs of one user for the `days` days up to end_date
+
+    Returns
+    --------------
+    Generator of (log row, [food item rows])
+    '''
+
+    log_id = first_log_id
+    # some users log every day, some skip a lot
+    diligence = rng.uniform(0.5, 1.0)
+    for offset in range(days, 0, -1):
+        if rng.random() > diligence:
+            continue
+        day = end_date - timedelta(days=offset - 1)
+        for meal_no in range(1, 6):
+            if rng.random() > MEAL_PROBABILITY[meal_no]:
+                continue
+            item_count = rng.choice((1, 1, 2, 2, 2, 3, 3, 4, 5, 6)) if meal_no < 4 else rng.choice((1, 1, 2))
+            items = [generate_food_item(rng, meal_no, log_id) for _ in range(item_count)]
+            yield (log_id, meal_no, day.isoformat(), user_id), items
+            log_id += 1
+
+
+def reset_sequences(dialect):
+    '''Move the id sequences past the explicit ids written by the generator (PostgreSQL)'''
+
+    if dialect.name != "postgresql":
+        return
+    for table in ("users", "meal_logs"):
+        db.session.execute(db.text(
+            "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+            "COALESCE((SELECT MAX(id) FROM {}), 0) + 1, false)".format(table)
+        ), {"table": table})
+    db.session.commit()
+
+
+def generate(users, days, seed=42, end_date=DEFAULT_END_DATE, chunk_size=50000, echo=None) -> dict:
+    '''
+    Add `users` users with `days` days of meal logs to the db
+
+    Parameters
+    --------------
+    users: int
+        Number of users to create
+    days: int
+        Number of days of logs per user (ending at end_date)
+    seed: int
+        Seed of the random generator
+    end_date: date
+        Last logged day
+    chunk_size: int
+        Rows per COPY / executemany
+
+    Returns
+    --------------
+    Dict of the number of rows written per table
+    '''
+
+    rng = random.Random(seed)
+    echo = echo or (lambda message: None)
+    counts = {"users": 0, "meal_logs": 0, "food_items": 0}
+
+    first_user_id = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    next_log_id = (db.session.query(func.max(Log.id)).scalar() or 0) + 1
+    # every user has the same password, hash it once
+    pw_hash = password_hasher.hash(PASSWORD)
+    db.session.commit()
+
+    dbapi_connection = db.engine.raw_connection()
+    try:
+        writer = make_writer(dbapi_connection, db.engine.dialect)
+
+        user_rows = [
+            (user_id, f"User {user_id}", f"user{user_id}@example.com", f"user{user_id}", pw_hash)
+            for user_id in range(first_user_id, first_user_id + users)
+        ]
+        for start in range(0, len(user_rows), chunk_size):
+            writer.write("users", USER_COLUMNS, user_rows[start:start + chunk_size])
+        counts["users"] = len(user_rows)
+
+        log_rows, item_rows = [], []
+        started = time.perf_counter()
+
+        def flush():
+            # logs first, the items reference them
+            writer.write("meal_logs", LOG_COLUMNS, log_rows)
+            writer.write("food_items", ITEM_COLUMNS, item_rows)
+            counts["meal_logs"] += len(log_rows)
+            counts["food_items"] += len(item_rows)
+            log_rows.clear()
+            item_rows.clear()
+            echo("{meal_logs} logs, {food_items} food items".format(**counts)
+                 + " ({:.0f} items/s)".format(counts["food_items"] / (time.perf_counter() - started)))
+
+        for user_id in range(first_user_id, first_user_id + users):
+            for log_row, items in generate_logs(rng, user_id, days, end_date, next_log_id):
+                log_rows.append(log_row)
+                item_rows.extend(items)
+                next_log_id += 1
+            if len(item_rows) >= chunk_size:
+                flush()
+        if log_rows:
+            flush()
+        dbapi_connection.commit()
+    finally:
+        dbapi_connection.close()
+
+    reset_sequences(db.engine.dialect)
+    echo("Rebuilding daily totals")
+    rebuild_daily_totals()
+    return counts
+
+
+# SECTION - cli
+@click.command()
+@click.option("--users", type=int, default=0, show_default=True, help="Users to generate (0: only create the tables).")
+@click.option("--days", type=int, default=90, show_default=True, help="Days of meal logs per user.")
+@click.option("--seed", type=int, default=42, show_default=True, help="Seed of the random generator.")
+@click.option(
+    "--end-date",
+    type=click.DateTime(formats=["%Y-%m-%d"]),
+    default=DEFAULT_END_DATE.isoformat(),
+    show_default=True,
+    help="Last logged day (fixed default, so the same --seed gives the same rows on any day)."
+)
+@click.option("--chunk-size", type=int, default=50000, show_default=True, help="Rows per COPY / executemany.")
+@click.option("--append", is_flag=True, help="Keep the existing tables and rows.")
+def seed(users, days, seed, end_date, chunk_size, append):
+    '''
+    Create the tables and generate synthetic users, meal logs and food items
+    '''
+
+    app = create_app()
+
+    with app.app_context():
+        if not append:
+            db.drop_all()
+            db.create_all()
+        if users <= 0:
+            return
+
+        started = time.perf_counter()
+        counts = generate(
+            users,
+            days,
+            seed=seed,
+            end_date=end_date.date(),
+            chunk_size=chunk_size,
+            echo=click.echo
+        )
+        click.echo("Wrote {users} users, {meal_logs} logs and {food_items} food items".format(**counts)
+                   + " in {:.1f}s".format(time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    seed()
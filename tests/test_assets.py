@@ -0,0 +1,87 @@
+from unittest import TestCase
+from config import TestConfig
+from macronizer_cores import create_app
+
+import gzip
+import os
+import shutil
+import tempfile
+
+
+class AssetPipelineTestCase(TestCase):
+    """Tests for the fingerprinted static asset build and its routes."""
+
+    def setUp(self):
+      """Set up test config with a temporary assets output dir"""
+
+      self.output_dir = tempfile.mkdtemp()
+
+      class AssetsTestConfig(TestConfig):
+        ASSETS_OUTPUT_DIR = self.output_dir
+
+      self.app = create_app(AssetsTestConfig)
+      self.client = self.app.test_client()
+      self.runner = self.app.test_cli_runner()
+
+
+    def tearDown(self):
+      """Remove the built assets."""
+
+      shutil.rmtree(self.output_dir)
+
+
+    def test_pages_use_static_sources_before_build(self) -> None:
+      '''
+      Test that base.html links the plain static files when the assets were not built
+      '''
+
+      # act
+      html = self.client.get("/login").get_data(as_text=True)
+
+      # assert
+      self.assertIn('href="/static/css/site.css"', html)
+      self.assertIn('src="/static/js/template.js"', html)
+      self.assertIn('src="/static/js/app.js"', html)
+
+
+    def test_build_links_fingerprinted_bundle(self) -> None:
+      '''
+      Test that `flask assets build` bundles the scripts and base.html links the fingerprinted files
+      '''
+
+      # act
+      result = self.runner.invoke(args=["assets", "build"])
+      html = self.client.get("/login").get_data(as_text=True)
+
+      # assert
+      self.assertEqual(result.exit_code, 0, result.output)
+      self.assertNotIn("/static/", html)
+      self.assertRegex(html, r'href="/assets/css/site\.[0-9a-f]{10}\.css"')
+      self.assertRegex(html, r'src="/assets/js/site\.[0-9a-f]{10}\.js"')
+      self.assertEqual(html.count('<script src="/assets/'), 1)
+
+
+    def test_assets_are_immutable_and_precompressed(self) -> None:
+      '''
+      Test that built assets are cached for a year and the gzip variant is sent when accepted
+      '''
+
+      # arrange
+      self.runner.invoke(args=["assets", "build"])
+      built = [name for name in os.listdir(os.path.join(self.output_dir, "js")) if name.startswith("site.") and name.endswith(".js")]
+      url = f"/assets/js/{built[0]}"
+
+      # act
+      plain = self.client.get(url)
+      compressed = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+
+      # assert
+      self.assertEqual(plain.status_code, 200)
+      self.assertIn("javascript", plain.mimetype)
+      self.assertIn("max-age=31536000", plain.headers["Cache-Control"])
+      self.assertIn("immutable", plain.headers["Cache-Control"])
+      self.assertNotIn("Content-Encoding", plain.headers)
+      self.assertEqual(compressed.headers["Content-Encoding"], "gzip")
+      self.assertIn("Accept-Encoding", compressed.headers["Vary"])
+      self.assertEqual(gzip.decompress(compressed.get_data()), plain.get_data())
+      self.assertIn(b"API_LOG_URL", plain.get_data())
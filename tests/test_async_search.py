@@ -0,0 +1,217 @@
+from unittest import TestCase
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from urllib.parse import urlparse, parse_qs
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User
+from macronizer_cores.food_item_api.asgi import FoodSearchASGI
+
+import asyncio
+import json
+import time
+
+import httpx
+
+
+class StubNutritionAPI(object):
+  '''Local stand-in for the nutrition API answering after a delay'''
+
+  def __init__(self, delay=0.3, status=200):
+    self.delay = delay
+    self.status = status
+    self.calls = 0
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self._lock = Lock()
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        with stub._lock:
+          stub.calls += 1
+          stub.in_flight += 1
+          stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+        time.sleep(stub.delay)
+        query = parse_qs(urlparse(self.path).query)["query"][0]
+        body = json.dumps({"items": [{"name": query, "calories": 100.0, "serving_size_g": 100.0}]}).encode()
+        with stub._lock:
+          stub.in_flight -= 1
+        self.send_response(stub.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.server.daemon_threads = True
+    self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/nutrition"
+    Thread(target=self.server.serve_forever, daemon=True).start()
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+class AsyncFoodSearchTestCase(TestCase):
+    """Tests for the asyncio /api/food/search path (asgi.py)."""
+
+    def setUp(self):
+      """Set up an app pointing at a local stub of the nutrition API"""
+
+      self.stub = StubNutritionAPI()
+
+      class StubConfig(TestConfig):
+        NUTRITION_API_URL = self.stub.url
+        NUTRITION_API_RETRIES = 0
+        NUTRITION_API_ASYNC_POOL_SIZE = 200
+
+      self.app = create_app(StubConfig)
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+      db.session.commit()
+
+      self.wsgi_calls = []
+      self.asgi = FoodSearchASGI(self.app, wsgi_app=self.fake_wsgi_app)
+
+
+    def tearDown(self):
+      """Stop the stub server."""
+
+      db.session.rollback()
+      self.app_context.pop()
+      self.stub.close()
+
+
+    async def fake_wsgi_app(self, scope, receive, send):
+      '''Record requests handed over to the Flask app'''
+
+      self.wsgi_calls.append(scope["path"])
+      await send({"type": "http.response.start", "status": 302, "headers": []})
+      await send({"type": "http.response.body", "body": b""})
+
+
+    def search_concurrently(self, queries, cookies=None):
+      '''Send searches concurrently through the ASGI app and return the responses'''
+
+      async def run():
+        transport = httpx.ASGITransport(app=self.asgi)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver", cookies=cookies) as client:
+          return await asyncio.gather(*[
+            client.get("/api/food/search", params={"queryString": query}) for query in queries
+          ])
+
+      return asyncio.run(run())
+
+
+    def test_searches_wait_on_upstream_concurrently(self) -> None:
+      '''
+      Test that many searches keep their upstream calls in flight at the same time
+      '''
+
+      # arrange
+      queries = [f"food{i}" for i in range(60)]
+
+      # act
+      started = time.perf_counter()
+      responses = self.search_concurrently(queries)
+      elapsed = time.perf_counter() - started
+
+      # assert
+      self.assertTrue(all(res.status_code == 200 for res in responses))
+      self.assertEqual(responses[7].json()["items"][0]["name"], "food7")
+      self.assertEqual(self.stub.calls, 60)
+      self.assertGreaterEqual(self.stub.max_in_flight, 30)
+      # 60 sequential calls would take 18s
+      self.assertLess(elapsed, 60 * self.stub.delay / 4)
+
+
+    def test_identical_searches_share_one_upstream_call(self) -> None:
+      '''
+      Test that concurrent identical searches are coalesced and the result is cached
+      '''
+
+      # act
+      responses = self.search_concurrently(["Apple"] * 10 + ["  apple "] * 10)
+      again = self.search_concurrently(["apple"])
+
+      # assert
+      self.assertTrue(all(res.json() == responses[0].json() for res in responses + again))
+      self.assertEqual(self.stub.calls, 1)
+
+
+    def test_upstream_errors_match_sync_route(self) -> None:
+      '''
+      Test that API errors and unreachable API get the same answers as the WSGI route
+      '''
+
+      # arrange
+      self.stub.status = 500
+      failed = self.search_concurrently(["bread"])[0]
+      self.stub.close()
+
+      # act
+      unreachable = self.search_concurrently(["rice"])[0]
+      missing = self.search_concurrently([""])[0]
+
+      # assert
+      self.assertEqual(failed.status_code, 502)
+      self.assertEqual(failed.json(), {"message": "Request failed"})
+      self.assertEqual(unreachable.status_code, 503)
+      self.assertEqual(missing.status_code, 400)
+
+
+    def test_requests_without_session_go_to_flask(self) -> None:
+      '''
+      Test that searches without a signed session and every other route are handled by the Flask app
+      '''
+
+      # arrange
+      self.app.config['LOGIN_DISABLED'] = False
+      user = User(name="John Doe", email="john@example.com", username="johndoe", password="hashed")
+      db.session.add(user)
+      db.session.commit()
+      with self.app.test_request_context():
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        cookie = serializer.dumps({"_user_id": str(user.id)})
+        deleted_user_cookie = serializer.dumps({"_user_id": str(user.id + 1)})
+
+      # act
+      anonymous = self.search_concurrently(["bread"])[0]
+      forged = self.search_concurrently(["bread"], cookies={"session": cookie + "x"})[0]
+      deleted = self.search_concurrently(["bread"], cookies={"session": deleted_user_cookie})[0]
+      logged_in = self.search_concurrently(["bread"], cookies={"session": cookie})[0]
+
+      # assert
+      self.assertEqual(anonymous.status_code, 302)
+      self.assertEqual(forged.status_code, 302)
+      self.assertEqual(deleted.status_code, 302)
+      self.assertEqual(logged_in.status_code, 200)
+      self.assertEqual(self.wsgi_calls, ["/api/food/search"] * 3)
+
+
+    def test_large_bodies_are_refused_before_buffering(self) -> None:
+      '''
+      Test that a body over MAX_CONTENT_LENGTH is answered with 413 without reaching the Flask app
+      '''
+
+      # arrange
+      self.asgi.max_body = 1024
+
+      async def run():
+        transport = httpx.ASGITransport(app=self.asgi)
+        async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+          return await client.post("/api/log/import", content=b"x" * 2048)
+
+      # act
+      res = asyncio.run(run())
+
+      # assert
+      self.assertEqual(res.status_code, 413)
+      self.assertEqual(self.wsgi_calls, [])
@@ -0,0 +1,113 @@
+from unittest import TestCase
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User
+
+import gzip
+import json
+
+
+# food item as sent by nutrition.js
+RICE = {
+  'name': 'white rice',
+  'sugar': 0.1,
+  'fiber': 0.4,
+  'servingSize': 100.0,
+  'sodium': 0.0,
+  'potassium': 43.0,
+  'saturatedFat': 0.1,
+  'totalFat': 0.3,
+  'calories': 132.0,
+  'cholesterol': 0.0,
+  'protein': 2.7,
+  'carbohydrate': 28.5
+}
+
+
+class CompressionTestCase(TestCase):
+    """Tests for the response compression middleware."""
+
+    def setUp(self):
+      """Set up test config and a user with a day of logged meals"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+      u1 = User(name="John Doe", email="john@example.com", username="johndoe", password="hashed")
+      db.session.add(u1)
+      db.session.commit()
+
+      # authenticate the test client as u1
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u1.id)
+
+      for meal_no in range(1, 6):
+        self.client.post("/api/log/new", json={"meal_no": meal_no, "food_items": [RICE] * 4, "date_string": "2022-02-01"})
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def test_json_response_is_gzipped_when_accepted(self) -> None:
+      '''
+      Test that a large JSON response is gzipped for a client accepting gzip and revalidates with its weak ETag
+      '''
+
+      # arrange
+      search = {"date": "2022-02-01"}
+      plain = self.client.get("/api/log/search", query_string=search)
+
+      # act
+      res = self.client.get("/api/log/search", query_string=search, headers={"Accept-Encoding": "gzip"})
+      revalidated = self.client.get("/api/log/search", query_string=search, headers={"If-None-Match": res.headers["ETag"]})
+
+      # assert
+      self.assertNotIn("Content-Encoding", plain.headers)
+      self.assertEqual(res.headers["Content-Encoding"], "gzip")
+      self.assertIn("Accept-Encoding", res.headers["Vary"])
+      self.assertTrue(res.headers["ETag"].startswith('W/'))
+      self.assertLess(len(res.get_data()), len(plain.get_data()) / 4)
+      self.assertEqual(json.loads(gzip.decompress(res.get_data())), plain.json)
+      self.assertEqual(revalidated.status_code, 304)
+
+
+    def test_streamed_response_is_gzipped(self) -> None:
+      '''
+      Test that the streamed /api/log/range response is compressed chunk by chunk
+      '''
+
+      # act
+      res = self.client.get(
+        "/api/log/range",
+        query_string={"start": "2022-02-01", "end": "2022-02-28"},
+        headers={"Accept-Encoding": "gzip"}
+      )
+
+      # assert
+      self.assertTrue(res.is_streamed)
+      self.assertEqual(res.headers["Content-Encoding"], "gzip")
+      meals = json.loads(gzip.decompress(res.get_data()))["meals_logged"]
+      self.assertEqual(sum(len(meal["food_items"]) for meal in meals), 20)
+
+
+    def test_small_response_is_not_compressed(self) -> None:
+      '''
+      Test that responses below COMPRESS_MIN_SIZE are sent as is
+      '''
+
+      # act
+      res = self.client.get("/api/log/search", query_string={"date": "2022-03-01"}, headers={"Accept-Encoding": "gzip"})
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertNotIn("Content-Encoding", res.headers)
+      self.assertEqual(res.json, {"meals_logged": []})
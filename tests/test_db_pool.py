@@ -0,0 +1,100 @@
+from unittest import TestCase, mock
+from sqlalchemy import create_engine, exc, text
+from config import TestConfig, engine_options
+from macronizer_cores import create_app, db_pool
+from macronizer_cores.db_pool import InstrumentedQueuePool, pool_metrics
+
+import os
+import tempfile
+
+
+class DBPoolTestCase(TestCase):
+    """Tests for the instrumented, fork-safe connection pool."""
+
+    def setUp(self):
+      """Set up a file db engine with a one-connection pool"""
+
+      db_pool.install_fork_guard()
+      pool_metrics.reset()
+      fd, self.db_path = tempfile.mkstemp(suffix=".db")
+      os.close(fd)
+      self.engine = create_engine(
+        "sqlite:///" + self.db_path,
+        poolclass=InstrumentedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.2
+      )
+
+
+    def tearDown(self):
+      """Close the engine"""
+
+      self.engine.dispose()
+      os.remove(self.db_path)
+
+
+    def test_checkout_metrics(self) -> None:
+      '''Test that checkouts, connections in use and timeouts are counted'''
+
+      # arrange
+      conn = self.engine.connect()
+
+      # act
+      stats_in_use = pool_metrics.stats()
+      with self.assertRaises(exc.TimeoutError):
+        self.engine.connect()
+      conn.close()
+      stats = pool_metrics.stats()
+
+      # assert
+      self.assertEqual(stats_in_use["in_use"], 1)
+      self.assertEqual(stats["in_use"], 0)
+      self.assertEqual(stats["idle"], 1)
+      self.assertEqual(stats["checkouts"], 1)
+      self.assertEqual(stats["timeouts"], 1)
+
+
+    def test_forked_connection_discarded(self) -> None:
+      '''Test that a connection opened by another process is replaced on checkout'''
+
+      # arrange
+      with self.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+      # act
+      with mock.patch.object(db_pool.os, "getpid", return_value=os.getpid() + 1):
+        with self.engine.connect() as conn:
+          result = conn.execute(text("SELECT 1")).scalar()
+
+      # assert
+      self.assertEqual(result, 1)
+      self.assertEqual(pool_metrics.stats()["forked_connections"], 1)
+
+
+    def test_engine_options(self) -> None:
+      '''Test that pool options are only set for PostgreSQL urls'''
+
+      # act
+      pg_options = engine_options("postgresql://user@localhost/macronizer")
+      sqlite_options = engine_options("sqlite:///macronizer.db")
+
+      # assert
+      self.assertEqual(sqlite_options, {})
+      self.assertIn("pool_size", pg_options)
+      self.assertTrue(pg_options["pool_pre_ping"])
+      self.assertIn("statement_timeout", pg_options["connect_args"]["options"])
+
+
+    def test_pool_stats_route(self) -> None:
+      '''Test that /api/db/pool/stats returns the pool counters'''
+
+      # arrange
+      app = create_app(TestConfig)
+
+      # act
+      res = app.test_client().get("/api/db/pool/stats")
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertIn("wait_seconds_avg", res.json["pool"])
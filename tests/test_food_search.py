@@ -0,0 +1,539 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db
+from macronizer_cores.lru import LRUCache
+from macronizer_cores.food_item_api.cache import nutrition_cache, ingredient_cache
+from macronizer_cores.food_item_api.client import nutrition_client, JitteredRetry
+from macronizer_cores.food_item_api.catalog import food_catalog
+from macronizer_cores.food_item_api.parser import parse_query, Segment
+from macronizer_cores.food_item_api.singleflight import SingleFlight
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from sqlalchemy import event
+
+import os
+import requests
+import tempfile
+import time
+
+
+# sample payload returned by CalorieNinjas
+API_PAYLOAD = {
+  "items": [
+    {
+      "name": "chicken breast",
+      "calories": 166.2,
+      "serving_size_g": 100.0,
+      "fat_total_g": 3.6,
+      "fat_saturated_g": 1.0,
+      "protein_g": 31.0,
+      "sodium_mg": 72,
+      "potassium_mg": 226,
+      "cholesterol_mg": 85,
+      "carbohydrates_total_g": 0.0,
+      "fiber_g": 0.0,
+      "sugar_g": 0.0
+    }
+  ]
+}
+
+
+def mock_api_response(payload=API_PAYLOAD, status_code=200):
+  '''Build a fake requests.Response for the nutrition API'''
+
+  response = MagicMock()
+  response.status_code = status_code
+  response.json.return_value = payload
+  response.text = str(payload)
+  return response
+
+
+class FoodSearchTestCase(TestCase):
+    """Tests for GET /api/food/search."""
+
+    def setUp(self):
+      """Set up test config and an empty db"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    @patch.object(nutrition_client, "search")
+    def test_repeat_search_is_served_from_cache(self, mock_search) -> None:
+      '''
+      Test that a repeated (and differently formatted) query does not call the API again
+      '''
+
+      # arrange
+      mock_search.return_value = mock_api_response()
+
+      # act
+      first = self.client.get("/api/food/search", query_string={"queryString": "Chicken Breast"})
+      second = self.client.get("/api/food/search", query_string={"queryString": "  chicken   breast "})
+
+      # assert
+      self.assertEqual(first.json, API_PAYLOAD)
+      self.assertEqual(second.json, API_PAYLOAD)
+      self.assertEqual(mock_search.call_count, 1)
+      self.assertEqual(nutrition_cache.stats()["memory"]["hits"], 1)
+
+
+    @patch.object(nutrition_client, "search")
+    def test_search_falls_back_to_db_tier(self, mock_search) -> None:
+      '''
+      Test that a query dropped from memory is still answered from the db tier
+      '''
+
+      # arrange
+      mock_search.return_value = mock_api_response()
+      self.client.get("/api/food/search", query_string={"queryString": "chicken breast"})
+      nutrition_cache.memory.clear()
+
+      # act
+      res = self.client.get("/api/food/search", query_string={"queryString": "chicken breast"})
+
+      # assert
+      self.assertEqual(res.json, API_PAYLOAD)
+      self.assertEqual(mock_search.call_count, 1)
+      self.assertEqual(nutrition_cache.stats()["db"]["hits"], 1)
+
+
+    @patch.object(nutrition_client, "search")
+    def test_failed_search_is_not_cached(self, mock_search) -> None:
+      '''
+      Test that an API error is not stored in the cache
+      '''
+
+      # arrange
+      mock_search.return_value = mock_api_response({"error": "quota"}, 429)
+
+      # act
+      first = self.client.get("/api/food/search", query_string={"queryString": "apple"})
+      self.client.get("/api/food/search", query_string={"queryString": "apple"})
+
+      # assert
+      self.assertEqual(first.status_code, 502)
+      self.assertEqual(mock_search.call_count, 2)
+
+
+    @patch.object(nutrition_client, "search")
+    def test_upstream_timeout_returns_503(self, mock_search) -> None:
+      '''
+      Test that a timed out API call fails fast with 503
+      '''
+
+      # arrange
+      mock_search.side_effect = requests.exceptions.ReadTimeout()
+
+      # act
+      res = self.client.get("/api/food/search", query_string={"queryString": "apple"})
+
+      # assert
+      self.assertEqual(res.status_code, 503)
+
+
+class IngredientDecompositionTestCase(TestCase):
+    """Tests for per-ingredient resolution of food searches."""
+
+    def setUp(self):
+      """Set up test config and an empty db"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def test_parse_query_into_segments(self) -> None:
+      '''
+      Test that a natural language query is split into quantity + unit + food
+      '''
+
+      # act
+      segments = parse_query("2 Eggs and 100g rice, an apple & 1/2 cup of oats")
+
+      # assert
+      self.assertEqual(segments, [
+        Segment("2 eggs", 2.0, None, "eggs"),
+        Segment("100g rice", 100.0, "g", "rice"),
+        Segment("an apple", 1.0, None, "apple"),
+        Segment("1/2 cup of oats", 0.5, "cup", "oats")
+      ])
+
+
+    @patch.object(nutrition_client, "search")
+    def test_zero_denominator_is_not_a_quantity(self, mock_search) -> None:
+      '''
+      Test that "1/0 cup rice" is searched as plain text instead of failing
+      '''
+
+      # arrange
+      mock_search.return_value = mock_api_response()
+
+      # act
+      segments = parse_query("1/0 cup rice")
+      res = self.client.get("/api/food/search", query_string={"queryString": "1/0 cup rice"})
+
+      # assert
+      self.assertEqual(segments, [Segment("1/0 cup rice", None, None, "1/0 cup rice")])
+      self.assertEqual(res.status_code, 200)
+      mock_search.assert_called_once_with("1/0 cup rice")
+
+
+    @patch.object(nutrition_client, "search")
+    def test_only_missing_ingredients_go_upstream(self, mock_search) -> None:
+      '''
+      Test that known ingredients are rescaled locally and only new ones are sent to the API
+      '''
+
+      # arrange
+      egg = {"name": "egg", "serving_size_g": 100.0, "calories": 143.0, "protein_g": 12.6}
+      rice = {"name": "rice", "serving_size_g": 100.0, "calories": 130.0, "protein_g": 2.7}
+      apple = {"name": "apple", "serving_size_g": 182.0, "calories": 94.6, "protein_g": 0.5}
+      mock_search.side_effect = [
+        mock_api_response({"items": [egg, rice]}),
+        mock_api_response({"items": [apple]})
+      ]
+      self.client.get("/api/food/search", query_string={"queryString": "2 eggs and 100g rice"})
+
+      # act
+      res = self.client.get("/api/food/search", query_string={"queryString": "3 eggs and 250 g rice and an apple"})
+      items = res.json["items"]
+
+      # assert
+      self.assertEqual(mock_search.call_args_list[1].args, ("an apple",))
+      self.assertEqual([item["name"] for item in items], ["egg", "rice", "apple"])
+      self.assertEqual(items[0]["serving_size_g"], 150.0)
+      self.assertEqual(items[0]["calories"], 214.5)
+      self.assertEqual(items[1]["serving_size_g"], 250.0)
+      self.assertEqual(items[1]["calories"], 325.0)
+      self.assertEqual(items[2], apple)
+
+
+    @patch.object(nutrition_client, "search")
+    def test_unmatched_api_answer_is_returned_as_is(self, mock_search) -> None:
+      '''
+      Test that an API answer that doesn't map 1:1 to the segments is returned but not learned
+      '''
+
+      # arrange
+      items = [{"name": "ham", "serving_size_g": 100.0}, {"name": "cheese", "serving_size_g": 100.0}]
+      mock_search.return_value = mock_api_response({"items": items})
+
+      # act
+      res = self.client.get("/api/food/search", query_string={"queryString": "ham cheese sandwich"})
+
+      # assert
+      self.assertEqual(res.json["items"], items)
+      self.assertIsNone(ingredient_cache.get("ham cheese sandwich"))
+
+
+    @patch.object(nutrition_client, "search")
+    def test_ingredients_are_read_and_learned_in_batches(self, mock_search) -> None:
+      '''
+      Test that the number of SQL statements of a search doesn't grow with its ingredients
+      '''
+
+      # arrange
+      def answer(query_string):
+        names = [part.split()[-1] for part in query_string.split(" and ")]
+        return mock_api_response({"items": [{"name": name, "serving_size_g": 100.0} for name in names]})
+      mock_search.side_effect = answer
+      statements = []
+      def count(*args):
+        statements.append(args[2])
+      event.listen(db.engine, "before_cursor_execute", count)
+      self.addCleanup(event.remove, db.engine, "before_cursor_execute", count)
+
+      # act
+      self.client.get("/api/food/search", query_string={"queryString": "100g rice"})
+      one_ingredient = len(statements)
+      statements.clear()
+      foods = ["egg", "rice", "apple", "oats", "milk", "tofu", "salmon", "pasta"]
+      self.client.get("/api/food/search", query_string={"queryString": " and ".join(f"100g {f}" for f in foods)})
+
+      # assert
+      self.assertEqual(len(statements), one_ingredient)
+      self.assertEqual(len(ingredient_cache.get_many(foods)), len(foods))
+
+
+class FoodCatalogTestCase(TestCase):
+    """Tests for the local food catalog."""
+
+    def setUp(self):
+      """Set up test config and load a small catalog"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+      # load the catalog through the cli command
+      fd, self.catalog_path = tempfile.mkstemp(suffix=".csv")
+      with os.fdopen(fd, "w") as f:
+        f.write(
+          "name,calories,protein_gram,fat_total_gram,fat_saturation_gram,carbohydrate_gram,"
+          "sugar_gram,fiber_gram,sodium_mg,potassium_mg,cholesterol_mg\n"
+          "Egg,143,12.6,9.5,3.1,0.7,0.4,0,142,138,372\n"
+          "White rice,130,2.7,0.3,0.1,28.2,0.1,0.4,1,35,0\n"
+        )
+      result = self.app.test_cli_runner().invoke(args=["food", "import-catalog", self.catalog_path])
+      self.assertIn("Imported 2 catalog rows", result.output)
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+      os.remove(self.catalog_path)
+
+
+    @patch.object(nutrition_client, "search")
+    def test_catalog_answers_known_food(self, mock_search) -> None:
+      '''
+      Test that a food in the catalog is answered per 100g without calling the API
+      '''
+
+      # act
+      res = self.client.get("/api/food/search", query_string={"queryString": "white RICE"})
+
+      # assert
+      mock_search.assert_not_called()
+      self.assertEqual(res.json, {
+        "items": [
+          {
+            "name": "White rice",
+            "calories": 130.0,
+            "serving_size_g": 100.0,
+            "fat_total_g": 0.3,
+            "fat_saturated_g": 0.1,
+            "protein_g": 2.7,
+            "sodium_mg": 1.0,
+            "potassium_mg": 35.0,
+            "cholesterol_mg": 0.0,
+            "carbohydrates_total_g": 28.2,
+            "fiber_g": 0.4,
+            "sugar_g": 0.1
+          }
+        ]
+      })
+
+
+    def test_catalog_fuzzy_match(self) -> None:
+      '''
+      Test that close spellings resolve through the trigram index and unrelated ones don't
+      '''
+
+      # act
+      plural = food_catalog.lookup("eggs")
+      unrelated = food_catalog.lookup("pineapple")
+
+      # assert
+      self.assertEqual(plural["name"], "Egg")
+      self.assertIsNone(unrelated)
+
+
+    @patch.object(nutrition_client, "search")
+    def test_unknown_food_goes_upstream(self, mock_search) -> None:
+      '''
+      Test that foods missing from the catalog are still searched in the API
+      '''
+
+      # arrange
+      mock_search.return_value = mock_api_response()
+
+      # act
+      res = self.client.get("/api/food/search", query_string={"queryString": "chicken breast"})
+
+      # assert
+      mock_search.assert_called_once()
+      self.assertEqual(res.json, API_PAYLOAD)
+
+
+class NutritionClientTestCase(TestCase):
+    """Tests for the pooled nutrition API client."""
+
+    def test_client_is_configured_from_config(self) -> None:
+      '''
+      Test that create_app builds a pooled session with timeouts and retries
+      '''
+
+      # act
+      app = create_app(TestConfig)
+      adapter = nutrition_client.session.get_adapter(app.config["NUTRITION_API_URL"])
+
+      # assert
+      self.assertEqual(nutrition_client.timeout, (
+        app.config["NUTRITION_API_CONNECT_TIMEOUT"],
+        app.config["NUTRITION_API_READ_TIMEOUT"]
+      ))
+      self.assertEqual(adapter._pool_maxsize, app.config["NUTRITION_API_POOL_SIZE"])
+      self.assertIsInstance(adapter.max_retries, JitteredRetry)
+      self.assertEqual(adapter.max_retries.total, app.config["NUTRITION_API_RETRIES"])
+
+
+    def test_backoff_is_jittered_below_exponential_backoff(self) -> None:
+      '''
+      Test that the jittered backoff never exceeds the plain exponential backoff
+      '''
+
+      # arrange
+      retry = JitteredRetry(total=5, backoff_factor=0.5).increment().increment().increment()
+
+      # act
+      delays = [retry.get_backoff_time() for _ in range(50)]
+
+      # assert
+      self.assertTrue(all(0 <= delay <= 0.5 * 2 ** 2 for delay in delays))
+      self.assertGreater(len(set(delays)), 1)
+
+
+class SingleFlightTestCase(TestCase):
+    """Tests for coalescing of concurrent identical calls."""
+
+    def run_concurrently(self, flight, fn, callers=5):
+      '''Start callers that all ask for the same key while the first one is blocked'''
+
+      started = Event()
+      release = Event()
+
+      def blocking_call():
+        started.set()
+        release.wait(5)
+        return fn()
+
+      with ThreadPoolExecutor(callers) as pool:
+        leader = pool.submit(flight.do, "chicken breast", blocking_call)
+        started.wait(5)
+        waiters = [pool.submit(flight.do, "chicken breast", blocking_call) for _ in range(callers - 1)]
+        # wait until every waiter joined the in-flight call
+        while flight.stats()["coalesced"] < callers - 1:
+          time.sleep(0.001)
+        release.set()
+        return [leader] + waiters
+
+
+    def test_concurrent_calls_share_one_execution(self) -> None:
+      '''
+      Test that callers arriving while a call is in flight get its result without running it again
+      '''
+
+      # arrange
+      flight = SingleFlight(timeout=5)
+      fn = MagicMock(return_value=API_PAYLOAD)
+
+      # act
+      futures = self.run_concurrently(flight, fn)
+
+      # assert
+      self.assertEqual([future.result() for future in futures], [API_PAYLOAD] * 5)
+      fn.assert_called_once()
+      self.assertEqual(flight.stats(), {"in_flight": 0, "leaders": 1, "coalesced": 4, "timeouts": 0})
+
+
+    def test_leader_error_is_raised_in_waiters(self) -> None:
+      '''
+      Test that an error of the in-flight call propagates to every waiter
+      '''
+
+      # arrange
+      flight = SingleFlight(timeout=5)
+      fn = MagicMock(side_effect=ValueError("upstream down"))
+
+      # act
+      futures = self.run_concurrently(flight, fn, callers=3)
+
+      # assert
+      for future in futures:
+        self.assertRaises(ValueError, future.result)
+      fn.assert_called_once()
+
+
+    def test_waiter_times_out(self) -> None:
+      '''
+      Test that a waiter gives up after the configured timeout
+      '''
+
+      # arrange
+      flight = SingleFlight(timeout=0.01)
+      release = Event()
+
+      # act
+      with ThreadPoolExecutor(2) as pool:
+        pool.submit(flight.do, "apple", release.wait, 5)
+        while not flight.stats()["in_flight"]:
+          time.sleep(0.001)
+        waiter = pool.submit(flight.do, "apple", release.wait, 5)
+        self.assertRaises(TimeoutError, waiter.result)
+        release.set()
+
+      # assert
+      self.assertEqual(flight.stats()["timeouts"], 1)
+
+
+class LRUCacheTestCase(TestCase):
+    """Tests for the in-process LRU cache."""
+
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+      '''
+      Test that the least recently used key is evicted once the cache is full
+      '''
+
+      # arrange
+      cache = LRUCache(maxsize=2, ttl=60)
+      cache.set("a", 1)
+      cache.set("b", 2)
+      cache.get("a")
+
+      # act
+      cache.set("c", 3)
+
+      # assert
+      self.assertIsNone(cache.get("b"))
+      self.assertEqual(cache.get("a"), 1)
+      self.assertEqual(cache.stats()["evictions"], 1)
+
+
+    def test_expired_entry_is_a_miss(self) -> None:
+      '''
+      Test that an entry older than its ttl is not returned
+      '''
+
+      # arrange
+      cache = LRUCache(maxsize=2, ttl=0.01)
+      cache.set("a", 1)
+
+      # act
+      time.sleep(0.02)
+
+      # assert
+      self.assertIsNone(cache.get("a"))
+      self.assertEqual(cache.stats()["expirations"], 1)
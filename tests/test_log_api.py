@@ -0,0 +1,503 @@
+from unittest import TestCase
+from sqlalchemy.exc import IntegrityError
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User, Log, FoodItem, DailyTotal
+from macronizer_cores.log_api.importer import NUTRIENT_FIELDS
+from datetime import date
+
+import csv
+import io
+import json
+
+
+# food item as sent by nutrition.js
+RICE = {
+  'name': 'white rice',
+  'sugar': 0.1,
+  'fiber': 0.4,
+  'servingSize': 100.0,
+  'sodium': 0.0,
+  'potassium': 43.0,
+  'saturatedFat': 0.1,
+  'totalFat': 0.3,
+  'calories': 132.0,
+  'cholesterol': 0.0,
+  'protein': 2.7,
+  'carbohydrate': 28.5
+}
+
+
+class LogApiTestCase(TestCase):
+    """Tests for the log write endpoints."""
+
+    def setUp(self):
+      """Set up test config and an authenticated client"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+      u1 = User(name="John Doe", email="john@example.com", username="johndoe", password="hashed")
+      db.session.add(u1)
+      db.session.commit()
+      self.u1 = u1
+
+      # authenticate the test client as u1
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u1.id)
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def log_rice(self, meal_no, date_string="2022-02-01"):
+      '''POST one serving of rice to a meal'''
+
+      payload = {"meal_no": meal_no, "food_items": [RICE], "date_string": date_string}
+      return self.client.post("/api/log/new", json=payload)
+
+
+    def test_logging_same_meal_twice_reuses_the_log(self) -> None:
+      '''
+      Test that POST /api/log/new adds items to the existing log of the meal
+      '''
+
+      # act
+      first = self.log_rice(1)
+      second = self.log_rice("1")
+
+      # assert
+      self.assertEqual(first.status_code, 201)
+      self.assertEqual(second.status_code, 201)
+      self.assertEqual(first.json["log"]["id"], second.json["log"]["id"])
+      self.assertEqual(len(second.json["log"]["food_items"]), 2)
+      self.assertEqual(Log.query.count(), 1)
+
+
+    def test_moving_item_to_existing_meal_reuses_the_log(self) -> None:
+      '''
+      Test that PATCH /api/log/update moves an item into the existing log of the target meal
+      '''
+
+      # arrange
+      breakfast = self.log_rice(1).json["log"]
+      lunch = self.log_rice(2).json["log"]
+      item_id = breakfast["food_items"][0]["id"]
+
+      # act
+      res = self.client.patch("/api/log/update", json={
+        "meal_no": 2,
+        "updated_item_id": item_id,
+        "date_string": "2022-02-01"
+      })
+
+      # assert
+      self.assertEqual(res.status_code, 201)
+      self.assertEqual(res.json["log"]["id"], lunch["id"])
+      self.assertEqual(len(res.json["log"]["food_items"]), 2)
+      self.assertEqual(FoodItem.query.get(item_id).log_id, lunch["id"])
+
+
+    def test_invalid_meal_no_is_rejected(self) -> None:
+      '''
+      Test that a missing or non-numeric meal_no is a 400 that writes nothing
+      '''
+
+      # arrange
+      item_id = self.log_rice(1).json["log"]["food_items"][0]["id"]
+
+      # act
+      missing = self.client.post("/api/log/new", json={"food_items": [RICE], "date_string": "2022-02-01"})
+      not_a_number = self.log_rice("lunch")
+      moved = self.client.patch("/api/log/update", json={
+        "meal_no": None,
+        "updated_item_id": item_id,
+        "date_string": "2022-02-02"
+      })
+
+      # assert
+      self.assertEqual([missing.status_code, not_a_number.status_code, moved.status_code], [400, 400, 400])
+      self.assertIn("meal_no", moved.json["message"])
+      self.assertEqual(FoodItem.query.count(), 1)
+      self.assertEqual([(day.date, day.item_count) for day in DailyTotal.query.all()], [(date(2022, 2, 1), 1)])
+
+
+    def test_duplicate_meal_log_is_rejected(self) -> None:
+      '''
+      Test that the db refuses two logs for the same user, date and meal no
+      '''
+
+      # arrange
+      db.session.add(Log(meal_no=1, date=date(2022, 2, 1), user_id=self.u1.id))
+      db.session.commit()
+
+      # act
+      db.session.add(Log(meal_no=1, date=date(2022, 2, 1), user_id=self.u1.id))
+
+      # assert
+      self.assertRaises(IntegrityError, db.session.commit)
+
+
+    def test_range_returns_logs_of_every_day(self) -> None:
+      '''
+      Test that GET /api/log/range returns the logs of every day in the range in /api/log/search format
+      '''
+
+      # arrange
+      self.log_rice(1, "2022-02-01")
+      self.log_rice(3, "2022-02-01")
+      self.log_rice(2, "2022-02-03")
+      self.log_rice(2, "2022-02-05")
+      expected = []
+      for date_string in ["2022-02-01", "2022-02-02", "2022-02-03"]:
+        day = self.client.get("/api/log/search", query_string={"date": date_string})
+        expected += day.json["meals_logged"]
+
+      # act
+      res = self.client.get("/api/log/range", query_string={"start": "2022-02-01", "end": "2022-02-03"})
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertTrue(res.is_streamed)
+      self.assertEqual(res.json, {"meals_logged": expected})
+      self.assertEqual([(meal["date"], meal["meal_no"]) for meal in expected], [
+        ("2022-02-01", 1), ("2022-02-01", 3), ("2022-02-03", 2)
+      ])
+
+
+    def test_range_span_is_limited(self) -> None:
+      '''
+      Test that GET /api/log/range rejects reversed or too long ranges
+      '''
+
+      # act
+      too_long = self.client.get("/api/log/range", query_string={"start": "2020-01-01", "end": "2022-01-01"})
+      reversed_range = self.client.get("/api/log/range", query_string={"start": "2022-01-02", "end": "2022-01-01"})
+      invalid = self.client.get("/api/log/range", query_string={"start": "yesterday", "end": "2022-01-01"})
+
+      # assert
+      self.assertEqual(too_long.status_code, 400)
+      self.assertEqual(reversed_range.status_code, 400)
+      self.assertEqual(invalid.status_code, 400)
+
+
+    def test_export_history_as_csv(self) -> None:
+      '''
+      Test that GET /api/log/export streams one CSV row per food item, oldest first
+      '''
+
+      # arrange
+      self.log_rice(2, "2022-02-03")
+      item_id = self.log_rice(1, "2022-02-01").json["log"]["food_items"][0]["id"]
+
+      # act
+      res = self.client.get("/api/log/export", query_string={"format": "csv"})
+      streamed = res.is_streamed
+      rows = list(csv.DictReader(io.StringIO(res.get_data(as_text=True))))
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertTrue(streamed)
+      self.assertEqual(res.mimetype, "text/csv")
+      self.assertIn("attachment", res.headers["Content-Disposition"])
+      self.assertEqual([(row["date"], row["meal_no"]) for row in rows], [("2022-02-01", "1"), ("2022-02-03", "2")])
+      self.assertEqual(rows[0]["food_item_id"], str(item_id))
+      self.assertEqual(rows[0]["name"], "white rice")
+      self.assertEqual(float(rows[0]["carbohydrate_gram"]), 28.5)
+
+
+    def test_export_history_as_ndjson_from_cli(self) -> None:
+      '''
+      Test that `flask log export --format ndjson` writes one JSON object per food item
+      '''
+
+      # arrange
+      self.log_rice(1, "2022-02-01")
+      self.log_rice(1, "2022-02-02")
+
+      # act
+      result = self.app.test_cli_runner().invoke(
+        args=["log", "export", "--user-id", str(self.u1.id), "--format", "ndjson", "--batch-size", "1"]
+      )
+      records = [json.loads(line) for line in result.output.splitlines()]
+
+      # assert
+      self.assertEqual(result.exit_code, 0, result.output)
+      self.assertEqual([record["date"] for record in records], ["2022-02-01", "2022-02-02"])
+      self.assertEqual(records[0]["calories"], 132.0)
+
+
+    def test_export_rejects_unknown_format(self) -> None:
+      '''
+      Test that GET /api/log/export only accepts csv and ndjson
+      '''
+
+      # act
+      res = self.client.get("/api/log/export", query_string={"format": "xml"})
+
+      # assert
+      self.assertEqual(res.status_code, 400)
+
+
+    def test_import_history_round_trip(self) -> None:
+      '''
+      Test that an export imported through POST /api/log/import recreates logs, items and daily totals
+      '''
+
+      # arrange
+      self.log_rice(1, "2022-02-01")
+      self.log_rice(1, "2022-02-01")
+      self.log_rice(3, "2022-02-02")
+      exported = self.client.get("/api/log/export", query_string={"format": "csv"}).get_data()
+      u2 = User(name="Jane Doe", email="jane@example.com", username="janedoe", password="hashed")
+      db.session.add(u2)
+      db.session.commit()
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u2.id)
+
+      # act
+      res = self.client.post(
+        "/api/log/import",
+        data={"file": (io.BytesIO(exported), "history.csv")},
+        content_type="multipart/form-data"
+      )
+
+      # assert
+      self.assertEqual(res.status_code, 201)
+      self.assertEqual(res.json, {"imported": 3, "rejected": 0, "errors": []})
+      self.assertEqual(Log.query.filter_by(user_id=u2.id).count(), 2)
+      totals = DailyTotal.query.filter_by(user_id=u2.id).order_by(DailyTotal.date).all()
+      self.assertEqual([(day.item_count, day.calories) for day in totals], [(2, 264.0), (1, 132.0)])
+
+
+    def test_import_without_filename_needs_format(self) -> None:
+      '''
+      Test that an upload without a file name is rejected unless ?format is given
+      '''
+
+      # arrange
+      row = {"date": "2022-02-01", "meal_no": 1, "name": "rice"}
+      row.update((field, 1.0) for field in NUTRIENT_FIELDS)
+      body = json.dumps(row).encode()
+
+      # act
+      missing = self.client.post(
+        "/api/log/import",
+        data={"file": (io.BytesIO(body), "")},
+        content_type="multipart/form-data"
+      )
+      explicit = self.client.post(
+        "/api/log/import",
+        query_string={"format": "ndjson"},
+        data={"file": (io.BytesIO(body), "")},
+        content_type="multipart/form-data"
+      )
+
+      # assert
+      self.assertEqual(missing.status_code, 400)
+      self.assertIn("file has no name", missing.json["message"])
+      self.assertEqual(explicit.status_code, 201)
+      self.assertEqual(explicit.json["imported"], 1)
+
+
+    def test_import_reports_invalid_rows(self) -> None:
+      '''
+      Test that `flask log import` skips and reports invalid rows and imports the valid ones
+      '''
+
+      # arrange
+      valid = {"date": "2022-02-01", "meal_no": 2, "name": "white rice", "sugar_gram": 0.1, "fiber_gram": 0.4,
+               "serving_size_gram": 100, "sodium_mg": 0, "potassium_mg": 43, "fat_saturation_gram": 0.1,
+               "fat_total_gram": 0.3, "calories": 132, "cholesterol_mg": 0, "protein_gram": 2.7,
+               "carbohydrate_gram": 28.5}
+      lines = [
+        json.dumps(valid),
+        json.dumps(dict(valid, meal_no=9)),
+        "not json",
+        json.dumps(dict(valid, calories="lots")),
+        json.dumps(dict(valid, date="2022-02-02"))
+      ]
+      runner = self.app.test_cli_runner()
+
+      # act
+      with runner.isolated_filesystem():
+        with open("history.ndjson", "w") as f:
+          f.write("\n".join(lines))
+        result = runner.invoke(args=["log", "import", "--user-id", str(self.u1.id), "--chunk-size", "1", "history.ndjson"])
+
+      # assert
+      self.assertEqual(result.exit_code, 0, result.output)
+      self.assertIn("Imported 2 rows (3 rejected)", result.output)
+      self.assertIn("line 2: meal_no must be an integer between 1 and 5", result.output)
+      self.assertEqual(FoodItem.query.count(), 2)
+
+
+    def test_import_rejects_non_finite_numbers(self) -> None:
+      '''
+      Test that nan/inf nutrient values are reported as invalid rows instead of reaching the daily totals
+      '''
+
+      # arrange
+      valid = {"date": "2022-02-01", "meal_no": "2", "name": "white rice", **{field: "1" for field in NUTRIENT_FIELDS}}
+      rows = [valid, dict(valid, calories="nan"), dict(valid, sodium_mg="inf"), dict(valid, protein_gram="-inf")]
+      runner = self.app.test_cli_runner()
+
+      # act
+      with runner.isolated_filesystem():
+        with open("history.csv", "w", newline="") as f:
+          writer = csv.DictWriter(f, fieldnames=list(valid))
+          writer.writeheader()
+          writer.writerows(rows)
+        result = runner.invoke(args=["log", "import", "--user-id", str(self.u1.id), "history.csv"])
+
+      # assert
+      self.assertEqual(result.exit_code, 0, result.output)
+      self.assertIn("Imported 1 rows (3 rejected)", result.output)
+      self.assertIn("calories must be a finite number", result.output)
+      self.assertEqual(DailyTotal.query.one().calories, 1.0)
+
+
+    def test_batch_applies_operations_in_one_transaction(self) -> None:
+      '''
+      Test that POST /api/log/batch adds, moves and deletes items and returns the touched days
+      '''
+
+      # arrange
+      breakfast = self.log_rice(1).json["log"]
+      self.log_rice(1)
+      first_id, second_id = [item["id"] for item in self.client.get("/api/log/search", query_string={"date": "2022-02-01"}).json["meals_logged"][0]["food_items"]]
+
+      # act
+      res = self.client.post("/api/log/batch", json={"operations": [
+        {"op": "add", "date_string": "2022-02-02", "meal_no": 3, "food_items": [RICE, RICE]},
+        {"op": "move", "item_ids": [first_id], "date_string": "2022-02-02", "meal_no": 3},
+        {"op": "delete", "item_ids": [second_id]}
+      ]})
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      meals = res.json["meals_logged"]
+      self.assertEqual([(meal["date"], meal["meal_no"], len(meal["food_items"])) for meal in meals], [
+        ("2022-02-01", 1, 0),
+        ("2022-02-02", 3, 3)
+      ])
+      self.assertEqual(meals[0]["id"], breakfast["id"])
+      self.assertIn(first_id, [item["id"] for item in meals[1]["food_items"]])
+      totals = {day.date.isoformat(): day.item_count for day in DailyTotal.query.all()}
+      self.assertEqual(totals, {"2022-02-01": 0, "2022-02-02": 3})
+
+
+    def test_batch_clears_a_day(self) -> None:
+      '''
+      Test that a clear_day operation removes every log of the day and its items
+      '''
+
+      # arrange
+      self.log_rice(1)
+      self.log_rice(2)
+      self.log_rice(1, "2022-02-02")
+
+      # act
+      res = self.client.post("/api/log/batch", json={"operations": [
+        {"op": "clear_day", "date_string": "2022-02-01"}
+      ]})
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertEqual(res.json["meals_logged"], [])
+      self.assertEqual(Log.query.count(), 1)
+      self.assertEqual(FoodItem.query.count(), 1)
+      self.assertEqual(DailyTotal.query.filter_by(date=date(2022, 2, 1)).one().item_count, 0)
+
+
+    def test_invalid_batch_is_not_applied(self) -> None:
+      '''
+      Test that a batch with an invalid operation is rejected without writing anything
+      '''
+
+      # arrange
+      item_id = self.log_rice(1).json["log"]["food_items"][0]["id"]
+
+      # act
+      res = self.client.post("/api/log/batch", json={"operations": [
+        {"op": "delete", "item_ids": [item_id]},
+        {"op": "move", "item_ids": [item_id], "date_string": "2022-02-02", "meal_no": 7}
+      ]})
+
+      # assert
+      self.assertEqual(res.status_code, 400)
+      self.assertIn("operations[1]", res.json["message"])
+      self.assertEqual(FoodItem.query.count(), 1)
+
+
+    def test_batch_add_rejects_invalid_food_items(self) -> None:
+      '''
+      Test that add operations with malformed food items are rejected before anything is written
+      '''
+
+      # arrange
+      self.log_rice(1)
+      bad_items = [
+        [{"name": "x"}],
+        ["bad"],
+        [dict(RICE, name="")],
+        [dict(RICE, calories="lots")]
+      ]
+
+      for food_items in bad_items:
+        # act
+        res = self.client.post("/api/log/batch", json={"operations": [
+          {"op": "clear_day", "date_string": "2022-02-01"},
+          {"op": "add", "date_string": "2022-02-01", "meal_no": 2, "food_items": food_items}
+        ]})
+
+        # assert
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("operations[1]", res.json["message"])
+        self.assertEqual(FoodItem.query.count(), 1)
+
+
+    def test_batch_ignores_items_of_other_users(self) -> None:
+      '''
+      Test that batch moves and deletes only touch the items of the current user
+      '''
+
+      # arrange
+      item_id = self.log_rice(1).json["log"]["food_items"][0]["id"]
+      u2 = User(name="Jane Doe", email="jane@example.com", username="janedoe", password="hashed")
+      db.session.add(u2)
+      db.session.commit()
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u2.id)
+
+      # act
+      res = self.client.post("/api/log/batch", json={"operations": [
+        {"op": "delete", "item_ids": [item_id]}
+      ]})
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertEqual(FoodItem.query.count(), 1)
+      self.assertEqual(DailyTotal.query.filter_by(user_id=self.u1.id).one().item_count, 1)
+
+
+    def test_responses_default_to_no_store(self) -> None:
+      '''
+      Test that responses without their own cache policy are not stored
+      '''
+
+      # act
+      res = self.client.post("/api/log/batch", json={"operations": []})
+
+      # assert
+      self.assertEqual(res.status_code, 400)
+      self.assertEqual(res.headers["Cache-Control"], "no-store")
@@ -0,0 +1,178 @@
+from unittest import TestCase
+from contextlib import contextmanager
+from sqlalchemy import event
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User, Log, FoodItem
+from datetime import date
+
+
+@contextmanager
+def count_queries(engine):
+  '''Count the SQL statements executed on engine inside the block'''
+
+  statements = []
+
+  def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements.append(statement)
+
+  event.listen(engine, "before_cursor_execute", before_cursor_execute)
+  try:
+    yield statements
+  finally:
+    event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def make_food_item(name, log_id):
+  '''Build a food item with placeholder nutrients'''
+
+  return FoodItem(
+    name=name,
+    sugar_gram=0,
+    fiber_gram=0,
+    serving_size_gram=100,
+    sodium_mg=0,
+    potassium_mg=0,
+    fat_saturation_gram=0,
+    fat_total_gram=0,
+    calories=100,
+    cholesterol_mg=0,
+    protein_gram=10,
+    carbohydrate_gram=0,
+    log_id=log_id
+  )
+
+
+class LogQueryCountTestCase(TestCase):
+    """Regression tests for the number of queries issued by the log read path."""
+
+    def setUp(self):
+      """Seed a user with five meals of three items each"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+      u1 = User(name="John Doe", email="john@example.com", username="johndoe", password="hashed")
+      db.session.add(u1)
+      db.session.commit()
+      self.u1 = u1
+
+      for meal_no in range(1, 6):
+        log = Log(meal_no=meal_no, date=date(2022, 2, 1), user_id=u1.id)
+        db.session.add(log)
+        db.session.flush()
+        db.session.add_all([make_food_item(f"food {meal_no}.{i}", log.id) for i in range(3)])
+      db.session.commit()
+
+      # authenticate the test client as u1
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u1.id)
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def test_search_by_date_has_bounded_query_count(self) -> None:
+      '''
+      Test that GET /api/log/search loads logs and food items without one query per log
+      '''
+
+      # act
+      with count_queries(db.engine) as statements:
+        res = self.client.get("/api/log/search", query_string={"date": "2022-02-01"})
+
+      # assert
+      meals = res.json["meals_logged"]
+      self.assertEqual([meal["meal_no"] for meal in meals], [1, 2, 3, 4, 5])
+      self.assertEqual(sum(len(meal["food_items"]) for meal in meals), 15)
+      # user loader + joined logs/items
+      self.assertLessEqual(len(statements), 2, statements)
+
+
+    def test_range_uses_a_single_query(self) -> None:
+      '''
+      Test that GET /api/log/range reads logs and food items with one query
+      '''
+
+      # act
+      with count_queries(db.engine) as statements:
+        res = self.client.get("/api/log/range", query_string={"start": "2022-01-01", "end": "2022-02-28"})
+        meals = res.json["meals_logged"]
+
+      # assert
+      self.assertEqual(sum(len(meal["food_items"]) for meal in meals), 15)
+      # user loader + joined logs/items
+      self.assertLessEqual(len(statements), 2, statements)
+
+
+    def test_search_matches_orm_serialization(self) -> None:
+      '''
+      Test that the row based serializer of GET /api/log/search returns the same JSON as Log.serialize()
+      '''
+
+      # arrange
+      expected = [log.serialize() for log in Log.query.filter_by(user_id=self.u1.id).order_by(Log.meal_no).all()]
+
+      # act
+      res = self.client.get("/api/log/search", query_string={"date": "2022-02-01"})
+
+      # assert
+      self.assertEqual(res.mimetype, "application/json")
+      self.assertEqual(res.json["meals_logged"], expected)
+
+
+    def test_matching_etag_is_answered_without_reading_logs(self) -> None:
+      '''
+      Test that GET /api/log/search answers a matching If-None-Match with 304 without reading any log row
+      '''
+
+      # arrange
+      first = self.client.get("/api/log/search", query_string={"date": "2022-02-01"})
+      etag = first.headers["ETag"]
+
+      # act
+      with count_queries(db.engine) as statements:
+        res = self.client.get("/api/log/search", query_string={"date": "2022-02-01"}, headers={"If-None-Match": etag})
+
+      # assert
+      self.assertEqual(res.status_code, 304)
+      self.assertEqual(res.headers["ETag"], etag)
+      self.assertEqual(res.headers["Cache-Control"], "private, no-cache")
+      self.assertFalse([statement for statement in statements if "meal_logs" in statement or "food_items" in statement], statements)
+
+
+    def test_log_write_changes_the_etag(self) -> None:
+      '''
+      Test that a log write bumps the version of its date so cached reads of that date are refetched
+      '''
+
+      # arrange
+      search = {"date": "2022-02-01"}
+      day_etag = self.client.get("/api/log/search", query_string=search).headers["ETag"]
+      range_query = {"start": "2022-01-01", "end": "2022-02-28"}
+      range_etag = self.client.get("/api/log/range", query_string=range_query).headers["ETag"]
+      other_day = {"date": "2022-02-02"}
+      other_etag = self.client.get("/api/log/search", query_string=other_day).headers["ETag"]
+      item_id = FoodItem.query.first().id
+
+      # act
+      self.client.delete(f"/api/food/delete/{item_id}")
+      day = self.client.get("/api/log/search", query_string=search, headers={"If-None-Match": day_etag})
+      day_range = self.client.get("/api/log/range", query_string=range_query, headers={"If-None-Match": range_etag})
+      other = self.client.get("/api/log/search", query_string=other_day, headers={"If-None-Match": other_etag})
+
+      # assert
+      self.assertEqual(day.status_code, 200)
+      self.assertNotEqual(day.headers["ETag"], day_etag)
+      self.assertEqual(sum(len(meal["food_items"]) for meal in day.json["meals_logged"]), 14)
+      self.assertEqual(day_range.status_code, 200)
+      self.assertEqual(other.status_code, 304)
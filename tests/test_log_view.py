@@ -2,7 +2,7 @@ from flask import url_for
 from unittest import TestCase
 from config import TestConfig
 from flask_login import login_user, current_user
-from macronizer_cores import create_app, CURRENT_USER
+from macronizer_cores import create_app
 from macronizer_cores.models import db, User, Log, FoodItem
 from datetime import datetime
 
@@ -0,0 +1,160 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User
+from macronizer_cores.food_item_api.client import nutrition_client
+from macronizer_cores.metrics.utils import metrics, mark_process_dead
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+class MetricsTestCase(TestCase):
+    """Tests for the request / SQL / upstream metrics and /metrics."""
+
+    def setUp(self):
+      """Set up test config, an authenticated client and empty metrics"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+      metrics.reset()
+
+      u1 = User(name="John Doe", email="john@example.com", username="johndoe", password="hashed")
+      db.session.add(u1)
+      db.session.commit()
+
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u1.id)
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def test_request_latency_and_sql_count(self) -> None:
+      '''Test that a request is timed by endpoint and its SQL statements are counted'''
+
+      # act
+      self.client.get("/api/log/search?date=2022-01-01")
+      res = self.client.get("/metrics")
+      body = res.get_data(as_text=True)
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertIn('macronizer_http_requests_total{blueprint="log_api",endpoint="log_api.search_meals_logged_by_date",method="GET",status="200"} 1', body)
+      self.assertIn('macronizer_http_request_duration_seconds_count{blueprint="log_api",endpoint="log_api.search_meals_logged_by_date",method="GET"} 1', body)
+      self.assertIn('macronizer_sql_statements_per_request_count{blueprint="log_api",endpoint="log_api.search_meals_logged_by_date"} 1', body)
+      self.assertIn('macronizer_sql_statement_duration_seconds_bucket{blueprint="log_api",endpoint="log_api.search_meals_logged_by_date",le="+Inf"}', body)
+      self.assertIn("macronizer_db_pool_connections_in_use", body)
+      self.assertIn("# TYPE macronizer_db_pool_checkouts_total counter", body)
+
+
+    def test_upstream_calls_recorded(self) -> None:
+      '''Test that nutrition API calls are recorded with their status'''
+
+      # arrange
+      with patch.object(nutrition_client.session, "get", return_value=MagicMock(status_code=200)):
+        # act
+        nutrition_client.search("1 egg")
+      body = metrics.render()
+
+      # assert
+      self.assertIn('macronizer_upstream_requests_total{status="200",upstream="calorieninjas"} 1', body)
+      self.assertIn('macronizer_upstream_request_duration_seconds_count{upstream="calorieninjas"} 1', body)
+
+
+    def test_workers_aggregated(self) -> None:
+      '''Test that /metrics adds up the files of every worker, gauges of live workers only'''
+
+      # arrange
+      directory = tempfile.mkdtemp()
+      self.addCleanup(shutil.rmtree, directory)
+      dead = subprocess.Popen([sys.executable, "-c", "pass"])
+      dead.wait()
+      with open(os.path.join(directory, "worker_{}.json".format(dead.pid)), "w") as f:
+        json.dump({
+          "pid": dead.pid,
+          "counters": [["upstream_requests_total", [["status", "200"], ["upstream", "calorieninjas"]], 4]],
+          "histograms": [],
+          "gauges": {"db_pool_connections_in_use": 7}
+        }, f)
+      metrics.directory = directory
+      self.addCleanup(setattr, metrics, "directory", None)
+      metrics.observe_upstream("calorieninjas", 200, 0.01)
+
+      # act
+      body = metrics.render()
+
+      # assert
+      self.assertIn('macronizer_upstream_requests_total{status="200",upstream="calorieninjas"} 5', body)
+      self.assertIn("macronizer_db_pool_connections_in_use 0", body)
+      self.assertTrue(os.path.exists(os.path.join(directory, "worker_{}.json".format(os.getpid()))))
+
+
+    def test_exited_worker_counts_are_kept(self) -> None:
+      '''Test that the file of an exited worker is merged, so its counters never go back'''
+
+      # arrange
+      directory = tempfile.mkdtemp()
+      self.addCleanup(shutil.rmtree, directory)
+      metrics.directory = directory
+      self.addCleanup(setattr, metrics, "directory", None)
+      for pid in (101, 102):
+        with open(os.path.join(directory, "worker_{}.json".format(pid)), "w") as f:
+          json.dump({
+            "pid": pid,
+            "counters": [["user_cache_hits_total", [], 3]],
+            "histograms": [],
+            "gauges": {"db_pool_connections_in_use": 1}
+          }, f)
+
+      # act
+      mark_process_dead(directory, 101)
+      mark_process_dead(directory, 102)
+      body = metrics.render()
+
+      # assert
+      self.assertEqual(sorted(os.listdir(directory)), ["worker_{}.json".format(os.getpid()), "worker_exited.json"])
+      own = metrics.snapshot()["counters"]
+      own_hits = sum(value for name, labels, value in own if name == "user_cache_hits_total")
+      self.assertIn("macronizer_user_cache_hits_total {}".format(6 + own_hits), body)
+
+
+    def test_metrics_token(self) -> None:
+      '''Test that /metrics requires the bearer token when METRICS_TOKEN is set'''
+
+      # arrange
+      self.app.config["METRICS_TOKEN"] = "secret"
+
+      # act
+      denied = self.client.get("/metrics")
+      allowed = self.client.get("/metrics", headers={"Authorization": "Bearer secret"})
+
+      # assert
+      self.assertEqual(denied.status_code, 401)
+      self.assertEqual(allowed.status_code, 200)
+
+
+    def test_metrics_local_only_without_token(self) -> None:
+      '''Test that /metrics only answers local clients when METRICS_TOKEN is not set'''
+
+      # act
+      remote = self.client.get("/metrics", environ_base={"REMOTE_ADDR": "203.0.113.7"})
+      local = self.client.get("/metrics")
+
+      # assert
+      self.assertEqual(remote.status_code, 403)
+      self.assertEqual(local.status_code, 200)
@@ -0,0 +1,118 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User, Log
+from macronizer_cores.metrics.diagnostics import query_diagnostics, statement_shape, QueryBudgetExceeded
+from macronizer_cores.food_item_api.client import nutrition_client
+from datetime import date
+
+
+class QueryDiagnosticsTestCase(TestCase):
+    """Tests for the slow-query log, N+1 detector and query budget."""
+
+    def setUp(self):
+      """Set up test config, an authenticated client and five logs"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+      u1 = User(name="John Doe", email="john@example.com", username="johndoe", password="hashed")
+      db.session.add(u1)
+      db.session.commit()
+      logs = [Log(date=date(2022, 2, 1), user_id=u1.id, meal_no=n) for n in range(1, 6)]
+      db.session.add_all(logs)
+      db.session.commit()
+      self.log_ids = [log.id for log in logs]
+
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u1.id)
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def test_statement_shape(self) -> None:
+      '''Test that literals and IN lists of any length have the same shape'''
+
+      # act
+      one = statement_shape("SELECT * FROM logs WHERE id IN (?) AND name = 'a'")
+      three = statement_shape("SELECT *  FROM logs\nWHERE id IN (?, ?, ?) AND name = 'b'")
+
+      # assert
+      self.assertEqual(one, three)
+
+
+    def test_n_plus_one_logged(self) -> None:
+      '''Test that a statement repeated in a loop is reported as a suspected N+1'''
+
+      # arrange
+      def load_one_by_one():
+        return {"meals": [Log.query.get(log_id).meal_no for log_id in self.log_ids]}
+      self.app.add_url_rule("/test/n-plus-one", "n_plus_one", load_one_by_one)
+      db.session.expire_all()
+
+      # act
+      with self.assertLogs(self.app.logger, "WARNING") as logs:
+        self.client.get("/test/n-plus-one")
+
+      # assert
+      self.assertIn("Suspected N+1 in n_plus_one: statement run 5 times", logs.output[0])
+
+
+    def test_query_budget_exceeded(self) -> None:
+      '''Test that a request over the budget of its endpoint fails under TestConfig'''
+
+      # arrange
+      view = self.app.view_functions["log_api.search_meals_logged_by_date"]
+
+      # act / assert
+      with patch.object(view, "query_budget", 0):
+        with self.assertRaises(QueryBudgetExceeded):
+          self.client.get("/api/log/search?date=2022-02-01")
+
+
+    @patch.object(nutrition_client, "search")
+    def test_food_search_budget_does_not_grow_with_ingredients(self, mock_search) -> None:
+      '''Test that a search of many new ingredients stays within the constant budget of the route'''
+
+      # arrange
+      foods = ["egg", "rice", "apple", "oats", "milk", "tofu", "salmon", "pasta"]
+      mock_search.return_value = MagicMock(status_code=200)
+      mock_search.return_value.json.return_value = {
+        "items": [{"name": food, "serving_size_g": 100.0} for food in foods]
+      }
+
+      # act
+      with patch.object(self.app.logger, "warning") as warning:
+        res = self.client.get("/api/food/search", query_string={"queryString": " and ".join(foods)})
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertEqual(len(res.json["items"]), len(foods))
+      self.assertFalse(any("N+1" in str(call) for call in warning.call_args_list))
+
+
+    def test_slow_query_logged_with_plan(self) -> None:
+      '''Test that a statement over the threshold is logged with its endpoint and plan'''
+
+      # act
+      with patch.object(query_diagnostics, "slow_threshold", 0):
+        with self.assertLogs(self.app.logger, "WARNING") as logs:
+          self.client.get("/api/log/search?date=2022-02-01")
+
+      # assert
+      slow = [line for line in logs.output if "Slow query" in line]
+      self.assertTrue(slow)
+      self.assertIn("log_api.search_meals_logged_by_date", slow[-1])
+      self.assertIn("Plan:", slow[-1])
+      self.assertRegex(slow[-1], "SCAN|SEARCH")
@@ -0,0 +1,95 @@
+from unittest import TestCase
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User, Log, FoodItem, DailyTotal
+from macronizer_cores.summary_api.utils import totals_of_items
+from datetime import date
+from seed import generate, PASSWORD, DEFAULT_END_DATE
+
+
+class SeedTestCase(TestCase):
+    """Tests for the synthetic dataset generator (seed.py)."""
+
+    def setUp(self):
+      """Set up test config and empty tables"""
+
+      self.app = create_app(TestConfig)
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def dataset(self) -> list:
+      '''Every generated log with its items, in id order'''
+
+      return [
+        (log.user_id, log.date, log.meal_no, [(item.name, item.calories) for item in log.food_items])
+        for log in Log.query.order_by(Log.id)
+      ]
+
+
+    def test_same_seed_same_rows(self) -> None:
+      '''Test that a seed always generates the same users, logs and food items'''
+
+      # arrange
+      counts = generate(3, 10, seed=7, end_date=date(2022, 3, 31), chunk_size=20)
+      first = self.dataset()
+      db.drop_all()
+      db.create_all()
+
+      # act
+      generate(3, 10, seed=7, end_date=date(2022, 3, 31), chunk_size=1000)
+
+      # assert
+      self.assertEqual(self.dataset(), first)
+      self.assertEqual(User.query.count(), counts["users"])
+      self.assertEqual(Log.query.count(), counts["meal_logs"])
+      self.assertEqual(FoodItem.query.count(), counts["food_items"])
+      self.assertTrue(all(date(2022, 3, 22) <= log[1] <= date(2022, 3, 31) for log in first))
+
+
+    def test_default_end_date_is_fixed(self) -> None:
+      '''Test that without an end date the logs end on a fixed day, not today'''
+
+      # act
+      generate(2, 5, seed=11)
+
+      # assert
+      self.assertEqual(max(log[1] for log in self.dataset()), DEFAULT_END_DATE)
+
+
+    def test_generated_users_can_log_in(self) -> None:
+      '''Test that appended users get new ids and the documented password'''
+
+      # arrange
+      generate(2, 3, seed=1, end_date=date(2022, 3, 31))
+
+      # act
+      generate(2, 3, seed=2, end_date=date(2022, 3, 31))
+
+      # assert
+      self.assertEqual([user.username for user in User.query.order_by(User.id)], ["user1", "user2", "user3", "user4"])
+      self.assertTrue(User.authenticate("user4", PASSWORD))
+
+
+    def test_daily_totals_rebuilt(self) -> None:
+      '''Test that daily_totals matches the generated food items'''
+
+      # act
+      generate(2, 5, seed=3, end_date=date(2022, 3, 31))
+      expected = totals_of_items()
+
+      # assert
+      totals = DailyTotal.query.all()
+      self.assertEqual(len(totals), len(expected))
+      for total in totals:
+        self.assertAlmostEqual(total.calories, expected[(total.user_id, total.date)]["calories"], places=4)
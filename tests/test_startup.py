@@ -0,0 +1,60 @@
+from unittest import TestCase
+from config import TestConfig, DevelopmentConfig
+from macronizer_cores import create_app
+
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class StartupTestCase(TestCase):
+    """Tests for the extensions and modules loaded at startup."""
+
+    def test_production_import_skips_dev_modules(self) -> None:
+      '''Test that a production worker loads neither the debug toolbar nor the form validators'''
+
+      # arrange
+      env = dict(os.environ, FLASK_ENV="production", SECRET_KEY="test", DATABASE_URL="sqlite://")
+      code = "import sys, macronizer; print(' '.join(m for m in ('flask_debugtoolbar', 'email_validator', 'distutils') if m in sys.modules))"
+
+      # act
+      result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+      # assert
+      self.assertEqual(result.stdout.strip(), "")
+
+
+    def test_debug_toolbar_only_in_debug(self) -> None:
+      '''Test that the debug toolbar is registered for a debug config only'''
+
+      # arrange
+      class DebugConfig(DevelopmentConfig):
+        SECRET_KEY = "test"
+        SQLALCHEMY_DATABASE_URI = "sqlite://"
+
+      # act
+      debug_app = create_app(DebugConfig)
+      test_app = create_app(TestConfig)
+
+      # assert
+      def toolbar_hooks(app):
+        return [f for f in app.before_request_funcs[None] if "DebugToolbar" in repr(f)]
+      self.assertEqual(len(toolbar_hooks(debug_app)), 1)
+      self.assertEqual(toolbar_hooks(test_app), [])
+
+
+    def test_login_page_renders(self) -> None:
+      '''Test that the login form (imported on first use) renders'''
+
+      # arrange
+      app = create_app(TestConfig)
+
+      # act
+      res = app.test_client().get("/login")
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertIn(b"password", res.data.lower())
@@ -0,0 +1,162 @@
+from unittest import TestCase
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User, DailyTotal, LogVersion
+
+
+def food(name, calories, protein):
+  '''Food item as sent by nutrition.js'''
+
+  return {
+    'name': name,
+    'sugar': 0.0,
+    'fiber': 0.0,
+    'servingSize': 100.0,
+    'sodium': 0.0,
+    'potassium': 0.0,
+    'saturatedFat': 0.0,
+    'totalFat': 1.0,
+    'calories': calories,
+    'cholesterol': 0.0,
+    'protein': protein,
+    'carbohydrate': 10.0
+  }
+
+
+class SummaryApiTestCase(TestCase):
+    """Tests for the daily totals rollup and GET /api/summary."""
+
+    def setUp(self):
+      """Set up test config and an authenticated client"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+      u1 = User(name="John Doe", email="john@example.com", username="johndoe", password="hashed")
+      db.session.add(u1)
+      db.session.commit()
+      self.u1 = u1
+
+      # authenticate the test client as u1
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u1.id)
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def log_meal(self, meal_no, date_string, items):
+      '''POST a meal and return the created log'''
+
+      payload = {"meal_no": meal_no, "food_items": items, "date_string": date_string}
+      return self.client.post("/api/log/new", json=payload).json["log"]
+
+
+    def summary(self, start, end):
+      '''GET /api/summary for a range'''
+
+      return self.client.get("/api/summary", query_string={"start": start, "end": end})
+
+
+    def daily_totals(self):
+      '''Snapshot of the rollup table'''
+
+      db.session.expire_all()
+      return {(day.user_id, day.date): day.serialize() for day in DailyTotal.query.all()}
+
+
+    def test_totals_follow_log_writes(self) -> None:
+      '''
+      Test that logging, moving and deleting food items keep the daily totals up to date
+      '''
+
+      # arrange
+      breakfast = self.log_meal(1, "2022-02-01", [food("egg", 140.0, 12.0), food("toast", 80.0, 3.0)])
+      self.log_meal(2, "2022-02-02", [food("rice", 130.0, 2.7)])
+      egg_id = breakfast["food_items"][0]["id"]
+      toast_id = breakfast["food_items"][1]["id"]
+
+      # act
+      # move the egg to the next day and delete the toast
+      self.client.patch("/api/log/update", json={"meal_no": 1, "updated_item_id": egg_id, "date_string": "2022-02-02"})
+      self.client.delete(f"/api/food/delete/{toast_id}")
+      res = self.summary("2022-02-01", "2022-02-28")
+
+      # assert
+      self.assertEqual(res.status_code, 200)
+      self.assertEqual(len(res.json["daily_totals"]), 1)
+      day = res.json["daily_totals"][0]
+      self.assertEqual(day["date"], "2022-02-02")
+      self.assertEqual(day["item_count"], 2)
+      self.assertEqual(day["calories"], 270.0)
+      self.assertEqual(day["protein_gram"], 14.7)
+      self.assertEqual(res.json["totals"]["calories"], 270.0)
+      self.assertEqual(res.json["totals"]["item_count"], 2)
+
+
+    def test_other_users_items_are_not_touched(self) -> None:
+      '''
+      Test that moving or deleting another user's food item is a 404 that leaves their totals alone
+      '''
+
+      # arrange
+      item_id = self.log_meal(1, "2022-02-01", [food("egg", 140.0, 12.0)])["food_items"][0]["id"]
+      u2 = User(name="Jane Doe", email="jane@example.com", username="janedoe", password="hashed")
+      db.session.add(u2)
+      db.session.commit()
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u2.id)
+      before = self.daily_totals()
+      versions = [(v.user_id, v.date, v.version) for v in LogVersion.query.all()]
+
+      # act
+      moved = self.client.patch("/api/log/update", json={"meal_no": 2, "updated_item_id": item_id, "date_string": "2022-02-03"})
+      deleted = self.client.delete(f"/api/food/delete/{item_id}")
+
+      # assert
+      self.assertEqual(moved.status_code, 404)
+      self.assertEqual(deleted.status_code, 404)
+      self.assertEqual(self.daily_totals(), before)
+      self.assertEqual([(v.user_id, v.date, v.version) for v in LogVersion.query.all()], versions)
+
+
+    def test_rebuild_matches_incremental_totals(self) -> None:
+      '''
+      Test that `flask summary rebuild` recomputes the same totals as the incremental updates
+      '''
+
+      # arrange
+      self.log_meal(1, "2022-02-01", [food("egg", 140.0, 12.0), food("toast", 80.0, 3.0)])
+      self.log_meal(3, "2022-02-01", [food("rice", 130.0, 2.7)])
+      self.log_meal(1, "2022-02-03", [food("apple", 95.0, 0.5)])
+      incremental = self.daily_totals()
+
+      # act
+      result = self.app.test_cli_runner().invoke(args=["summary", "rebuild"])
+
+      # assert
+      self.assertIn("Rebuilt 2 daily totals", result.output)
+      self.assertEqual(self.daily_totals(), incremental)
+
+
+    def test_summary_range_is_validated(self) -> None:
+      '''
+      Test that GET /api/summary rejects invalid ranges
+      '''
+
+      # act
+      reversed_range = self.summary("2022-02-02", "2022-02-01")
+      invalid = self.summary("2022-02-01", "tomorrow")
+
+      # assert
+      self.assertEqual(reversed_range.status_code, 400)
+      self.assertEqual(invalid.status_code, 400)
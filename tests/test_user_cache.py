@@ -0,0 +1,124 @@
+from unittest import TestCase
+from config import TestConfig
+from macronizer_cores import create_app
+from macronizer_cores.models import db, User
+from macronizer_cores.auth.cache import user_cache
+from test_log_queries import count_queries
+
+
+class UserCacheTestCase(TestCase):
+    """Tests for the cached flask_login user loader."""
+
+    def setUp(self):
+      """Set up test config and an authenticated client"""
+
+      self.app = create_app(TestConfig)
+      self.client = self.app.test_client()
+      self.app_context = self.app.app_context()
+      self.app_context.push()
+
+      db.drop_all()
+      db.create_all()
+
+      u1 = User(name="John Doe", email="john@example.com", username="johndoe", password="hashed")
+      db.session.add(u1)
+      db.session.commit()
+      self.user_id = u1.id
+
+      # authenticate the test client as u1
+      with self.client.session_transaction() as session:
+        session["_user_id"] = str(u1.id)
+
+
+    def tearDown(self):
+      """Clean up fouled transactions."""
+
+      db.session.rollback()
+      self.app_context.pop()
+
+
+    def get(self, url, **kwargs):
+      '''GET with an empty identity map, as in a new request of a worker'''
+
+      db.session.expunge_all()
+      return self.client.get(url, **kwargs)
+
+
+    def test_cached_user_skips_users_table(self) -> None:
+      '''
+      Test that only the first request of a user reads the users table
+      '''
+
+      # act
+      with count_queries(db.engine) as first:
+        self.get("/api/log/search", query_string={"date": "2022-02-01"})
+      with count_queries(db.engine) as second:
+        self.get("/api/log/search", query_string={"date": "2022-02-01"})
+
+      # assert
+      self.assertTrue([statement for statement in first if "FROM users" in statement])
+      self.assertFalse([statement for statement in second if "FROM users" in statement], second)
+      self.assertEqual(user_cache.stats()["hits"], 1)
+
+
+    def test_update_user_invalidates_cache(self) -> None:
+      '''
+      Test that PUT /api/user/edit drops the cached user so the next request sees the changes
+      '''
+
+      # arrange
+      self.get("/api/log/search", query_string={"date": "2022-02-01"})
+      db.session.expunge_all()
+
+      # act
+      res = self.client.put("/api/user/edit", json={"name": "Johnny", "email": "john@example.com", "username": "johndoe"})
+      with count_queries(db.engine) as statements:
+        self.get("/api/log/search", query_string={"date": "2022-02-01"})
+      stats = self.get("/api/user/cache/stats")
+
+      # assert
+      self.assertEqual(res.status_code, 201)
+      self.assertTrue([statement for statement in statements if "FROM users" in statement])
+      self.assertEqual(stats.json["cache"]["size"], 1)
+      self.assertEqual(user_cache.memory.get(self.user_id)["name"], "Johnny")
+
+
+    def test_cached_user_can_be_updated(self) -> None:
+      '''
+      Test that a user attached from the cache is persisted normally, lazily loading uncached columns
+      '''
+
+      # arrange
+      self.get("/api/log/search", query_string={"date": "2022-02-01"})
+      db.session.expunge_all()
+
+      # act
+      with self.app.test_request_context():
+        user = user_cache.load(User, self.user_id)
+        password = user.password
+        user.name = "Johnny"
+        db.session.commit()
+      db.session.expunge_all()
+
+      # assert
+      self.assertEqual(password, "hashed")
+      self.assertEqual(User.query.get(self.user_id).name, "Johnny")
+
+
+    def test_session_snapshot_serves_user_on_a_new_worker(self) -> None:
+      '''
+      Test that with USER_SESSION_SNAPSHOT the signed session snapshot replaces the db lookup on a cold cache
+      '''
+
+      # arrange
+      user_cache.snapshot_enabled = True
+      self.get("/api/log/search", query_string={"date": "2022-02-01"})
+      user_cache.memory.clear()
+
+      # act
+      with count_queries(db.engine) as statements:
+        self.get("/api/log/search", query_string={"date": "2022-02-01"})
+
+      # assert
+      self.assertFalse([statement for statement in statements if "FROM users" in statement], statements)
+      self.assertEqual(user_cache.stats()["snapshot_hits"], 1)
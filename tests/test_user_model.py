@@ -2,6 +2,8 @@ from unittest import TestCase
 from config import TestConfig
 from macronizer_cores import create_app 
 from macronizer_cores.models import db, User
+from macronizer_cores.auth.hashing import password_hasher, hash_cost, HashingBusyError
+from macronizer_cores import bcrypt
 
 
 class UserModelTestCase(TestCase):
@@ -75,3 +77,41 @@ class UserModelTestCase(TestCase):
 
       # assert
       self.assertFalse(expected_user)
+
+
+    def test_authenticate_rehashes_with_configured_cost(self) -> None:
+      '''
+      Test that a successful login upgrades a hash made with another work factor
+      '''
+
+      # arrange
+      self.test_user.password = bcrypt.generate_password_hash("password", 5).decode('utf-8')
+      db.session.commit()
+
+      # act
+      user = User.authenticate("johndoelearntocode", "password")
+
+      # assert
+      self.assertEqual(user, self.test_user)
+      self.assertEqual(hash_cost(User.query.get(user.id).password), self.app.config['BCRYPT_LOG_ROUNDS'])
+      self.assertTrue(User.authenticate("johndoelearntocode", "password"))
+
+
+    def test_full_hashing_pool_rejects_fast(self) -> None:
+      '''
+      Test that hashing is rejected right away when every pool slot is taken
+      '''
+
+      # arrange
+      slots = password_hasher._slots
+      taken = 0
+      while slots.acquire(blocking=False):
+        taken += 1
+
+      # act / assert
+      try:
+        self.assertRaises(HashingBusyError, User.authenticate, "johndoelearntocode", "password")
+        self.assertEqual(password_hasher.stats()["rejected"], 1)
+      finally:
+        for _ in range(taken):
+          slots.release()